@@ -2,6 +2,12 @@
 ASGI config for server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with any ASGI server, for example::
+
+    uvicorn server.asgi:application --workers 4
+    daphne server.asgi:application
+
+The async read endpoints under ``/api/async/`` then run on the event loop.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,11 +41,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'sms',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'sms.performance.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,10 +80,104 @@ WSGI_APPLICATION = 'server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
+# The profile is chosen from the environment:
+#
+#   SMS_DB_ENGINE        sqlite (default) or postgresql
+#   SMS_DB_NAME          database name, or the file path for SQLite
+#   SMS_DB_USER, SMS_DB_PASSWORD, SMS_DB_HOST, SMS_DB_PORT
+#   SMS_DB_CONN_MAX_AGE  seconds to keep connections open (default 600);
+#                        0 opens a connection per request
+#   SMS_DB_POOL          PostgreSQL only: "psycopg" for psycopg 3's built-in
+#                        pool (Django 5.1+), "pgbouncer" when connecting
+#                        through PgBouncer in transaction pooling mode
+#   SMS_DB_POOL_MIN_SIZE, SMS_DB_POOL_MAX_SIZE
+#   SMS_SQLITE_WAL       set to 0 to keep SQLite's rollback journal
+
+DB_ENGINE = os.environ.get('SMS_DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('SMS_DB_CONN_MAX_AGE', 600))
+DB_POOL = os.environ.get('SMS_DB_POOL', '')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('SMS_DB_NAME', 'sms'),
+            'USER': os.environ.get('SMS_DB_USER', ''),
+            'PASSWORD': os.environ.get('SMS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('SMS_DB_HOST', ''),
+            'PORT': os.environ.get('SMS_DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if DB_POOL == 'psycopg':
+        if django.VERSION < (5, 1):
+            raise ImproperlyConfigured('SMS_DB_POOL=psycopg requires Django 5.1+.')
+        # The pool owns connection lifetime; Django must not also persist them.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('SMS_DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('SMS_DB_POOL_MAX_SIZE', 20)),
+        }
+    elif DB_POOL == 'pgbouncer':
+        # Server-side cursors do not survive transaction pooling.
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    elif DB_POOL:
+        raise ImproperlyConfigured('Unknown SMS_DB_POOL %r.' % DB_POOL)
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SMS_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds a writer waits for the lock before "database is locked".
+                'timeout': 20,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured('Unknown SMS_DB_ENGINE %r.' % DB_ENGINE)
+
+# Applied to every new SQLite connection (see sms.db). WAL lets readers run
+# concurrently with the single writer; synchronous=NORMAL is durable in WAL.
+SMS_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL' if os.environ.get('SMS_SQLITE_WAL', '1') != '0' else 'DELETE',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+#   SMS_CACHE_BACKEND   locmem (default, per process), file, redis, or the
+#                       dotted path of any cache backend
+#   SMS_CACHE_LOCATION  directory for "file", URL for "redis", or the
+#                       backend's LOCATION
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('SMS_CACHE_BACKEND', 'locmem')
+CACHE_LOCATIONS = {
+    'locmem': 'sms',
+    'file': str(BASE_DIR / '.cache'),
+    'redis': 'redis://127.0.0.1:6379',
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.environ.get(
+            'SMS_CACHE_LOCATION', CACHE_LOCATIONS.get(CACHE_BACKEND, '')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 10000} if CACHE_BACKEND in ('locmem', 'file') else {},
     }
 }
 
@@ -122,3 +222,71 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# REST API
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    # Reading a model takes its view permission, as in the admin.
+    'DEFAULT_PERMISSION_CLASSES': [
+        'sms.permissions.ModelPermissions',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'sms.pagination.InventoryCursorPagination',
+}
+
+
+# Service management admin
+# Render the ServiceSystem change page with collapsed, lazily loaded panels
+# instead of one inline formset per related model.
+
+SMS_ADMIN_LAZY_INLINES = True
+
+# Cache alias and lifetime (seconds) of service system snapshots. Entries are
+# versioned and never served stale, so the timeout only bounds memory use.
+SMS_SNAPSHOT_CACHE = 'default'
+SMS_SNAPSHOT_CACHE_TIMEOUT = 3600
+
+# Seconds between change log reads while a long-poll or event stream waits.
+SMS_CHANGES_POLL_INTERVAL = 1.0
+
+# Keep a denormalized document of every service system, rebuilt on each
+# write, and serve snapshots from it with one row lookup instead of a query
+# per related table. Run rebuild_documents after turning it on.
+SMS_SERVICE_SYSTEM_DOCUMENTS = False
+
+# Change log entries between two history checkpoints of a service system
+# (see the checkpoint_history command); a point-in-time read replays at most
+# this many.
+SMS_HISTORY_CHECKPOINT_EVERY = 200
+
+# Show query count, database and render time of each admin page to staff.
+SMS_PERFORMANCE_PANEL = DEBUG
+
+# Most SQL queries a view may run, by URL name or shell-style pattern of URL
+# names (the first matching pattern applies). Pages over budget are logged to
+# the sms.performance logger, or raise QueryBudgetExceeded when
+# SMS_QUERY_BUDGET_MODE is 'raise', as tests should set it. Only checked for
+# requests served through WSGI.
+SMS_QUERY_BUDGETS = {
+    # Every inline formset when SMS_ADMIN_LAZY_INLINES is off.
+    'admin:sms_servicesystem_change': 30,
+    # A count per related model, and the search, cache and version summary
+    # updates of the deletion.
+    'admin:sms_servicesystem_delete': 60,
+    'admin:*': 12,
+    '*-list': 8,
+    '*-detail': 8,
+}
+SMS_QUERY_BUDGET_MODE = 'log'
+
+# Bearer token that lets a scraper read /api/metrics/ without a staff session.
+SMS_METRICS_TOKEN = os.environ.get('SMS_METRICS_TOKEN')
+
+# Key file encrypting environment variable values at rest (see sms.crypto);
+# values are stored in plaintext when unset. Create one with
+# `manage.py rotate_secret_keys --new-key`.
+SMS_SECRETS_KEY_FILE = os.environ.get('SMS_SECRETS_KEY_FILE')
+# Decrypted values each process keeps in memory, and for how many seconds.
+SMS_SECRETS_CACHE_SIZE = 10000
+SMS_SECRETS_CACHE_TTL = 300
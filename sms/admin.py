@@ -1,16 +1,47 @@
-from django.contrib import admin
-
+import functools
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.utils import label_for_field, lookup_field
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied, ValidationError
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+
+from . import bulk, crypto, network, ports
 from .models import *
+from .search import search
 
 
 class BaseAdmin(admin.ModelAdmin):
     def get_list_display(self, _):
         return self.list_display + ("service_system", "created_at", "updated_at")
 
+    def get_list_select_related(self, request):
+        # Join every foreign key rendered in the changelist so a page costs a
+        # constant number of queries however many rows it shows.
+        related = []
+        for name in self.get_list_display(request):
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.many_to_one:
+                related.append(name)
+        return related
+
 
 @admin.register(EnvironmentVariable)
 class EnvironmentVariableAdmin(BaseAdmin):
-    list_display = ("name", "value")
+    list_display = ("name", "masked_value")
+
+    @admin.display(description="value")
+    def masked_value(self, obj):
+        # Lists never decrypt: the value is shown on the change page only.
+        return crypto.masked(obj.value)
 
 
 @admin.register(ConfigurationFile)
@@ -23,9 +54,31 @@ class DependencyAdmin(BaseAdmin):
     list_display = ("name", "version")
 
 
+class OverlappingSubnetFilter(admin.SimpleListFilter):
+    title = "subnet"
+    parameter_name = "subnet"
+
+    def lookups(self, request, model_admin):
+        return [("overlapping", "Overlaps another subnet")]
+
+    def queryset(self, request, queryset):
+        if self.value() != "overlapping":
+            return queryset
+        return network.overlapping(queryset)
+
+
 @admin.register(NetworkConfiguration)
 class NetworkConfigurationAdmin(BaseAdmin):
     list_display = ("dns", "gateway", "subnet")
+    list_filter = (OverlappingSubnetFilter,)
+    search_fields = ("subnet", "gateway", "dns")
+
+    def get_search_results(self, request, queryset, search_term):
+        # An address or CIDR finds the subnets overlapping it.
+        try:
+            return network.subnets_overlapping(queryset, search_term), False
+        except ValueError:
+            return super().get_search_results(request, queryset, search_term)
 
 
 @admin.register(Application)
@@ -33,9 +86,23 @@ class ApplicationAdmin(BaseAdmin):
     list_display = ("name", "version", "description")
 
 
+class ConflictingPortFilter(admin.SimpleListFilter):
+    title = "port"
+    parameter_name = "port"
+
+    def lookups(self, request, model_admin):
+        return [("conflicting", "Conflicts with another port")]
+
+    def queryset(self, request, queryset):
+        if self.value() != "conflicting":
+            return queryset
+        return ports.conflicting(queryset)
+
+
 @admin.register(Port)
 class PortAdmin(BaseAdmin):
     list_display = ("application", "port_number", "protocol")
+    list_filter = (ConflictingPortFilter,)
 
 
 @admin.register(LoggingConfiguration)
@@ -93,12 +160,33 @@ class RunbookAdmin(BaseAdmin):
     )
 
 
+@admin.register(HealthCheckRun)
+class HealthCheckRunAdmin(admin.ModelAdmin):
+    list_display = ("started_at", "finished_at", "checks", "passed", "failed", "errors")
+
+
+@admin.register(HealthCheckResult)
+class HealthCheckResultAdmin(admin.ModelAdmin):
+    list_display = ("url", "outcome", "status_code", "latency_ms", "message", "run")
+    list_filter = ("outcome",)
+    list_select_related = ("run",)
+    search_fields = ("url",)
+
+
 class BaseAdminInline(admin.StackedInline):
     extra = 1
 
 
+class EnvironmentVariableInlineFormSet(forms.BaseInlineFormSet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Decrypt the values of every form in one batch.
+        crypto.reveal_many([row.value for row in self.get_queryset()])
+
+
 class EnvironmentVariableInline(BaseAdminInline):
     model = EnvironmentVariable
+    formset = EnvironmentVariableInlineFormSet
 
 
 class ConfigurationFileInline(BaseAdminInline):
@@ -117,8 +205,59 @@ class ApplicationInline(BaseAdminInline):
     model = Application
 
 
+class PortInlineFormSet(forms.BaseInlineFormSet):
+    @functools.cached_property
+    def applications(self):
+        # A port belongs to an application of its own service system; offering
+        # the whole fleet's would render thousands of options per form.
+        return Application.objects.filter(service_system=self.instance.pk)
+
+    @functools.cached_property
+    def application_choices(self):
+        field = self.form.base_fields["application"]
+        return [("", field.empty_label)] + [
+            (application.pk, field.label_from_instance(application))
+            for application in self.applications
+        ]
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # Every form offers the same applications: query them once, not per
+        # form.
+        field = form.fields["application"]
+        field.queryset = self.applications
+        field.choices = self.application_choices
+
+    def clean(self):
+        # Each form checks its port against the stored ones; this catches two
+        # new or edited ports of the same submission claiming one key.
+        super().clean()
+        claimed = {}
+        for form in self.forms:
+            data = getattr(form, "cleaned_data", None)
+            if not data or data.get("DELETE") or "port_number" not in data:
+                continue
+            key = (data["port_number"], ports.normalize_protocol(data.get("protocol")))
+            if key in claimed:
+                raise ValidationError(
+                    "%s/%s is claimed by %s and %s."
+                    % (
+                        data.get("protocol"),
+                        key[0],
+                        claimed[key],
+                        data.get("application"),
+                    )
+                )
+            claimed[key] = data.get("application")
+
+
 class PortInline(BaseAdminInline):
     model = Port
+    formset = PortInlineFormSet
+
+    def get_queryset(self, request):
+        # Port.__str__ shows the application's name.
+        return super().get_queryset(request).select_related("application")
 
 
 class LoggingConfigurationInline(BaseAdminInline):
@@ -161,6 +300,49 @@ class RunbookInline(BaseAdminInline):
     model = Runbook
 
 
+class ChangeSetForm(forms.Form):
+    changes = forms.JSONField(
+        widget=forms.Textarea(attrs={"rows": 12, "cols": 80}),
+        help_text='For example {"service_system": {"location": "dc2"}, '
+        '"environment_variables": [{"name": "LOG_LEVEL", "value": "debug"}]}. '
+        "Named rows are updated where they exist and created elsewhere.",
+    )
+
+
+class CloneForm(forms.Form):
+    systems = forms.CharField(
+        widget=forms.Textarea(attrs={"rows": 12, "cols": 80}),
+        help_text="One new service system per line: its name, optionally "
+        "followed by a hostname and an IP address.",
+    )
+
+    def clean_systems(self):
+        systems = []
+        for line in self.cleaned_data["systems"].splitlines():
+            values = line.split()
+            if not values:
+                continue
+            if len(values) > 3:
+                raise ValidationError("Too many values on line %r." % line)
+            systems.append(dict(zip(("name", "hostname", "ip_address"), values)))
+        return systems
+
+
+class DuplicateAddressFilter(admin.SimpleListFilter):
+    title = "IP address"
+    parameter_name = "ip"
+
+    def lookups(self, request, model_admin):
+        return [("duplicate", "Shared with another system")]
+
+    def queryset(self, request, queryset):
+        if self.value() != "duplicate":
+            return queryset
+        return queryset.filter(
+            ip_key__in=network.duplicate_keys(ServiceSystem.objects.all())
+        )
+
+
 @admin.register(ServiceSystem)
 class ServiceSystemAdmin(admin.ModelAdmin):
     list_display = (
@@ -173,6 +355,7 @@ class ServiceSystemAdmin(admin.ModelAdmin):
         "updated_at",
     )
     search_fields = ("name", "location", "hostname", "ip_address", "operating_system")
+    list_filter = (DuplicateAddressFilter,)
     inlines = [
         EnvironmentVariableInline,
         ConfigurationFileInline,
@@ -191,3 +374,216 @@ class ServiceSystemAdmin(admin.ModelAdmin):
         DisasterRecoveryInline,
         RunbookInline,
     ]
+    lazy_inline_per_page = 50
+    actions = ["apply_change_set", "clone_service_system"]
+
+    def get_search_results(self, request, queryset, search_term):
+        # An address or CIDR finds the hosts inside it from the address index
+        # (see sms.network). Anything else is served by the full-text index
+        # (see sms.search), which also covers env var, dependency and
+        # application names and config file paths.
+        if not search_term.strip():
+            return queryset, False
+        try:
+            return network.hosts_in(queryset, search_term), False
+        except ValueError:
+            return search(queryset, search_term), False
+
+    def render_action_form(self, request, queryset, form, action, title):
+        return TemplateResponse(
+            request,
+            "admin/sms/servicesystem/action_form.html",
+            {
+                **self.admin_site.each_context(request),
+                "title": title,
+                "opts": self.model._meta,
+                "form": form,
+                "action": action,
+                "selected": queryset.values_list("pk", flat=True),
+                "count": queryset.count(),
+                "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            },
+        )
+
+    @admin.action(
+        description="Apply a change set to selected service systems",
+        permissions=["change"],
+    )
+    def apply_change_set(self, request, queryset):
+        form = ChangeSetForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            changes = form.cleaned_data["changes"]
+            if isinstance(changes, dict) and not request.user.has_perms(
+                bulk.change_set_permissions(changes)
+            ):
+                raise PermissionDenied
+            try:
+                result = bulk.apply_change_set(queryset, changes)
+            except ValidationError as e:
+                form.add_error("changes", e.messages)
+            else:
+                self.message_user(
+                    request,
+                    "Change set applied: %s."
+                    % (
+                        "; ".join(
+                            "%s %d created, %d updated"
+                            % (name, counts["created"], counts["updated"])
+                            for name, counts in result.items()
+                        )
+                        or "nothing to change"
+                    ),
+                    messages.SUCCESS,
+                )
+                return None
+        return self.render_action_form(
+            request, queryset, form, "apply_change_set", "Apply a change set"
+        )
+
+    @admin.action(
+        description="Clone selected service system",
+        permissions=["add"],
+    )
+    def clone_service_system(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(
+                request, "Select exactly one service system to clone.", messages.ERROR
+            )
+            return None
+        if not request.user.has_perms(bulk.clone_permissions()):
+            raise PermissionDenied
+        form = CloneForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            try:
+                clones = bulk.clone_service_system(
+                    queryset.get(), form.cleaned_data["systems"]
+                )
+            except ValidationError as e:
+                form.add_error("systems", e.messages)
+            else:
+                self.message_user(
+                    request,
+                    "Created %d service system(s)." % len(clones),
+                    messages.SUCCESS,
+                )
+                return None
+        return self.render_action_form(
+            request, queryset, form, "clone_service_system", "Clone a service system"
+        )
+
+    def lazy_inlines_enabled(self):
+        return getattr(settings, "SMS_ADMIN_LAZY_INLINES", False)
+
+    def get_inlines(self, request, obj):
+        # In lazy mode the change page renders collapsed panels instead of
+        # formsets; rows are fetched on demand from `related_view`.
+        if obj is not None and self.lazy_inlines_enabled():
+            return []
+        return super().get_inlines(request, obj)
+
+    def get_deleted_objects(self, objs, request):
+        # Deleting only marks the systems (see sms.purge), so the page lists
+        # them and counts their rows instead of collecting the whole cascade.
+        ids = [obj.pk for obj in objs]
+        model_count = {ServiceSystem._meta.verbose_name_plural: len(ids)}
+        for inline in self.inlines:
+            count = inline.model.all_objects.filter(service_system__in=ids).count()
+            if count:
+                model_count[inline.model._meta.verbose_name_plural] = count
+        return [str(obj) for obj in objs], model_count, set(), []
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path(
+                "<path:object_id>/related/<str:model_name>/",
+                self.admin_site.admin_view(self.related_view),
+                name="%s_%s_related" % info,
+            ),
+        ] + super().get_urls()
+
+    def get_lazy_sections(self, request, obj):
+        sections = []
+        for inline in self.inlines:
+            model = inline.model
+            opts = model._meta
+            model_admin = self.admin_site._registry.get(model)
+            if model_admin is None or not model_admin.has_view_permission(request):
+                continue
+            add_url = None
+            if model_admin.has_add_permission(request):
+                add_url = "%s?service_system=%s" % (
+                    reverse("admin:%s_%s_add" % (opts.app_label, opts.model_name)),
+                    obj.pk,
+                )
+            sections.append(
+                {
+                    "title": opts.verbose_name_plural,
+                    "url": reverse(
+                        "admin:%s_%s_related"
+                        % (self.model._meta.app_label, self.model._meta.model_name),
+                        args=(obj.pk, opts.model_name),
+                    ),
+                    "add_url": add_url,
+                }
+            )
+        return sections
+
+    def render_change_form(
+        self, request, context, add=False, change=False, form_url="", obj=None
+    ):
+        if obj is not None and self.lazy_inlines_enabled():
+            context["lazy_sections"] = self.get_lazy_sections(request, obj)
+        return super().render_change_form(request, context, add, change, form_url, obj)
+
+    def related_view(self, request, object_id, model_name):
+        obj = self.get_object(request, object_id)
+        if obj is None or not self.has_view_permission(request, obj):
+            raise Http404
+        models_by_name = {
+            inline.model._meta.model_name: inline.model for inline in self.inlines
+        }
+        model = models_by_name.get(model_name)
+        if model is None:
+            raise Http404
+        model_admin = self.admin_site._registry[model]
+        if not model_admin.has_view_permission(request):
+            raise PermissionDenied
+
+        opts = model._meta
+        queryset = (
+            model_admin.get_queryset(request)
+            .filter(service_system=obj)
+            .select_related(*model_admin.get_list_select_related(request))
+            .order_by("pk")
+        )
+        columns = [
+            name
+            for name in model_admin.list_display
+            if name not in ("service_system", "created_at", "updated_at")
+        ]
+        page = Paginator(queryset, self.lazy_inline_per_page).get_page(
+            request.GET.get("page")
+        )
+        change_url = "admin:%s_%s_change" % (opts.app_label, opts.model_name)
+        return JsonResponse(
+            {
+                "count": page.paginator.count,
+                "page": page.number,
+                "num_pages": page.paginator.num_pages,
+                "columns": [
+                    str(label_for_field(name, model, model_admin)) for name in columns
+                ],
+                "results": [
+                    {
+                        "id": row.pk,
+                        "url": reverse(change_url, args=(row.pk,)),
+                        "values": [
+                            str(lookup_field(name, row, model_admin)[2])
+                            for name in columns
+                        ],
+                    }
+                    for row in page.object_list
+                ],
+            }
+        )
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SMSConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sms'
+
+    def ready(self):
+        from . import db, signals  # noqa: F401
@@ -0,0 +1,294 @@
+"""
+Async read endpoints for the hot inventory paths (system list, snapshot and
+search) and the change feed (long-poll and server-sent events).
+
+Under ASGI (`uvicorn server.asgi:application`) these run on the event loop and
+only hand the database round trips to a thread, so slow queries do not pin a
+worker per request. They also work under WSGI, where Django runs them
+synchronously, except that the event stream does not wait for changes there
+(see change_stream).
+"""
+
+import asyncio
+import base64
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+
+from . import changes
+from .cache import acached_snapshot
+from .conditional import atable_state, not_modified, set_validators, validators
+from .crypto import reveal_snapshot
+from .exporter import ExportJSONEncoder, Watermark
+from .models import ChangeLogEntry, ServiceSystem
+from .permissions import view_permissions
+from .search import search
+from .serializers import INVENTORY_MODELS, split_param
+from .snapshot import snapshot_queryset
+
+LIST_FIELDS = (
+    "id",
+    "name",
+    "location",
+    "hostname",
+    "ip_address",
+    "operating_system",
+    "updated_at",
+)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Seconds a long-poll may wait for changes, and an event stream may stay open
+# before the client has to reconnect.
+MAX_WAIT = 60
+DEFAULT_STREAM_TIMEOUT = 300
+MAX_STREAM_TIMEOUT = 3600
+KEEPALIVE_INTERVAL = 15
+
+
+def get_user(request):
+    """
+    The session user, or the user named by HTTP Basic credentials.
+    """
+    if request.user.is_authenticated:
+        return request.user
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "basic":
+        return None
+    try:
+        username, _, password = base64.b64decode(credentials).decode().partition(":")
+    except (ValueError, UnicodeDecodeError):
+        return None
+    user = authenticate(request, username=username, password=password)
+    return user if user is not None and user.is_active else None
+
+
+async def authorize(request, models):
+    """
+    None if the request's user may view `models`, else the error response.
+    """
+    user = await sync_to_async(get_user)(request)
+    if user is None:
+        return unauthorized()
+    if not await sync_to_async(user.has_perms)(view_permissions(models)):
+        return HttpResponseForbidden()
+    return None
+
+
+def unauthorized():
+    response = JsonResponse(
+        {"detail": "Authentication credentials were not provided."}, status=401
+    )
+    response["WWW-Authenticate"] = 'Basic realm="api"'
+    return response
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get("page_size", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        size = DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+async def page(queryset, request):
+    """
+    One keyset page in `(updated_at, id)` order, resumed from `?after=`.
+    """
+    etag, last_modified = validators(
+        request.get_full_path(), [await atable_state(queryset)]
+    )
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return set_validators(response, etag, last_modified)
+    after = request.GET.get("after")
+    if after:
+        queryset = queryset.filter(Watermark.parse(after).filter())
+    size = page_size(request)
+    rows = [
+        row
+        async for row in queryset.order_by("updated_at", "id").values(*LIST_FIELDS)[
+            : size + 1
+        ]
+    ]
+    next_after = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_after = str(Watermark(rows[-1]["updated_at"], rows[-1]["id"]))
+    response = JsonResponse(
+        {"next": next_after, "results": rows}, encoder=ExportJSONEncoder
+    )
+    return set_validators(response, etag, last_modified)
+
+
+async def service_system_list(request):
+    error = await authorize(request, [ServiceSystem])
+    if error is not None:
+        return error
+    try:
+        return await page(ServiceSystem.objects.all(), request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+
+async def service_system_search(request):
+    error = await authorize(request, [ServiceSystem])
+    if error is not None:
+        return error
+    query = request.GET.get("q", "")
+    try:
+        return await page(search(ServiceSystem.objects.all(), query), request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+
+async def service_system_snapshot(request, pk):
+    error = await authorize(request, INVENTORY_MODELS.values())
+    if error is not None:
+        return error
+
+    async def load():
+        try:
+            return await snapshot_queryset().aget(pk=pk)
+        except ServiceSystem.DoesNotExist:
+            raise Http404
+
+    entry = await acached_snapshot(pk, load)
+    etag = '"%s.json"' % entry.version
+    last_modified = int(entry.last_modified.timestamp())
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        # Decrypting may load data keys from the database.
+        data = await sync_to_async(reveal_snapshot)(entry.data)
+        response = JsonResponse(data, encoder=ExportJSONEncoder)
+    return set_validators(response, etag, last_modified)
+
+
+def poll_interval():
+    return getattr(settings, "SMS_CHANGES_POLL_INTERVAL", 1.0)
+
+
+def integer(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("%s must be an integer, got %r." % (name, value))
+
+
+def seconds(request, name, default, maximum):
+    try:
+        value = float(request.GET.get(name, default))
+    except ValueError:
+        raise ValueError("%s must be a number of seconds." % name)
+    return max(0.0, min(value, maximum))
+
+
+def feed_params(request):
+    """
+    `(since, service system ids, limit)` of a change feed request. `since`
+    comes from `?since=` or an SSE client's Last-Event-ID and is None when
+    neither is given.
+    """
+    since = request.GET.get("since") or request.headers.get("Last-Event-ID")
+    if since is not None:
+        since = integer(since, "since")
+    service_systems = [
+        integer(pk, "service_system")
+        for pk in split_param(request.GET.get("service_system"))
+    ]
+    limit = integer(request.GET.get("limit", changes.DEFAULT_LIMIT), "limit")
+    return since, service_systems, max(1, min(limit, changes.MAX_LIMIT))
+
+
+async def change_feed(request):
+    """
+    Long-poll the change feed: the entries after `?since=`, waiting up to
+    `?wait=` seconds for the first one. Without `since` the feed starts at
+    the current end, so the first call only returns `last_seq`.
+    """
+    error = await authorize(request, [ChangeLogEntry])
+    if error is not None:
+        return error
+    try:
+        since, service_systems, limit = feed_params(request)
+        wait = seconds(request, "wait", 0, MAX_WAIT)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if since is None:
+        since = await changes.alatest_seq()
+    deadline = time.monotonic() + wait
+    while True:
+        entries = await changes.afetch(since, service_systems, limit)
+        remaining = deadline - time.monotonic()
+        if entries or remaining <= 0:
+            break
+        await asyncio.sleep(min(poll_interval(), remaining))
+    return JsonResponse(
+        {"last_seq": entries[-1]["seq"] if entries else since, "results": entries},
+        encoder=ExportJSONEncoder,
+    )
+
+
+async def change_stream(request):
+    """
+    The change feed as server-sent events, one `change` event per entry with
+    the sequence number as event id. The stream closes after `?timeout=`
+    seconds; EventSource clients reconnect and resume from Last-Event-ID.
+
+    Under WSGI a waiting stream would hold a worker, and the response is
+    buffered until it closes anyway: the stream then sends the entries
+    available and closes at once, and clients poll every `retry` interval.
+    """
+    error = await authorize(request, [ChangeLogEntry])
+    if error is not None:
+        return error
+    try:
+        since, service_systems, limit = feed_params(request)
+        timeout = seconds(
+            request, "timeout", DEFAULT_STREAM_TIMEOUT, MAX_STREAM_TIMEOUT
+        )
+        if not isinstance(request, ASGIRequest):
+            timeout = 0
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if since is None:
+        since = await changes.alatest_seq()
+
+    async def events(since):
+        # The id makes clients resume from here even if no change comes.
+        yield "retry: %d\nid: %d\n\n" % (poll_interval() * 1000, since)
+        deadline = time.monotonic() + timeout
+        keepalive = time.monotonic() + KEEPALIVE_INTERVAL
+        while True:
+            entries = await changes.afetch(since, service_systems, limit)
+            for entry in entries:
+                data = json.dumps(entry, cls=ExportJSONEncoder)
+                yield "id: %s\nevent: change\ndata: %s\n\n" % (entry["seq"], data)
+            if entries:
+                since = entries[-1]["seq"]
+                keepalive = time.monotonic() + KEEPALIVE_INTERVAL
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if len(entries) == limit:
+                continue
+            if not entries and time.monotonic() >= keepalive:
+                yield ": keepalive\n\n"
+                keepalive = time.monotonic() + KEEPALIVE_INTERVAL
+            await asyncio.sleep(min(poll_interval(), remaining))
+
+    response = StreamingHttpResponse(events(since), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Keep nginx from buffering the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,328 @@
+"""
+Fleet-wide edits: apply one change set to many service systems, or clone one
+service system's full configuration onto new ones.
+
+Both run in a single transaction with a fixed number of queries per related
+model (not per host or per row), and report what they wrote through the
+`bulk_saved` signal so search documents, snapshot caches and the change log
+follow.
+
+A change set names the values to set on the service systems themselves and
+the named rows (matched on `name` within each system) to create or update:
+
+    {
+        "service_system": {"location": "dc2"},
+        "environment_variables": [{"name": "LOG_LEVEL", "value": "debug"}],
+        "dependencies": [{"name": "openssl", "version": "3.0.13"}]
+    }
+"""
+
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import crypto
+from .models import *
+from .serializers import INVENTORY_MODELS
+from .signals import bulk_saved
+
+# Columns maintained by Django, or identifying the row, that a change set or
+# clone may not set.
+READ_ONLY_FIELDS = ("id", "created_at", "updated_at", "service_system")
+# Related models a change set can address: rows identified by their name.
+CHANGE_SET_MODELS = {
+    name: model
+    for name, model in INVENTORY_MODELS.items()
+    if issubclass(model, NamedModel)
+}
+# Primary keys per UPDATE ... WHERE id IN (...), well under every backend's
+# parameter limit.
+UPDATE_CHUNK_SIZE = 1000
+
+
+def editable_fields(model):
+    return {
+        field.name: field
+        for field in model._meta.concrete_fields
+        if field.name not in READ_ONLY_FIELDS
+        and field.editable
+        and not field.many_to_one
+    }
+
+
+def clean_values(model, values, exclude=()):
+    """
+    Validate field `values` for `model` without touching the database.
+    """
+    if not isinstance(values, dict):
+        raise ValidationError("Expected an object of field values.")
+    fields = editable_fields(model)
+    unknown = (set(values) - set(fields)) | (set(values) & set(exclude))
+    if unknown:
+        raise ValidationError("Unknown field(s): %s." % ", ".join(sorted(unknown)))
+    instance = model(**values)
+    instance.full_clean(
+        exclude=[
+            field.name for field in model._meta.fields if field.name not in values
+        ],
+        validate_unique=False,
+        validate_constraints=False,
+    )
+    return {name: getattr(instance, name) for name in values}
+
+
+def missing_fields(model, values):
+    """
+    Fields a new row needs but `values` does not provide.
+    """
+    return sorted(
+        name
+        for name, field in editable_fields(model).items()
+        if name not in values and not field.blank and not field.has_default()
+    )
+
+
+def parse_change_set(change_set):
+    """
+    Validate a change set, returning `(service system values, [(model, rows)])`.
+    """
+    if not isinstance(change_set, dict):
+        raise ValidationError("A change set must be an object.")
+    unknown = set(change_set) - {"service_system"} - set(CHANGE_SET_MODELS)
+    if unknown:
+        raise ValidationError("Unknown relation(s): %s." % ", ".join(sorted(unknown)))
+    errors = {}
+    system_values = {}
+    try:
+        # Names are unique, so they cannot be set on many systems at once.
+        system_values = clean_values(
+            ServiceSystem, change_set.get("service_system", {}), exclude=["name"]
+        )
+        system_values.update(ServiceSystem.derived_values(system_values))
+    except ValidationError as e:
+        errors["service_system"] = e.messages
+    related = []
+    for name, model in CHANGE_SET_MODELS.items():
+        if name not in change_set:
+            continue
+        rows = change_set[name]
+        if not isinstance(rows, list):
+            errors[name] = ["Expected a list of rows."]
+            continue
+        cleaned = {}
+        for index, values in enumerate(rows):
+            try:
+                values = clean_values(model, values)
+                if not values.get("name"):
+                    raise ValidationError("Each row needs a name.")
+            except ValidationError as e:
+                errors["%s[%d]" % (name, index)] = e.messages
+                continue
+            # The last row for a name wins.
+            cleaned[values["name"]] = values
+        related.append((model, list(cleaned.values())))
+    if errors:
+        raise ValidationError(errors)
+    return system_values, related
+
+
+def chunks(items, size=UPDATE_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def apply_change_set(service_systems, change_set):
+    """
+    Apply `change_set` to every system of the `service_systems` queryset in
+    one transaction. Returns `{relation: {"created": n, "updated": n}}`;
+    rows already holding the requested values are left untouched.
+    """
+    system_values, related = parse_change_set(change_set)
+    result = {}
+    with transaction.atomic():
+        ids = list(service_systems.order_by("pk").values_list("pk", flat=True))
+        now = timezone.now()
+
+        if system_values:
+            changed = list(
+                ServiceSystem.objects.filter(pk__in=ids)
+                .exclude(**system_values)
+                .values_list("pk", flat=True)
+            )
+            for pks in chunks(changed):
+                ServiceSystem.objects.filter(pk__in=pks).update(
+                    updated_at=now, **system_values
+                )
+            bulk_saved.send(
+                sender=ServiceSystem,
+                instances=[ServiceSystem(pk=pk, **system_values) for pk in changed],
+                created=False,
+                fields=list(system_values),
+            )
+            result["service_system"] = {"created": 0, "updated": len(changed)}
+
+        for model, rows in related:
+            fields = sorted({name for values in rows for name in values} - {"name"})
+            existing = {
+                (row["service_system"], row["name"]): row
+                for row in model.objects.filter(
+                    service_system__in=ids, name__in=[values["name"] for values in rows]
+                ).values("pk", "service_system", "name", *fields)
+            }
+            # Secret values are compared decrypted: all at once, here.
+            crypto.reveal_rows(model, existing.values())
+            to_create = []
+            updated = []
+            incomplete = {}
+            for values in rows:
+                missing = missing_fields(model, values)
+                to_update = []
+                for service_system in ids:
+                    row = existing.get((service_system, values["name"]))
+                    if row is None and missing:
+                        incomplete[values["name"]] = missing
+                    elif row is None:
+                        to_create.append(
+                            model(service_system_id=service_system, **values)
+                        )
+                    elif any(
+                        not crypto.same(row[name], value)
+                        for name, value in values.items()
+                    ):
+                        # The instance holds every field in `fields` for the
+                        # bulk_saved receivers, changed by this name or not.
+                        current = {name: row[name] for name in fields}
+                        to_update.append(
+                            model(
+                                pk=row["pk"],
+                                service_system_id=service_system,
+                                **{**current, **values},
+                            )
+                        )
+                # Every row updated for a name gets the same values, so one
+                # UPDATE covers them all instead of a CASE per row.
+                for instances in chunks(to_update):
+                    model.objects.filter(
+                        pk__in=[instance.pk for instance in instances]
+                    ).update(updated_at=now, **values)
+                updated += to_update
+            if incomplete:
+                raise ValidationError(
+                    {
+                        model_name(model): [
+                            "%r is missing on some service systems; creating it "
+                            "needs %s." % (name, ", ".join(missing))
+                            for name, missing in incomplete.items()
+                        ]
+                    }
+                )
+            model.objects.bulk_create(to_create)
+            bulk_saved.send(sender=model, instances=to_create, created=True)
+            bulk_saved.send(
+                sender=model, instances=updated, created=False, fields=fields
+            )
+            result[model_name(model)] = {
+                "created": len(to_create),
+                "updated": len(updated),
+            }
+    return result
+
+
+def model_name(model):
+    return next(name for name, other in INVENTORY_MODELS.items() if other is model)
+
+
+def copy_values(instance):
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.name not in READ_ONLY_FIELDS
+    }
+
+
+def clone_service_system(source, systems):
+    """
+    Copy `source` and every row related to it onto new service systems, one
+    per dict of field overrides in `systems` (each with at least a new
+    `name`). Reads each related table once and writes it with one batched
+    insert, however many clones are made. Returns the new systems.
+    """
+    errors = {}
+    clones = []
+    for index, overrides in enumerate(systems):
+        try:
+            overrides = clean_values(ServiceSystem, overrides)
+            if not overrides.get("name"):
+                raise ValidationError("Each clone needs a name.")
+        except ValidationError as e:
+            errors["systems[%d]" % index] = e.messages
+            continue
+        clone = ServiceSystem(**{**copy_values(source), **overrides})
+        clone.refresh_derived()
+        clones.append(clone)
+    names = Counter(clone.name for clone in clones)
+    taken = set(
+        ServiceSystem.objects.filter(name__in=names).values_list("name", flat=True)
+    )
+    taken.update(name for name, count in names.items() if count > 1)
+    if taken:
+        errors["name"] = [
+            "Service system names already in use: %s." % ", ".join(sorted(taken))
+        ]
+    if errors:
+        raise ValidationError(errors)
+
+    with transaction.atomic():
+        ServiceSystem.objects.bulk_create(clones)
+        bulk_saved.send(sender=ServiceSystem, instances=clones, created=True)
+        # (clone id, source application id) -> cloned application id
+        applications = {}
+        for name, model in INVENTORY_MODELS.items():
+            if model is ServiceSystem:
+                continue
+            rows = list(model.objects.filter(service_system=source).order_by("pk"))
+            if not rows:
+                continue
+            copies = []
+            origins = []
+            for clone in clones:
+                for row in rows:
+                    copy = model(service_system_id=clone.pk, **copy_values(row))
+                    if model is Port:
+                        copy.application_id = applications.get(
+                            (clone.pk, row.application_id), row.application_id
+                        )
+                    copies.append(copy)
+                    origins.append((clone.pk, row.pk))
+            model.objects.bulk_create(copies)
+            if model is Application:
+                applications = {
+                    origin: copy.pk for origin, copy in zip(origins, copies)
+                }
+            bulk_saved.send(sender=model, instances=copies, created=True)
+    return clones
+
+
+def change_set_permissions(change_set):
+    """
+    Permissions needed to apply `change_set`: change on service systems if it
+    sets their fields, add and change on every related model it names.
+    """
+    permissions = set()
+    if change_set.get("service_system"):
+        permissions.add("sms.change_servicesystem")
+    for name, model in CHANGE_SET_MODELS.items():
+        if name in change_set:
+            permissions.update(
+                "sms.%s_%s" % (action, model._meta.model_name)
+                for action in ("add", "change")
+            )
+    return permissions
+
+
+def clone_permissions():
+    return {
+        "sms.add_%s" % model._meta.model_name for model in INVENTORY_MODELS.values()
+    }
@@ -0,0 +1,148 @@
+"""
+Versioned read cache for service system snapshots.
+
+Entries are keyed by `(service system id, version)`. Writes never delete
+entries; they move the system to a new version once the transaction commits
+(see `sms.signals`), so a reader either finds an entry built after the last
+committed change or misses. Stale entries become unreachable and age out.
+
+Versions are nanosecond timestamps rather than counters, so a version key
+that was evicted is recreated with a value no old entry was stored under.
+"""
+
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import documents
+from .snapshot import build_snapshot, snapshot_etag
+
+SnapshotEntry = namedtuple("SnapshotEntry", "data version last_modified")
+
+HITS_KEY = "sms:snapshot:hits"
+MISSES_KEY = "sms:snapshot:misses"
+
+
+def get_cache():
+    return caches[getattr(settings, "SMS_SNAPSHOT_CACHE", "default")]
+
+
+def timeout():
+    return getattr(settings, "SMS_SNAPSHOT_CACHE_TIMEOUT", 3600)
+
+
+def version_key(pk):
+    return "sms:snapshot:version:%s" % pk
+
+
+def entry_key(pk, version):
+    return "sms:snapshot:%s:%s" % (pk, version)
+
+
+def new_version():
+    return time.time_ns()
+
+
+def snapshot_version(pk):
+    cache = get_cache()
+    version = cache.get(version_key(pk))
+    if version is None:
+        cache.add(version_key(pk), new_version(), None)
+        version = cache.get(version_key(pk))
+    return version
+
+
+def bump_versions(ids):
+    if ids:
+        version = new_version()
+        get_cache().set_many({version_key(pk): version for pk in ids}, None)
+
+
+def count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Missing counter: create it, tolerating a concurrent creator.
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_snapshot(pk, version):
+    entry = get_cache().get(entry_key(pk, version))
+    count(HITS_KEY if entry is not None else MISSES_KEY)
+    return entry
+
+
+def set_snapshot(pk, version, entry):
+    get_cache().set(entry_key(pk, version), entry, timeout())
+
+
+def stored_entry(pk):
+    """
+    The entry of service system `pk` from its stored document, if documents
+    are kept and it has one.
+    """
+    if documents.enabled():
+        document = documents.load(pk)
+        if document is not None:
+            return SnapshotEntry(*document)
+    return None
+
+
+def cached_snapshot(pk, load):
+    """
+    The snapshot entry of service system `pk`. On a miss it comes from the
+    stored document, or `load()` is called for the prefetched ServiceSystem.
+    """
+    version = snapshot_version(pk)
+    entry = get_snapshot(pk, version)
+    if entry is None:
+        entry = stored_entry(pk) or build_entry(load())
+        set_snapshot(pk, version, entry)
+    return entry
+
+
+async def acached_snapshot(pk, aload):
+    """
+    Async `cached_snapshot()`; `aload()` is awaited on a miss.
+    """
+
+    def lookup():
+        version = snapshot_version(pk)
+        entry = get_snapshot(pk, version)
+        if entry is None:
+            entry = stored_entry(pk)
+            if entry is not None:
+                set_snapshot(pk, version, entry)
+        return version, entry
+
+    version, entry = await sync_to_async(lookup)()
+    if entry is None:
+        entry = build_entry(await aload())
+        await sync_to_async(set_snapshot)(pk, version, entry)
+    return entry
+
+
+def build_entry(service_system):
+    return SnapshotEntry(build_snapshot(service_system), *snapshot_etag(service_system))
+
+
+def stats():
+    cache = get_cache()
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,79 @@
+"""
+Parsing of the free-form capacity columns of ServiceSystem into numbers.
+
+`cpu_allocation` becomes a core count ("4", "8 vCPU", "2x8" -> 16) and
+`ram_allocation`/`disk_allocation` become bytes ("16GB", "512 MiB", "1.5T").
+Size units are binary whatever their spelling (1 GB = 1024**3 bytes), and a
+bare number is read as GiB, the unit these columns have historically been
+filled in with. Values that cannot be parsed, have anything left over after
+the unit, or do not fit their column become None.
+"""
+
+import re
+from decimal import ROUND_CEILING, Decimal
+
+# A number, with optional thousands separators ("1,024") and decimals.
+NUMBER = r"(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)"
+CORES_RE = re.compile(
+    NUMBER + r"(?:\s*[x×*]\s*" + NUMBER + r")?\s*(?:v?cpus?|v?cores?|threads?)?"
+)
+BYTES_RE = re.compile(
+    NUMBER + r"\s*(?:([kmgtpe])(?:i|ilo|ega|iga|era|eta|xa)?)?(b|bytes?)?"
+)
+PREFIXES = "kmgtpe"
+DEFAULT_SIZE_UNIT = 1024**3
+# Largest values of the columns they are stored in: PositiveIntegerField and
+# PositiveBigIntegerField.
+MAX_CORES = 2**31 - 1
+MAX_BYTES = 2**63 - 1
+
+
+def number(text):
+    return Decimal(text.replace(",", ""))
+
+
+def in_range(value, maximum):
+    value = int(value.to_integral_value(ROUND_CEILING))
+    return value if value <= maximum else None
+
+
+def parse_cores(value):
+    match = CORES_RE.fullmatch((value or "").strip().lower())
+    if match is None:
+        return None
+    count, multiplier = match.groups()
+    # Fractional allocations (0.5 vCPU) still occupy a core.
+    return in_range(number(count) * number(multiplier or "1"), MAX_CORES)
+
+
+def parse_bytes(value):
+    match = BYTES_RE.fullmatch((value or "").strip().lower())
+    if match is None:
+        return None
+    size, prefix, unit = match.groups()
+    if prefix:
+        multiplier = 1024 ** (PREFIXES.index(prefix) + 1)
+    elif unit:
+        multiplier = 1
+    else:
+        multiplier = DEFAULT_SIZE_UNIT
+    return in_range(number(size) * multiplier, MAX_BYTES)
+
+
+# Source column -> (numeric column, parser)
+CAPACITY_FIELDS = {
+    "cpu_allocation": ("cpu_cores", parse_cores),
+    "ram_allocation": ("ram_bytes", parse_bytes),
+    "disk_allocation": ("disk_bytes", parse_bytes),
+}
+
+
+def capacity_values(values):
+    """
+    Numeric columns for the capacity source columns present in `values`.
+    """
+    return {
+        column: parse(values[source])
+        for source, (column, parse) in CAPACITY_FIELDS.items()
+        if source in values
+    }
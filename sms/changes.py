@@ -0,0 +1,81 @@
+"""
+Append-only change feed of inventory writes.
+
+Every create, update and delete of a ServiceSystem or one of its related rows
+is recorded as a ChangeLogEntry in the same transaction as the write (see
+`sms.signals`). Readers follow the feed by sequence number: "everything after
+seq N", optionally for some service systems only, is one range scan on the
+primary key or on the `(service_system_id, id)` index.
+
+Sequence numbers must become visible in order, or a reader could move past
+an entry whose transaction has not committed yet. SQLite serializes writers,
+so this holds there; on PostgreSQL writers take a transaction-level advisory
+lock before appending, which orders their commits by sequence number.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+
+from .models import ChangeLogEntry
+from .serializers import INVENTORY_MODELS
+
+MODEL_NAMES = {model: name for name, model in INVENTORY_MODELS.items()}
+# pg_advisory_xact_lock() key serializing appends to the change log.
+APPEND_LOCK = 0x736D73
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+
+
+def record(model, changes):
+    """
+    Append `(object id, service system id, operation, delta, patches)`
+    changes of `model`.
+    """
+    if not changes:
+        return
+    connection = connections[router.db_for_write(ChangeLogEntry)]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [APPEND_LOCK])
+    ChangeLogEntry.objects.bulk_create(
+        [
+            ChangeLogEntry(
+                model=MODEL_NAMES[model],
+                object_id=object_id,
+                service_system_id=service_system_id,
+                operation=operation,
+                delta=delta,
+                patches=patches,
+            )
+            for object_id, service_system_id, operation, delta, patches in changes
+        ]
+    )
+
+
+def latest_seq():
+    entry = ChangeLogEntry.objects.order_by("-pk").values_list("pk", flat=True)
+    return entry.first() or 0
+
+
+def fetch(since, service_system_ids=None, limit=DEFAULT_LIMIT):
+    """
+    Up to `limit` entries after sequence number `since`, oldest first.
+    """
+    queryset = ChangeLogEntry.objects.filter(pk__gt=since)
+    if service_system_ids:
+        queryset = queryset.filter(service_system_id__in=service_system_ids)
+    return [
+        {
+            "seq": entry.pk,
+            "model": entry.model,
+            "pk": entry.object_id,
+            "service_system_id": entry.service_system_id,
+            "operation": entry.operation,
+            "created_at": entry.created_at,
+        }
+        for entry in queryset.order_by("pk")[:limit]
+    ]
+
+
+alatest_seq = sync_to_async(latest_seq)
+afetch = sync_to_async(fetch)
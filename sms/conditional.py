@@ -0,0 +1,67 @@
+"""
+Conditional GET (ETag / Last-Modified) for inventory reads.
+
+A response is validated by the newest `updated_at` and the row count of each
+table it is built from. Both come from one aggregate query per table, which
+is far cheaper than loading and serializing the rows: saving a row moves the
+newest timestamp and creating or deleting one changes the count.
+
+The ETag also covers the request path and query string and the response
+format, so every page, filter and field selection has its own tag. Deleting
+the newest row can move Last-Modified backwards, which `If-Modified-Since`
+cannot detect; clients should prefer `If-None-Match`.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+STATE = {"latest": Max("updated_at"), "count": Count("pk")}
+
+
+def table_state(queryset):
+    """
+    `(newest updated_at, row count)` of `queryset`.
+    """
+    state = queryset.aggregate(**STATE)
+    return state["latest"], state["count"]
+
+
+async def atable_state(queryset):
+    state = await queryset.aaggregate(**STATE)
+    return state["latest"], state["count"]
+
+
+def validators(key, states):
+    """
+    ETag and Last-Modified (a timestamp, or None when every table is empty)
+    for a response identified by `key` and built from tables in `states`.
+    """
+    latest = max((latest for latest, _ in states if latest is not None), default=None)
+    digest = hashlib.sha1(
+        "|".join(
+            [key]
+            + [
+                "%s:%s" % (latest.isoformat() if latest else "", count)
+                for latest, count in states
+            ]
+        ).encode()
+    ).hexdigest()
+    return '"%s"' % digest, int(latest.timestamp()) if latest else None
+
+
+def not_modified(request, etag, last_modified):
+    """
+    A 304 (or 412) response if the request's preconditions say the client's
+    copy is current, else None.
+    """
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
@@ -0,0 +1,583 @@
+"""
+Encryption at rest of secret values (environment variable values).
+
+Envelope encryption: values are encrypted with AES-GCM under a data key, a
+random key stored in the DataKey table, itself encrypted ("wrapped") under a
+key-encryption key from the local key file named by SMS_SECRETS_KEY_FILE:
+
+    {"current": "<key id>", "keys": {"<key id>": "<base64 of 32 bytes>", ...}}
+
+Rotating the key-encryption key only rewraps the few data keys; values are
+re-encrypted only when a new data key is started (see `rotate_secret_keys`).
+
+A stored value is a token, `sms:v1:<data key id>:<base64 nonce+ciphertext>`,
+read back as a `Sealed` string that is not decrypted until something asks
+for its plaintext. Only Sealed values are ever decrypted: a plain string is
+plaintext whatever it looks like, and is encrypted as such on save, so a
+token copied into a value cannot be used to read another secret. Stored
+text that only looks like a token, or any text when encryption is off, is
+plaintext too. `reveal_many()` decrypts a batch at once with one query
+for the data keys it needs. Plaintexts are kept in a bounded, expiring
+in-process cache (SMS_SECRETS_CACHE_SIZE, SMS_SECRETS_CACHE_TTL), never in
+shared caches, history or stored documents, which hold the tokens.
+
+Without a key file, values are stored in plaintext. Encrypting or decrypting
+needs the optional `cryptography` package.
+"""
+
+import base64
+import binascii
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+    class InvalidTag(Exception):
+        # Never raised: nothing is decrypted without the package (see aead()).
+        pass
+
+
+PREFIX = "sms:v1:"
+NONCE_SIZE = 12
+TAG_SIZE = 16
+KEY_SIZE = 32
+TOKEN_RE = re.compile(r"sms:v1:([0-9]+):([A-Za-z0-9+/]+={0,2})\Z")
+# Authenticated with every wrapped data key, so a value ciphertext cannot be
+# passed off as one.
+WRAP_CONTEXT = b"sms data key"
+# Seconds a process keeps using the data key it found to be the newest.
+CURRENT_KEY_TTL = 60
+MASK = "•" * 8
+
+
+class Sealed(str):
+    """
+    An encrypted value as stored: the token, not the plaintext.
+    """
+
+    def __repr__(self):
+        return "<Sealed %s%s:>" % (PREFIX, self.data_key_id)
+
+    @property
+    def data_key_id(self):
+        return int(TOKEN_RE.match(self).group(1))
+
+    @property
+    def ciphertext(self):
+        return base64.b64decode(TOKEN_RE.match(self).group(2))
+
+    def reveal(self):
+        return reveal_many([self])[0]
+
+
+def load(text):
+    """
+    `text` read from storage: a Sealed token if it is a well-formed one and
+    encryption is on, else the text itself.
+    """
+    if not (isinstance(text, str) and text.startswith(PREFIX) and enabled()):
+        return text
+    match = TOKEN_RE.match(text)
+    if match is None:
+        return text
+    try:
+        data = base64.b64decode(match.group(2), validate=True)
+    except binascii.Error:
+        return text
+    if len(data) < NONCE_SIZE + TAG_SIZE:
+        return text
+    return Sealed(text)
+
+
+def is_token(value):
+    return isinstance(value, Sealed)
+
+
+def masked(value):
+    """
+    What lists show for a secret value, whether it is encrypted or not.
+    """
+    if value in (None, ""):
+        return ""
+    return MASK if is_token(value) else MASK + " (not encrypted)"
+
+
+def enabled():
+    return bool(getattr(settings, "SMS_SECRETS_KEY_FILE", None))
+
+
+def aead(key):
+    if AESGCM is None:
+        raise ImproperlyConfigured(
+            "Encrypted values need the cryptography package (pip install "
+            "cryptography)."
+        )
+    return AESGCM(key)
+
+
+def encrypt(cipher, data, associated_data=None):
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + cipher.encrypt(nonce, data, associated_data)
+
+
+def decrypt(cipher, data, associated_data=None):
+    return cipher.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], associated_data)
+
+
+class KeyRing:
+    """
+    The key-encryption keys of the key file, reloaded when it changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = None
+        self.current = None
+        self.keys = {}
+
+    def path(self):
+        path = getattr(settings, "SMS_SECRETS_KEY_FILE", None)
+        if not path:
+            raise ImproperlyConfigured(
+                "Set SMS_SECRETS_KEY_FILE to encrypt or decrypt values."
+            )
+        return str(path)
+
+    def load(self):
+        path = self.path()
+        try:
+            stamp = (path, os.stat(path).st_mtime_ns)
+        except OSError as e:
+            raise ImproperlyConfigured("Cannot read the key file %s: %s" % (path, e))
+        with self.lock:
+            if stamp != self.loaded:
+                with open(path) as f:
+                    content = json.load(f)
+                self.keys = {
+                    key_id: aead(base64.b64decode(key))
+                    for key_id, key in content["keys"].items()
+                }
+                self.current = content["current"]
+                if self.current not in self.keys:
+                    raise ImproperlyConfigured(
+                        "The current key %r is not in %s." % (self.current, path)
+                    )
+                self.loaded = stamp
+        return self
+
+    def get(self, key_id):
+        keys = self.load().keys
+        if key_id not in keys:
+            raise ImproperlyConfigured(
+                "Key %r is not in the key file %s." % (key_id, self.path())
+            )
+        return keys[key_id]
+
+
+def add_key(path):
+    """
+    Add a new random key-encryption key to the key file at `path` (created
+    if needed, readable by its owner only) and make it current. Returns its
+    id.
+    """
+    content = {"current": None, "keys": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            content = json.load(f)
+    key_id = time.strftime("%Y%m%d%H%M%S")
+    while key_id in content["keys"]:
+        key_id += "a"
+    content["keys"][key_id] = base64.b64encode(os.urandom(KEY_SIZE)).decode()
+    content["current"] = key_id
+    temporary = "%s.tmp" % path
+    descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "w") as f:
+        json.dump(content, f, indent=2)
+    os.replace(temporary, path)
+    return key_id
+
+
+class PlaintextCache:
+    """
+    Bounded LRU of plaintexts by token, each kept for `ttl` seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def limits(self):
+        return (
+            getattr(settings, "SMS_SECRETS_CACHE_SIZE", 10000),
+            getattr(settings, "SMS_SECRETS_CACHE_TTL", 300),
+        )
+
+    def get_many(self, tokens):
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for token in tokens:
+                entry = self.entries.get(token)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self.entries[token]
+                    continue
+                self.entries.move_to_end(token)
+                found[token] = entry[1]
+        return found
+
+    def set_many(self, plaintexts):
+        size, ttl = self.limits()
+        if not size or not ttl:
+            return
+        expires = time.monotonic() + ttl
+        with self.lock:
+            for token, plaintext in plaintexts.items():
+                self.entries[token] = (expires, plaintext)
+                self.entries.move_to_end(token)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+KEY_RING = KeyRing()
+PLAINTEXTS = PlaintextCache()
+# Unwrapped data keys by id, and the newest one with when it was looked up.
+_data_keys = {}
+_current = (None, 0.0)
+_data_keys_lock = threading.Lock()
+
+
+def unwrap(data_key):
+    return aead(
+        decrypt(KEY_RING.get(data_key.key_id), bytes(data_key.wrapped), WRAP_CONTEXT)
+    )
+
+
+def wrap(key):
+    ring = KEY_RING.load()
+    return ring.current, encrypt(ring.keys[ring.current], key, WRAP_CONTEXT)
+
+
+def data_keys(ids):
+    """
+    Ciphers of the existing data keys among `ids`, loading the missing ones
+    in one query.
+    """
+    from .models import DataKey
+
+    missing = set(ids) - set(_data_keys)
+    if missing:
+        loaded = {
+            data_key.pk: unwrap(data_key)
+            for data_key in DataKey.objects.filter(pk__in=missing)
+        }
+        with _data_keys_lock:
+            _data_keys.update(loaded)
+    return {pk: _data_keys[pk] for pk in ids if pk in _data_keys}
+
+
+def new_data_key():
+    """
+    Start a new data key: values are encrypted under it from now on.
+    """
+    global _current
+    from .models import DataKey
+
+    key = os.urandom(KEY_SIZE)
+    key_id, wrapped = wrap(key)
+    data_key = DataKey.objects.create(key_id=key_id, wrapped=wrapped)
+    with _data_keys_lock:
+        _data_keys[data_key.pk] = aead(key)
+        _current = (data_key.pk, time.monotonic() + CURRENT_KEY_TTL)
+    return data_key
+
+
+def current_data_key():
+    """
+    `(id, cipher)` of the newest data key, started if there is none.
+    """
+    global _current
+    from .models import DataKey
+
+    pk, expires = _current
+    if pk is None or expires < time.monotonic():
+        pk = DataKey.objects.order_by("-pk").values_list("pk", flat=True).first()
+        if pk is None:
+            pk = new_data_key().pk
+        _current = (pk, time.monotonic() + CURRENT_KEY_TTL)
+    return pk, data_keys([pk])[pk]
+
+
+def seal(plaintext):
+    """
+    Encrypt `plaintext` under the current data key.
+    """
+    pk, cipher = current_data_key()
+    token = Sealed(
+        "%s%d:%s"
+        % (
+            PREFIX,
+            pk,
+            base64.b64encode(encrypt(cipher, plaintext.encode())).decode(),
+        )
+    )
+    PLAINTEXTS.set_many({token: plaintext})
+    return token
+
+
+def reveal_many(values):
+    """
+    Plaintexts of `values`, tokens or plaintext, decrypting every token not
+    in the cache in one batch.
+    """
+    tokens = {value for value in values if is_token(value)}
+    plaintexts = PLAINTEXTS.get_many(tokens)
+    missing = tokens - set(plaintexts)
+    if missing:
+        ciphers = data_keys({token.data_key_id for token in missing})
+        decrypted = {}
+        for token in missing:
+            # Text without a data key or that fails authentication was not
+            # encrypted by us: stored before encryption was turned on, it
+            # only happens to look like a token.
+            decrypted[token] = str(token)
+            cipher = ciphers.get(token.data_key_id)
+            if cipher is None:
+                continue
+            try:
+                decrypted[token] = decrypt(cipher, token.ciphertext).decode()
+            except InvalidTag:
+                pass
+        PLAINTEXTS.set_many(decrypted)
+        plaintexts.update(decrypted)
+    return [plaintexts.get(value, value) for value in values]
+
+
+def reveal(value):
+    return reveal_many([value])[0]
+
+
+def same(a, b):
+    """
+    Whether two values, tokens or plaintext, hold the same plaintext.
+    """
+    if a == b:
+        return True
+    if is_token(a) or is_token(b):
+        a, b = reveal_many([a, b])
+        return a == b
+    return False
+
+
+def load_rows(model, rows):
+    """
+    Copies of `rows` (dicts by field name, e.g. read back from JSON) with
+    the secret fields of `model` loaded as tokens.
+    """
+    names = sealed_fields(model)
+    rows = [dict(row) for row in rows]
+    for row in rows:
+        for name in names:
+            if name in row:
+                row[name] = load(row[name])
+    return rows
+
+
+def sealed_fields(model):
+    from .models import EncryptedTextField
+
+    return [
+        field.name
+        for field in model._meta.concrete_fields
+        if isinstance(field, EncryptedTextField)
+    ]
+
+
+def reveal_rows(model, rows):
+    """
+    Copies of `rows` (dicts by field name) with the secret fields of `model`
+    decrypted in one batch.
+    """
+    names = sealed_fields(model)
+    rows = load_rows(model, rows)
+    if names:
+        cells = [(row, name) for row in rows for name in names if name in row]
+        plaintexts = reveal_many([row[name] for row, name in cells])
+        for (row, name), plaintext in zip(cells, plaintexts):
+            row[name] = plaintext
+    return rows
+
+
+def reveal_snapshot(data):
+    """
+    A snapshot document (see sms.snapshot) with its secrets decrypted.
+    """
+    from .serializers import INVENTORY_MODELS
+
+    data = dict(data)
+    for name, model in INVENTORY_MODELS.items():
+        if name in data and sealed_fields(model):
+            data[name] = reveal_rows(model, data[name])
+    return data
+
+
+def rewrap_data_keys():
+    """
+    Wrap every data key under the current key-encryption key, so the others
+    can be dropped from the key file. Returns the number rewrapped.
+    """
+    from .models import DataKey
+
+    ring = KEY_RING.load()
+    data_keys = list(DataKey.objects.exclude(key_id=ring.current))
+    for data_key in data_keys:
+        key = decrypt(ring.get(data_key.key_id), bytes(data_key.wrapped), WRAP_CONTEXT)
+        data_key.key_id, data_key.wrapped = wrap(key)
+    DataKey.objects.bulk_update(data_keys, ["key_id", "wrapped"])
+    return len(data_keys)
+
+
+def stale(value, data_key_id):
+    """
+    Whether `value` is plaintext, or encrypted under another data key.
+    """
+    if not value:
+        return False
+    return (
+        not is_token(value)
+        or value.data_key_id != data_key_id
+        # Plaintext that only looks like a token decrypts to itself.
+        or reveal(value) == value
+    )
+
+
+def reencrypt_rows(model, batch_size):
+    """
+    Encrypt the secret values of `model` under the current data key, those
+    in plaintext included. Returns the number of rows rewritten.
+    """
+    from django.db import transaction
+
+    from .signals import bulk_saved
+
+    names = sealed_fields(model)
+    data_key_id = current_data_key()[0]
+    queryset = model._base_manager.order_by("pk")
+    count = 0
+    last = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last)[:batch_size])
+        if not rows:
+            return count
+        last = rows[-1].pk
+        reveal_many([getattr(row, name) for row in rows for name in names])
+        rows = [
+            row
+            for row in rows
+            if any(stale(getattr(row, name), data_key_id) for name in names)
+        ]
+        for row in rows:
+            for name in names:
+                value = getattr(row, name)
+                if value:
+                    setattr(row, name, seal(reveal(value)))
+        with transaction.atomic():
+            model._base_manager.bulk_update(rows, names)
+            # Recorded as an update: documents and caches hold the tokens.
+            bulk_saved.send(sender=model, instances=rows, created=False, fields=names)
+        count += len(rows)
+
+
+def seal_state(state):
+    """
+    Encrypt the plaintext secret values of a history state (see
+    sms.history), returning whether any was.
+    """
+    from .serializers import INVENTORY_MODELS
+
+    sealed = False
+    for name, model in INVENTORY_MODELS.items():
+        for field in sealed_fields(model):
+            for values in state.get(name, {}).values():
+                if values.get(field) and not is_token(load(values[field])):
+                    values[field] = seal(values[field])
+                    sealed = True
+    return sealed
+
+
+def seal_history(batch_size):
+    """
+    Encrypt the secret values history recorded in plaintext, before
+    encryption was turned on: in change log deltas and checkpoints. Values
+    stored as line patches (long texts edited in place) cannot be and are
+    left as they are. Returns the number of entries and checkpoints
+    rewritten.
+    """
+    from django.db import transaction
+
+    from .changes import MODEL_NAMES
+    from .history import compress, decompress
+    from .models import ChangeLogEntry, HistoryCheckpoint
+
+    count = 0
+    for model, name in MODEL_NAMES.items():
+        fields = sealed_fields(model)
+        if not fields:
+            continue
+        entries = ChangeLogEntry.objects.filter(model=name, delta__isnull=False)
+        last = 0
+        while True:
+            batch = list(entries.filter(pk__gt=last).order_by("pk")[:batch_size])
+            if not batch:
+                break
+            last = batch[-1].pk
+            batch = [
+                entry
+                for entry in batch
+                if seal_state({name: {entry.object_id: entry.delta}})
+            ]
+            ChangeLogEntry.objects.bulk_update(batch, ["delta"])
+            count += len(batch)
+    checkpoints = HistoryCheckpoint.objects.order_by("pk")
+    last = 0
+    while True:
+        batch = list(checkpoints.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return count
+        last = batch[-1].pk
+        sealed = []
+        for checkpoint in batch:
+            state = decompress(checkpoint.state)
+            if seal_state(state):
+                checkpoint.state = compress(state)
+                sealed.append(checkpoint)
+        with transaction.atomic():
+            HistoryCheckpoint.objects.bulk_update(sealed, ["state"])
+        count += len(sealed)
+
+
+def clear_caches():
+    """
+    Forget every decrypted value and data key this process holds.
+    """
+    global _current
+    PLAINTEXTS.clear()
+    with _data_keys_lock:
+        _data_keys.clear()
+        _current = (None, 0.0)
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, "SMS_SQLITE_PRAGMAS", {}).items():
+            cursor.execute("PRAGMA %s = %s" % (pragma, value))
+
+
+connection_created.connect(configure_sqlite)
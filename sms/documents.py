@@ -0,0 +1,123 @@
+"""
+Denormalized service system documents.
+
+Reading a whole host from the normalized tables costs one query per related
+model. With SMS_SERVICE_SYSTEM_DOCUMENTS on, every write also rebuilds the
+ServiceSystemDocument of the systems it touched once its transaction commits
+(see `sms.signals`), and snapshot reads (REST, async and the `snapshot`
+command) load that one row instead.
+
+The tables stay the source of truth: documents are rebuilt from them by
+`rebuild_documents`, and `check_documents` compares the two.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ServiceSystem, ServiceSystemDocument
+from .snapshot import build_snapshots, snapshot_etag, snapshot_queryset
+
+# Service systems loaded per snapshot query set; each costs one query per
+# related model, whatever the number of systems.
+CHUNK_SIZE = 100
+
+
+def enabled():
+    return getattr(settings, "SMS_SERVICE_SYSTEM_DOCUMENTS", False)
+
+
+def chunks(ids, size=CHUNK_SIZE):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+def build_documents(service_system_ids):
+    """
+    Documents of the live systems among `service_system_ids`, by id.
+    """
+    service_systems = list(snapshot_queryset().filter(pk__in=service_system_ids))
+    documents = {}
+    for service_system, data in zip(service_systems, build_snapshots(service_systems)):
+        version, last_modified = snapshot_etag(service_system)
+        documents[service_system.pk] = ServiceSystemDocument(
+            service_system_id=service_system.pk,
+            # Stored as it will be read back, so comparisons see no
+            # difference between a fresh and a stored document.
+            data=normalize(data),
+            version=version,
+            last_modified=last_modified,
+        )
+    return documents
+
+
+def normalize(data):
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def store(service_system_ids):
+    """
+    Rebuild the documents of `service_system_ids`, dropping those of
+    systems deleted since.
+    """
+    for ids in chunks(service_system_ids):
+        documents = build_documents(ids)
+        ServiceSystemDocument.objects.filter(pk__in=set(ids) - set(documents)).delete()
+        ServiceSystemDocument.objects.bulk_create(
+            documents.values(),
+            update_conflicts=True,
+            unique_fields=["service_system"],
+            update_fields=["data", "version", "last_modified"],
+        )
+
+
+def refresh(service_system_ids):
+    if enabled():
+        store(service_system_ids)
+
+
+def load(pk):
+    """
+    `(data, version, last_modified)` of the stored document of a live
+    system, or None.
+    """
+    return (
+        ServiceSystemDocument.objects.filter(
+            pk=pk, service_system__deleted_at__isnull=True
+        )
+        .values_list("data", "version", "last_modified")
+        .first()
+    )
+
+
+def orphans():
+    """
+    Documents of deleted or missing service systems.
+    """
+    return ServiceSystemDocument.objects.exclude(
+        service_system__in=ServiceSystem.objects.values("pk")
+    )
+
+
+def check(service_system_ids):
+    """
+    Compare the documents of `service_system_ids` with the tables; returns
+    `(missing ids, stale ids)`.
+    """
+    missing = []
+    stale = []
+    for ids in chunks(service_system_ids):
+        stored = {
+            pk: (data, version)
+            for pk, data, version in ServiceSystemDocument.objects.filter(
+                pk__in=ids
+            ).values_list("pk", "data", "version")
+        }
+        for pk, document in build_documents(ids).items():
+            if pk not in stored:
+                missing.append(pk)
+            elif stored[pk] != (document.data, document.version):
+                stale.append(pk)
+    return missing, stale
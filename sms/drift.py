@@ -0,0 +1,102 @@
+"""
+Version drift of dependencies, applications and tools across the fleet.
+
+The database groups the rows of a versioned model by `(name, version)`; the
+newest version of each name is then picked here, since versions are free
+text that only sort correctly part by part ("1.10" > "1.9", "2.0rc1" < "2.0").
+The result is materialized in VersionSummary and refreshed per name as rows
+change, so the drift report reads a few summary rows instead of grouping the
+inventory, and listing the hosts behind a name is one indexed lookup.
+"""
+
+import re
+
+from django.db.models import Count
+
+VERSION_TOKEN_RE = re.compile(r"\d+|[a-z]+")
+
+
+def version_key(version):
+    """
+    Sort key of a version string: numeric parts compare as numbers, and a
+    textual part (a pre-release tag) sorts before the end of the version.
+    """
+    tokens = VERSION_TOKEN_RE.findall((version or "").strip().lower().lstrip("v"))
+    return (
+        *((2, int(token)) if token.isdigit() else (0, token) for token in tokens),
+        (1, 0),
+    )
+
+
+def summarize(queryset):
+    """
+    Yield `(name, version, rows, newest?)` for the rows of `queryset`, from
+    one grouped query.
+    """
+    counts = (
+        queryset.values_list("name", "version")
+        .annotate(count=Count("pk"))
+        .order_by("name")
+    )
+    versions = {}
+    for name, version, count in counts:
+        versions.setdefault(name, []).append((version, count))
+    for name, counted in versions.items():
+        latest = max(version_key(version) for version, _ in counted)
+        for version, count in counted:
+            # "v2.0" and "2.0" are the same version.
+            yield name, version, count, version_key(version) == latest
+
+
+def report(summaries):
+    """
+    Group VersionSummary rows (ordered by model and name) into one entry per
+    name, versions newest first.
+    """
+    entries = []
+    for summary in summaries:
+        if not entries or (entries[-1]["model"], entries[-1]["name"]) != (
+            summary.model,
+            summary.name,
+        ):
+            entries.append(
+                {
+                    "model": summary.model,
+                    "name": summary.name,
+                    "latest": None,
+                    "service_systems": 0,
+                    "behind": 0,
+                    "versions": [],
+                }
+            )
+        entry = entries[-1]
+        entry["service_systems"] += summary.service_systems
+        if summary.latest:
+            entry["latest"] = summary.version
+        else:
+            entry["behind"] += summary.service_systems
+        entry["versions"].append(
+            {
+                "version": summary.version,
+                "service_systems": summary.service_systems,
+                "latest": summary.latest,
+            }
+        )
+    for entry in entries:
+        entry["versions"].sort(
+            key=lambda version: version_key(version["version"]), reverse=True
+        )
+    return entries
+
+
+def hosts_behind(queryset, summaries):
+    """
+    `(service system id, service system name, version)` of the rows of
+    `queryset` on a version the summaries do not mark as the newest.
+    """
+    stale = [summary.version for summary in summaries if not summary.latest]
+    return (
+        queryset.filter(version__in=stale)
+        .order_by("service_system__name")
+        .values_list("service_system", "service_system__name", "version")
+    )
@@ -0,0 +1,322 @@
+"""
+Synthetic fleets for benchmarks and load tests.
+
+`generate_fleet` writes service systems with a realistic spread of rows in
+every related model: environment variables, dependencies and tools are drawn
+from shared pools (so search, drift and bulk edits see the same names on many
+hosts, at a few different versions), and every port belongs to one of its
+system's applications. Rows are written with `bulk_create`, one transaction
+per chunk of systems, and reported through `bulk_saved` like an import.
+"""
+
+import ipaddress
+import random
+import time
+
+from django.db import transaction
+
+from .bulk import model_name
+from .models import *
+from .serializers import INVENTORY_MODELS
+from .signals import bulk_saved, pending_summaries
+
+# Rows of each related model per service system, by API name.
+ROWS_PER_SYSTEM = {
+    "environment_variables": 12,
+    "configuration_files": 4,
+    "dependencies": 10,
+    "network_configurations": 1,
+    "applications": 3,
+    "ports": 6,
+    "logging_configurations": 2,
+    "monitoring_tools": 2,
+    "health_checks": 3,
+    "containerizations": 1,
+    "deployment_tools": 1,
+    "scaling_configurations": 1,
+    "backup_configurations": 1,
+    "user_permissions": 3,
+    "disaster_recoveries": 1,
+    "runbooks": 2,
+}
+# Service systems per transaction.
+CHUNK_SIZE = 500
+FIRST_ADDRESS = ipaddress.IPv4Address("10.0.0.1")
+
+LOCATIONS = ["dc1", "dc2", "dc3", "eu-west-1", "us-east-1", "ap-south-1"]
+OPERATING_SYSTEMS = ["Ubuntu 22.04", "Ubuntu 20.04", "Debian 12", "RHEL 9"]
+CPU_ALLOCATIONS = ["2 vCPU", "4 vCPU", "8 vCPU", "16 cores"]
+RAM_ALLOCATIONS = ["4GB", "8GB", "16GB", "32 GiB", "64GB"]
+DISK_ALLOCATIONS = ["50GB", "100GB", "250GB", "1TB"]
+ENVIRONMENT_VARIABLES = [
+    "LOG_LEVEL",
+    "DATABASE_URL",
+    "REDIS_URL",
+    "SECRET_KEY",
+    "ALLOWED_HOSTS",
+    "SENTRY_DSN",
+    "WORKERS",
+    "TIMEOUT",
+    "CACHE_TTL",
+    "FEATURE_FLAGS",
+    "SMTP_HOST",
+    "TZ",
+    "HTTP_PROXY",
+    "MAX_CONNECTIONS",
+    "REGION",
+]
+# (name, versions): the last version is the newest.
+DEPENDENCIES = [
+    ("openssl", ["1.1.1w", "3.0.11", "3.0.13"]),
+    ("python", ["3.10.12", "3.11.7", "3.12.1"]),
+    ("nginx", ["1.22.1", "1.24.0", "1.25.3"]),
+    ("postgresql-client", ["14.10", "15.5", "16.1"]),
+    ("redis", ["6.2.14", "7.0.15", "7.2.4"]),
+    ("node", ["18.19.0", "20.11.0"]),
+    ("libc6", ["2.35", "2.36"]),
+    ("curl", ["7.88.1", "8.5.0"]),
+    ("git", ["2.39.2", "2.43.0"]),
+    ("zlib", ["1.2.13", "1.3"]),
+    ("java", ["11.0.21", "17.0.9", "21.0.1"]),
+    ("docker", ["24.0.7", "25.0.1"]),
+]
+APPLICATIONS = [
+    ("api", ["2.3.0", "2.4.1"]),
+    ("worker", ["2.3.0", "2.4.1"]),
+    ("frontend", ["5.0.2", "5.1.0"]),
+    ("scheduler", ["1.8.4"]),
+    ("gateway", ["0.9.1", "1.0.0"]),
+]
+MONITORING_TOOLS = [
+    ("node-exporter", ["1.6.1", "1.7.0"]),
+    ("prometheus", ["2.47.0", "2.48.1"]),
+    ("filebeat", ["8.11.3", "8.12.0"]),
+    ("datadog-agent", ["7.50.1"]),
+]
+DEPLOYMENT_TOOLS = [
+    ("ansible", ["8.5.0", "9.1.0"]),
+    ("helm", ["3.13.2", "3.14.0"]),
+    ("terraform", ["1.6.6", "1.7.0"]),
+]
+PROTOCOLS = ["tcp", "tcp", "tcp", "udp"]
+LOG_LEVELS = ["DEBUG", "INFO", "INFO", "WARNING", "ERROR"]
+USERS = ["deploy", "ops", "backup", "monitoring", "readonly", "admin"]
+
+
+def pick(pool, index, rng):
+    """
+    The `index`th distinct entry of `pool`, suffixed once the pool runs out.
+    """
+    entry = pool[index % len(pool)]
+    name, versions = entry if isinstance(entry, tuple) else (entry, None)
+    if index >= len(pool):
+        name = "%s-%d" % (name, index // len(pool))
+    if versions is None:
+        return name
+    # Most hosts run the newest version, the rest lag behind.
+    version = versions[-1] if rng.random() < 0.7 else rng.choice(versions)
+    return name, version
+
+
+def service_system_values(prefix, index, rng):
+    return {
+        "name": "%s-%d" % (prefix, index),
+        "description": "Synthetic %s host %d generated for benchmarks."
+        % (rng.choice(["web", "api", "batch", "cache", "db"]), index),
+        "location": rng.choice(LOCATIONS),
+        "hostname": "%s-%d.example.internal" % (prefix, index),
+        "ip_address": str(FIRST_ADDRESS + index),
+        "operating_system": rng.choice(OPERATING_SYSTEMS),
+        "cpu_allocation": rng.choice(CPU_ALLOCATIONS),
+        "ram_allocation": rng.choice(RAM_ALLOCATIONS),
+        "disk_allocation": rng.choice(DISK_ALLOCATIONS),
+    }
+
+
+def named(pool):
+    def values(system, index, rng):
+        name, version = pick(pool, index, rng)
+        return {"name": name, "version": version}
+
+    return values
+
+
+# Field values of the `index`th row of a related model on a service system.
+ROW_VALUES = {
+    EnvironmentVariable: lambda system, index, rng: {
+        "name": pick(ENVIRONMENT_VARIABLES, index, rng),
+        "value": "%s-%08x" % (system.location, rng.getrandbits(32)),
+    },
+    ConfigurationFile: lambda system, index, rng: {
+        "file_path": "/etc/%s/%s.conf"
+        % (
+            system.hostname.split(".")[0],
+            ["app", "nginx", "logging", "cron"][index % 4],
+        )
+        + ("" if index < 4 else ".%d" % index),
+        "description": "\n".join(
+            "%s = %d" % (key, rng.randrange(1, 1000))
+            for key in ("workers", "timeout", "keepalive", "buffer_size")
+        ),
+    },
+    Dependency: named(DEPENDENCIES),
+    NetworkConfiguration: lambda system, index, rng: {
+        "dns": "10.0.0.53",
+        "gateway": system.ip_address.rsplit(".", 1)[0] + ".254",
+        "subnet": system.ip_address.rsplit(".", 1)[0] + ".0/24",
+    },
+    Application: lambda system, index, rng: {
+        **named(APPLICATIONS)(system, index, rng),
+        "description": "Synthetic application.",
+    },
+    LoggingConfiguration: lambda system, index, rng: {
+        "log_file_path": "/var/log/%s/%d.log" % (system.hostname.split(".")[0], index),
+        "log_level": rng.choice(LOG_LEVELS),
+    },
+    MonitoringTool: named(MONITORING_TOOLS),
+    HealthCheck: lambda system, index, rng: {
+        "endpoint": ["/health", "/ready", "/metrics"][index % 3]
+        + ("" if index < 3 else "/%d" % index),
+        "criteria": rng.choice(["status 200", "status 2xx; latency < 500ms"]),
+    },
+    Containerization: lambda system, index, rng: {
+        "container_runtime": rng.choice(["containerd", "docker", "cri-o"]),
+        "orchestration_tool": rng.choice(["kubernetes", "nomad", "compose"]),
+        "image_info": "registry.example.internal/%s:%s"
+        % (rng.choice(APPLICATIONS)[0], rng.choice(["latest", "stable", "2.4"])),
+    },
+    DeploymentTool: lambda system, index, rng: {
+        **named(DEPLOYMENT_TOOLS)(system, index, rng),
+        "info": "Deploys from the main branch.",
+    },
+    ScalingConfiguration: lambda system, index, rng: {
+        "scaling_policy": "min %d, max %d replicas"
+        % (rng.randrange(1, 3), rng.randrange(3, 10)),
+        "auto_scaling_trigger": "cpu > %d%%" % rng.choice([60, 70, 80]),
+    },
+    BackupConfiguration: lambda system, index, rng: {
+        "backup_schedule": "0 %d * * *" % rng.randrange(24),
+        "backup_location": "s3://backups/%s/%d" % (system.name, index),
+    },
+    UserPermission: lambda system, index, rng: {
+        "user": pick(USERS, index, rng),
+        "permissions": rng.choice(["read", "read, write", "read, write, deploy"]),
+    },
+    DisasterRecovery: lambda system, index, rng: {
+        "recovery_plan": "Restore the latest backup to %s." % rng.choice(LOCATIONS),
+        "backup_locations": "s3://backups/%s" % system.name,
+        "testing_schedule": rng.choice(["monthly", "quarterly"]),
+    },
+    Runbook: lambda system, index, rng: {
+        "run_command": "systemctl start %s" % system.hostname.split(".")[0],
+        "verify_command": "curl -fsS http://localhost/health",
+        "upgrade_command": "apt-get install --only-upgrade -y app",
+        "rollback_command": "apt-get install -y app=%d.0" % index,
+    },
+}
+
+
+def row_counts(scale=1.0):
+    """
+    Rows of each related model per service system at `scale`.
+    """
+    return {
+        INVENTORY_MODELS[name]: max(1, round(count * scale)) if scale else 0
+        for name, count in ROWS_PER_SYSTEM.items()
+    }
+
+
+def build(model, values):
+    instance = model(**values)
+    if isinstance(instance, DerivedColumnsMixin):
+        instance.refresh_derived()
+    return instance
+
+
+def write(model, instances, batch_size):
+    model.objects.bulk_create(instances, batch_size=batch_size)
+    bulk_saved.send(sender=model, instances=instances, created=True)
+
+
+def generate_chunk(prefix, indexes, counts, rng, batch_size):
+    """
+    Insert the service systems numbered `indexes` and their related rows;
+    returns the rows written per model.
+    """
+    systems = [
+        build(ServiceSystem, service_system_values(prefix, index, rng))
+        for index in indexes
+    ]
+    write(ServiceSystem, systems, batch_size)
+    written = {ServiceSystem: len(systems)}
+    applications = {}
+    for model, count in counts.items():
+        if model is Port:
+            continue
+        values = ROW_VALUES[model]
+        rows = [
+            build(model, {"service_system": system, **values(system, index, rng)})
+            for system in systems
+            for index in range(count)
+        ]
+        write(model, rows, batch_size)
+        written[model] = len(rows)
+        if model is Application:
+            for application in rows:
+                applications.setdefault(application.service_system_id, []).append(
+                    application
+                )
+
+    ports = []
+    for system in systems:
+        owned = applications.get(system.pk)
+        if not owned:
+            continue
+        numbers = rng.sample(range(1024, 65536), counts[Port])
+        for position, number in enumerate(numbers):
+            ports.append(
+                build(
+                    Port,
+                    {
+                        "service_system": system,
+                        "application": owned[position % len(owned)],
+                        "port_number": number,
+                        "protocol": rng.choice(PROTOCOLS),
+                    },
+                )
+            )
+    write(Port, ports, batch_size)
+    written[Port] = len(ports)
+    return written
+
+
+def generate_fleet(
+    systems,
+    prefix="fleet",
+    start=0,
+    scale=1.0,
+    seed=0,
+    batch_size=2000,
+    progress=None,
+):
+    """
+    Insert `systems` service systems named `<prefix>-<n>` from `n = start`,
+    with ROWS_PER_SYSTEM related rows each (times `scale`). Returns
+    `(rows per model name, seconds)`. `progress(done)` is called after each
+    chunk.
+    """
+    rng = random.Random(seed)
+    counts = row_counts(scale)
+    totals = dict.fromkeys(["service_systems", *ROWS_PER_SYSTEM], 0)
+    started = time.monotonic()
+    # Version summaries are refreshed once at the end, not per chunk.
+    with pending_summaries.defer():
+        for offset in range(0, systems, CHUNK_SIZE):
+            indexes = range(start + offset, start + min(offset + CHUNK_SIZE, systems))
+            with transaction.atomic():
+                written = generate_chunk(prefix, indexes, counts, rng, batch_size)
+            for model, count in written.items():
+                totals[model_name(model)] += count
+            if progress:
+                progress(offset + len(indexes))
+    return totals, time.monotonic() - started
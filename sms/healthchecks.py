@@ -0,0 +1,419 @@
+"""
+Probing of HealthCheck endpoints.
+
+The runner is a fixed pool of asyncio workers sharing one queue of checks, so
+concurrency is bounded however many checks there are, and a single core can
+keep thousands of requests in flight. Requests to the same host are spaced by
+a per-host rate limit; checks are queued round-robin across hosts so workers
+waiting on a busy host do not starve the others. HTTP is spoken directly over
+asyncio streams (one GET per connection), which is all a health check needs;
+the body ends at its Content-Length or last chunk, so servers that keep the
+connection open anyway are not waited on until the timeout.
+
+`HealthCheck.criteria` is read as a list of clauses separated by newlines,
+";" or "and" outside quotes, each one of:
+
+    status 200              status 2xx          status in 200, 204
+    latency < 500ms         response time <= 2s
+    body contains "ok"      body does not contain error
+
+Empty criteria mean "status 2xx".
+"""
+
+import asyncio
+import bisect
+import functools
+import re
+import ssl
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import HealthCheckResult
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Bytes of the response body read for `body contains` criteria.
+MAX_BODY_BYTES = 64 * 1024
+USER_AGENT = "sms-health-check"
+
+# A quoted string, skipped whole, or a clause separator.
+CLAUSE_SEPARATOR_RE = re.compile(r"(\"[^\"]*\"|'[^']*')|\n|;|\band\b", re.IGNORECASE)
+STATUS_RE = re.compile(
+    r"^status(?:\s+code)?\s*(?:==|=|:|is|in)?\s*"
+    r"((?:[1-5](?:\d\d|xx))(?:\s*(?:,|\||or)\s*[1-5](?:\d\d|xx))*)$",
+    re.IGNORECASE,
+)
+LATENCY_RE = re.compile(
+    r"^(?:latency|response\s+time)\s*(<=?)\s*(\d+(?:\.\d+)?)\s*(ms|s)?$",
+    re.IGNORECASE,
+)
+BODY_RE = re.compile(
+    r"^body\s+(contains|does\s+not\s+contain|not\s+contains)\s+"
+    r"(?:\"(.*)\"|'(.*)'|(.*))$",
+    re.IGNORECASE,
+)
+
+
+def split_clauses(text):
+    """
+    The clauses of a criteria text, leaving separators inside quoted text
+    alone (`body contains "up and running"`).
+    """
+    clauses = []
+    start = 0
+    for match in CLAUSE_SEPARATOR_RE.finditer(text):
+        if match.group(1) is None:
+            clauses.append(text[start : match.start()])
+            start = match.end()
+    clauses.append(text[start:])
+    return clauses
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_criteria(text):
+    """
+    Predicates `(description, test(status, latency_ms, body))` of a criteria
+    text. Raises ValueError for a clause it cannot read.
+    """
+    predicates = []
+    for clause in split_clauses(text or ""):
+        clause = clause.strip().rstrip(".")
+        if not clause:
+            continue
+        match = STATUS_RE.match(clause)
+        if match:
+            codes = re.findall(r"[1-5](?:\d\d|xx)", match.group(1).lower())
+            predicates.append((clause, functools.partial(status_matches, codes)))
+            continue
+        match = LATENCY_RE.match(clause)
+        if match:
+            operator, value, unit = match.groups()
+            limit = float(value) * (1000 if unit and unit.lower() == "s" else 1)
+            predicates.append(
+                (clause, functools.partial(latency_within, limit, operator == "<="))
+            )
+            continue
+        match = BODY_RE.match(clause)
+        if match:
+            negate = not match.group(1).lower() == "contains"
+            text = next(group for group in match.groups()[1:] if group is not None)
+            predicates.append(
+                (clause, functools.partial(body_contains, text.encode(), negate))
+            )
+            continue
+        raise ValueError("Cannot read criterion %r." % clause)
+    if not predicates:
+        predicates.append(("status 2xx", functools.partial(status_matches, ["2xx"])))
+    return tuple(predicates)
+
+
+def status_matches(codes, status, latency_ms, body):
+    return any(
+        code == str(status) or (code.endswith("xx") and code[0] == str(status)[0])
+        for code in codes
+    )
+
+
+def latency_within(limit, inclusive, status, latency_ms, body):
+    return latency_ms <= limit if inclusive else latency_ms < limit
+
+
+def body_contains(text, negate, status, latency_ms, body):
+    return (text in body) != negate
+
+
+def endpoint_url(endpoint, service_system):
+    """
+    URL of a check: the endpoint itself if it is absolute, else resolved
+    against the service system's IP address ("/health" -> http://ip/health).
+    """
+    endpoint = endpoint.strip()
+    if "://" in endpoint:
+        return endpoint
+    if not endpoint.startswith("/"):
+        return "http://" + endpoint
+    host = service_system.ip_address
+    if ":" in host:
+        host = "[%s]" % host
+    return "http://%s%s" % (host, endpoint)
+
+
+async def fetch(url, ssl_context):
+    """
+    GET `url`, returning `(status, body)` with at most MAX_BODY_BYTES of body.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("Unsupported URL %r." % url)
+    secure = parts.scheme == "https"
+    reader, writer = await asyncio.open_connection(
+        parts.hostname,
+        parts.port or (443 if secure else 80),
+        ssl=ssl_context if secure else None,
+    )
+    try:
+        target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        writer.write(
+            (
+                "GET %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: %s\r\n"
+                "Accept: */*\r\nConnection: close\r\n\r\n"
+                % (target, parts.netloc, USER_AGENT)
+            ).encode("latin-1")
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise ValueError("Malformed status line %r." % status_line[:80])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if status in (204, 304) or status < 200:
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            body = await read_chunked(reader, MAX_BODY_BYTES)
+        elif "content-length" in headers:
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise ValueError(
+                    "Malformed Content-Length %r." % headers["content-length"][:80]
+                )
+            body = await read_exactly(reader, min(length, MAX_BODY_BYTES))
+        else:
+            # Without either, the body ends when the server closes.
+            body = b""
+            while len(body) < MAX_BODY_BYTES:
+                chunk = await reader.read(MAX_BODY_BYTES - len(body))
+                if not chunk:
+                    break
+                body += chunk
+        return status, body
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+
+async def read_exactly(reader, size):
+    """
+    `size` bytes from `reader`, or what there is of them before it closes.
+    """
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+
+async def read_chunked(reader, limit):
+    """
+    At most `limit` bytes of a chunked body, stopping at its last chunk.
+    """
+    body = b""
+    while len(body) < limit:
+        size_line = await reader.readline()
+        if not size_line:
+            break
+        try:
+            size = int(size_line.split(b";")[0], 16)
+        except ValueError:
+            raise ValueError("Malformed chunk size %r." % size_line[:80])
+        if not size:
+            break
+        chunk = await read_exactly(reader, min(size, limit - len(body)))
+        body += chunk
+        if len(chunk) < size or not (await reader.readline()):
+            break
+    return body
+
+
+class HostRateLimiter:
+    """
+    Spaces requests to the same host at least `1 / rate` seconds apart.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def interleave(probes):
+    """
+    Order `(check, url)` probes round-robin across hosts.
+    """
+    by_host = {}
+    for check, url in probes:
+        by_host.setdefault(urlsplit(url).hostname, []).append((check, url))
+    queues = [iter(queue) for queue in by_host.values()]
+    while queues:
+        remaining = []
+        for queue in queues:
+            item = next(queue, None)
+            if item is not None:
+                yield item
+                remaining.append(queue)
+        queues = remaining
+
+
+async def probe(check, url, limiter, timeout, ssl_context):
+    """
+    Run one check, returning an unsaved HealthCheckResult.
+    """
+    result = HealthCheckResult(health_check=check, url=url[:1024])
+    try:
+        predicates = parse_criteria(check.criteria)
+    except ValueError as e:
+        result.outcome = HealthCheckResult.ERROR
+        result.message = str(e)[:255]
+        return result
+    await limiter.wait(urlsplit(url).hostname)
+    started = time.perf_counter()
+    try:
+        status, body = await asyncio.wait_for(fetch(url, ssl_context), timeout)
+    except asyncio.TimeoutError:
+        result.outcome = HealthCheckResult.ERROR
+        result.message = "Timed out after %ss." % timeout
+        return result
+    except (OSError, ValueError, ssl.SSLError) as e:
+        result.outcome = HealthCheckResult.ERROR
+        result.message = (str(e) or e.__class__.__name__)[:255]
+        return result
+    result.latency_ms = (time.perf_counter() - started) * 1000
+    result.status_code = status
+    failed = [
+        description
+        for description, test in predicates
+        if not test(status, result.latency_ms, body)
+    ]
+    if failed:
+        result.outcome = HealthCheckResult.FAILED
+        result.message = ("Failed: %s" % "; ".join(failed))[:255]
+    else:
+        result.outcome = HealthCheckResult.PASSED
+    return result
+
+
+async def run_checks(
+    probes, on_result, concurrency=100, per_host_rate=0, timeout=5.0, ssl_context=None
+):
+    """
+    Probe `(check, url)` pairs with `concurrency` workers, awaiting
+    `on_result(result)` for each.
+    """
+    limiter = HostRateLimiter(per_host_rate)
+    queue = interleave(probes)
+    # Loading the CA bundle is slow: do it once, not per HTTPS check.
+    ssl_context = ssl_context or ssl.create_default_context()
+
+    async def worker():
+        # Workers share one iterator; taking the next probe never awaits,
+        # so no two workers get the same one.
+        for check, url in queue:
+            await on_result(await probe(check, url, limiter, timeout, ssl_context))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+class LatencyHistogram:
+    """
+    Result counts per latency bucket, keyed by the bucket's upper bound in
+    milliseconds ("+Inf" past the last one), like a Prometheus histogram.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, latency_ms):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def as_dict(self):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS_MS] + ["+Inf"]
+        return dict(zip(bounds, self.counts))
+
+
+class ResultRecorder:
+    """
+    Totals and latency histogram of a run's results, written to the database
+    in batches of `batch_size` (or not at all without a `run`).
+    """
+
+    def __init__(self, run=None, batch_size=500):
+        self.run = run
+        self.batch_size = batch_size
+        self.batch = []
+        self.outcomes = dict.fromkeys(
+            (
+                HealthCheckResult.PASSED,
+                HealthCheckResult.FAILED,
+                HealthCheckResult.ERROR,
+            ),
+            0,
+        )
+        self.histogram = LatencyHistogram()
+        self.latencies = []
+
+    async def add(self, result):
+        self.outcomes[result.outcome] += 1
+        if result.latency_ms is not None:
+            self.histogram.add(result.latency_ms)
+            self.latencies.append(result.latency_ms)
+        if self.run is None:
+            return
+        result.run = self.run
+        self.batch.append(result)
+        if len(self.batch) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        batch, self.batch = self.batch, []
+        if batch:
+            await sync_to_async(HealthCheckResult.objects.bulk_create)(batch)
+
+    def summary(self, seconds):
+        checks = sum(self.outcomes.values())
+        latencies = sorted(self.latencies)
+        return {
+            "checks": checks,
+            "seconds": round(seconds, 3),
+            "per_minute": round(checks / seconds * 60) if seconds else None,
+            **self.outcomes,
+            "p50_ms": (round(statistics.median(latencies), 2) if latencies else None),
+            "p95_ms": (
+                round(latencies[int(len(latencies) * 0.95) - 1], 2)
+                if latencies
+                else None
+            ),
+            "latency_histogram": self.histogram.as_dict(),
+        }
+
+    def finish(self):
+        """
+        Store the run's totals; call once the event loop is done.
+        """
+        self.run.finished_at = timezone.now()
+        self.run.checks = sum(self.outcomes.values())
+        self.run.passed = self.outcomes[HealthCheckResult.PASSED]
+        self.run.failed = self.outcomes[HealthCheckResult.FAILED]
+        self.run.errors = self.outcomes[HealthCheckResult.ERROR]
+        self.run.latency_histogram = self.histogram.as_dict()
+        self.run.save()
@@ -0,0 +1,340 @@
+"""
+Configuration history: every past state of a ServiceSystem and its rows.
+
+History rides on the change log. Each ChangeLogEntry written for an
+inventory row carries the field values the write set (`delta`): all of them
+when the row is created, only the changed ones on update. A long text field
+edited in place is stored as a line patch against its previous value, so
+tweaking one line of a configuration file does not copy the whole file.
+
+Reading the state of a system at time T replays its entries up to T on top
+of the HistoryCheckpoint before T: a compressed copy of the system's whole
+configuration, taken every so many entries by the `checkpoint_history`
+command. A read therefore replays at most one checkpoint interval, however
+long the system's history.
+"""
+
+import difflib
+import functools
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import crypto
+from .changes import MODEL_NAMES
+from .models import (
+    ChangeLogEntry,
+    EncryptedTextField,
+    HistoryCheckpoint,
+    ServiceSystem,
+)
+from .serializers import INVENTORY_MODELS
+
+# Text values shorter than this are always stored whole.
+PATCH_MIN_LENGTH = 1024
+# Rows per query when reading the values of bulk updates.
+READ_CHUNK_SIZE = 1000
+
+
+class HistoryUnavailable(Exception):
+    """
+    The requested state predates the history kept for the system.
+    """
+
+
+@functools.cache
+def tracked_fields(model):
+    """
+    The fields whose values history records: everything editable, which
+    leaves out the id, timestamps and columns derived from other fields.
+    """
+    return [
+        field
+        for field in model._meta.concrete_fields
+        if field.editable and not field.primary_key
+    ]
+
+
+def row_values(instance, names=None):
+    """
+    `{field name: value}` of `instance`, for the fields in `names` or all
+    tracked fields. Secret values are recorded encrypted.
+    """
+    values = {}
+    for field in tracked_fields(type(instance)):
+        if names is None or field.name in names:
+            value = getattr(instance, field.attname)
+            if isinstance(field, EncryptedTextField):
+                value = field.get_prep_value(value)
+            values[field.name] = value
+    return values
+
+
+def read_values(model, pks, names=None):
+    """
+    `{pk: {field name: value}}` of the stored rows `pks` of `model`.
+    """
+    fields = [
+        field for field in tracked_fields(model) if names is None or field.name in names
+    ]
+    pks = list(pks)
+    values = {}
+    for start in range(0, len(pks), READ_CHUNK_SIZE):
+        rows = model._base_manager.filter(
+            pk__in=pks[start : start + READ_CHUNK_SIZE]
+        ).values_list("pk", *[field.attname for field in fields])
+        for pk, *row in rows:
+            values[pk] = {field.name: value for field, value in zip(fields, row)}
+    return values
+
+
+def make_patch(old, new):
+    """
+    Line patch turning `old` into `new`, as `[start, end, lines]` splices of
+    old's lines; None when storing `new` whole is as small.
+    """
+    if not (
+        isinstance(old, str)
+        and isinstance(new, str)
+        and min(len(old), len(new)) >= PATCH_MIN_LENGTH
+    ):
+        return None
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    patch = [
+        [i1, i2, new_lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+    if len(json.dumps(patch)) * 2 > len(new):
+        return None
+    return patch
+
+
+def apply_patch(old, patch):
+    lines = old.splitlines(keepends=True)
+    # Splicing from the end keeps the earlier offsets valid.
+    for start, end, replacement in reversed(patch):
+        lines[start:end] = replacement
+    return "".join(lines)
+
+
+def diff(previous, current):
+    """
+    `(delta, patches)` turning the `previous` values of a row into
+    `current`; patches is None when every change is stored whole.
+    """
+    delta = {}
+    patches = {}
+    for name, value in current.items():
+        old = previous.get(name, value)
+        # A secret encrypted anew is only a change if its plaintext is.
+        if crypto.same(old, value):
+            continue
+        patch = make_patch(old, value)
+        if patch is None:
+            delta[name] = value
+        else:
+            patches[name] = patch
+    return delta, patches or None
+
+
+def apply(row, delta, patches):
+    row.update(delta or {})
+    for name, patch in (patches or {}).items():
+        row[name] = apply_patch(row[name], patch)
+
+
+def replay(state, entries):
+    """
+    Apply change log `entries`, oldest first, to a `state` of
+    `{model name: {row id: values}}`.
+    """
+    for entry in entries:
+        rows = state.setdefault(entry.model, {})
+        key = str(entry.object_id)
+        if entry.operation == ChangeLogEntry.DELETE:
+            rows.pop(key, None)
+        elif entry.delta is None:
+            raise HistoryUnavailable(
+                "Change #%d was recorded before history was kept." % entry.pk
+            )
+        else:
+            apply(rows.setdefault(key, {}), entry.delta, entry.patches)
+    return state
+
+
+def compress(state):
+    return zlib.compress(
+        json.dumps(state, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    )
+
+
+def decompress(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def read_states(service_system_ids, models=None):
+    """
+    `{service system id: state}` of the stored rows of `service_system_ids`.
+    `models` maps model names to the classes to read (historical models in
+    migrations); INVENTORY_MODELS by default.
+    """
+    models = models or INVENTORY_MODELS
+    states = {pk: {} for pk in service_system_ids}
+    for name, model in models.items():
+        lookup = "pk" if name == "service_systems" else "service_system_id"
+        fields = tracked_fields(model)
+        rows = (
+            model._base_manager.filter(**{"%s__in" % lookup: service_system_ids})
+            .order_by()
+            .values_list(lookup, "pk", *[field.attname for field in fields])
+        )
+        for service_system_id, pk, *row in rows:
+            states[service_system_id].setdefault(name, {})[str(pk)] = {
+                field.name: value for field, value in zip(fields, row)
+            }
+    return states
+
+
+def state_at(service_system_id, when=None):
+    """
+    `(state, seq)` of a service system at time `when` (now by default),
+    where seq is the last change log entry applied.
+    """
+    checkpoints = HistoryCheckpoint.objects.filter(service_system_id=service_system_id)
+    entries = ChangeLogEntry.objects.filter(service_system_id=service_system_id)
+    if when is not None:
+        checkpoints = checkpoints.filter(taken_at__lte=when)
+        entries = entries.filter(created_at__lte=when)
+    checkpoint = checkpoints.order_by("-seq").first()
+    if checkpoint is None:
+        state, last = {}, 0
+    else:
+        state, last = decompress(checkpoint.state), checkpoint.seq
+    entries = list(entries.filter(pk__gt=last).order_by("pk"))
+    if entries:
+        last = entries[-1].pk
+    return replay(state, entries), last
+
+
+def snapshot_as_of(service_system_id, when):
+    """
+    The configuration of a service system at `when`, as
+    `{"seq": ..., **fields, model name: [rows]}`; None if it did not exist
+    then.
+    """
+    state, seq = state_at(service_system_id, when=when)
+    system = state.pop("service_systems", {}).get(str(service_system_id))
+    if system is None:
+        return None
+    data = {"id": service_system_id, "seq": seq, **system}
+    for name in INVENTORY_MODELS:
+        if name == "service_systems":
+            continue
+        rows = state.get(name, {})
+        data[name] = [
+            {
+                "id": int(pk),
+                **{
+                    key: value
+                    for key, value in rows[pk].items()
+                    if key != "service_system"
+                },
+            }
+            for pk in sorted(rows, key=int)
+        ]
+    return data
+
+
+def row_history(instance):
+    """
+    Revisions of one inventory row, oldest first: the change log entry, the
+    fields it changed and the complete values after it.
+    """
+    name = MODEL_NAMES[type(instance)]
+    # Every entry of the row, whichever service systems it belonged to.
+    entries = list(
+        ChangeLogEntry.objects.filter(model=name, object_id=instance.pk).order_by("pk")
+    )
+    row = {}
+    first = next(
+        (
+            entry
+            for entry in entries
+            if entry.delta is None and entry.operation != ChangeLogEntry.DELETE
+        ),
+        None,
+    )
+    if first is not None:
+        # The row predates history: start from the first checkpoint of the
+        # system it was on then, which holds its values from then.
+        checkpoint = (
+            HistoryCheckpoint.objects.filter(service_system_id=first.service_system_id)
+            .order_by("seq")
+            .first()
+        )
+        since = 0
+        if checkpoint is not None:
+            row = decompress(checkpoint.state).get(name, {}).get(str(instance.pk), {})
+            since = checkpoint.seq
+        entries = [entry for entry in entries if entry.pk > since]
+    revisions = []
+    for entry in entries:
+        if entry.operation == ChangeLogEntry.DELETE:
+            row = {}
+        else:
+            apply(row, entry.delta, entry.patches)
+        revisions.append(
+            {
+                "seq": entry.pk,
+                "operation": entry.operation,
+                "created_at": entry.created_at,
+                "changed": sorted({**(entry.delta or {}), **(entry.patches or {})}),
+                "values": dict(row),
+            }
+        )
+    return revisions
+
+
+def checkpoint(service_system_id):
+    """
+    Save the current state of a service system as a checkpoint; None when
+    the system has no change log entries to checkpoint.
+    """
+    state, seq = state_at(service_system_id)
+    if not seq:
+        return None
+    entry = ChangeLogEntry.objects.filter(pk=seq).values_list("created_at", flat=True)
+    return HistoryCheckpoint.objects.get_or_create(
+        service_system_id=service_system_id,
+        seq=seq,
+        defaults={"taken_at": entry.first(), "state": compress(state)},
+    )[0]
+
+
+def due_for_checkpoint(every):
+    """
+    Ids of the service systems with at least `every` change log entries
+    since their latest checkpoint.
+    """
+    latest = (
+        HistoryCheckpoint.objects.filter(
+            service_system_id=OuterRef("service_system_id")
+        )
+        .order_by("-seq")
+        .values("seq")[:1]
+    )
+    return (
+        ChangeLogEntry.objects.annotate(since=Coalesce(Subquery(latest), Value(0)))
+        .filter(pk__gt=F("since"))
+        .values("service_system_id")
+        .annotate(entries=Count("pk"))
+        .filter(entries__gte=every)
+        .order_by("service_system_id")
+        .values_list("service_system_id", flat=True)
+    )
@@ -0,0 +1,371 @@
+"""
+Streaming bulk import of inventory rows from JSON Lines or CSV.
+
+Rows are buffered up to `batch_size`, validated against the model field
+constraints, and written with `bulk_create`/`bulk_update` in one transaction
+per batch, so memory stays flat however large the input is.
+
+Each row names its model with the API name used by `/api/` (`service_systems`,
+`environment_variables`, `ports`, ...). Foreign keys are given either by name
+(`service_system`, `application`) or by id (`service_system_id`,
+`application_id`). Service systems are upserted on their `name`, and named
+related rows (environment variables, dependencies, applications, ...) on
+their `name` within their service system; all other rows are inserted.
+Files written by `export_inventory` import as they are: their ids and
+timestamps are ignored.
+"""
+
+import csv
+import gzip
+import json
+import sys
+import time
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import UniqueConstraint
+from django.utils import timezone
+
+from . import crypto
+from .models import NOT_DELETED, DerivedColumnsMixin
+from .serializers import INVENTORY_MODELS
+from .signals import bulk_saved, pending_summaries
+
+# Columns maintained by the database or Django that imports may not set.
+READ_ONLY_FIELDS = ("id", "created_at", "updated_at")
+MAX_REPORTED_ERRORS = 100
+# bulk_update() builds one CASE WHEN per column; past a few hundred rows the
+# statement gets slower to plan than to run, so updates go in smaller slices.
+UPDATE_BATCH_SIZE = 100
+
+
+def open_input(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="")
+    return open(path, newline="")
+
+
+def read_jsonl(stream, model=None):
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, "Invalid JSON: %s" % e
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, "Expected a JSON object."
+            continue
+        yield line_number, data.pop("model", model), data
+
+
+def read_csv(stream, model):
+    reader = csv.DictReader(stream)
+    for data in reader:
+        yield reader.line_num, model, data
+
+
+def natural_key(model):
+    """
+    Fields identifying a row besides its id: a unique field, e.g. ("name",),
+    or the fields of a unique constraint, e.g. ("service_system", "name").
+    """
+    for field in model._meta.fields:
+        if field.unique and not field.primary_key:
+            return (field.name,)
+    for constraint in model._meta.constraints:
+        # Names are unique among the service systems that are not deleted,
+        # which are all the default manager returns.
+        if isinstance(constraint, UniqueConstraint) and constraint.condition in (
+            None,
+            NOT_DELETED,
+        ):
+            return tuple(constraint.fields)
+    return None
+
+
+def existing_rows(model, key, values):
+    """
+    Rows of `model` whose `key` columns match one of the `values` tuples.
+    """
+    queryset = model.objects.filter(
+        **{
+            "%s__in" % name: {value[i] for value in values}
+            for i, name in enumerate(key)
+        }
+    )
+    rows = {tuple(getattr(row, name) for name in key): row for row in queryset}
+    return {value: rows[value] for value in values if value in rows}
+
+
+class InventoryImporter:
+    def __init__(self, batch_size=1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.buffers = defaultdict(list)
+        self.buffered = 0
+        self.rows = self.created = self.updated = self.unchanged = 0
+        self.errors = []
+        self.error_count = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def run(self, records):
+        # Version summaries are refreshed once for the whole import, not per
+        # batch.
+        with pending_summaries.defer():
+            return self.import_records(records)
+
+    def import_records(self, records):
+        started = time.monotonic()
+        for line, name, data in records:
+            self.rows += 1
+            if name is None or isinstance(data, str):
+                self.error(line, data if isinstance(data, str) else "Missing model.")
+                continue
+            if name not in INVENTORY_MODELS:
+                self.error(line, "Unknown model %r." % name)
+                continue
+            self.buffers[name].append((line, data))
+            self.buffered += 1
+            if self.buffered >= self.batch_size:
+                self.flush()
+                if self.progress:
+                    self.elapsed = time.monotonic() - started
+                    self.progress(self)
+        self.flush()
+        self.elapsed = time.monotonic() - started
+        return self
+
+    def flush(self):
+        # Parents are written before children so rows later in the same batch
+        # can reference service systems and applications created earlier.
+        with transaction.atomic():
+            for name, model in INVENTORY_MODELS.items():
+                rows = self.buffers.pop(name, None)
+                if rows:
+                    self.write(model, rows)
+        self.buffered = 0
+
+    @staticmethod
+    def reference(field, data, resolved):
+        """
+        How a row points at `field`: ("id", int), ("name", str) or None.
+
+        Names that are only unique within a service system (applications)
+        are looked up on the row's own: ("name", (service system id, str)).
+        """
+        value = data.get(field.attname)
+        if value not in (None, ""):
+            try:
+                return "id", int(value)
+            except (TypeError, ValueError):
+                return "invalid id", value
+        value = data.get(field.name)
+        if value in (None, ""):
+            return None
+        if natural_key(field.related_model) == ("service_system", "name"):
+            service_system_field = field.model._meta.get_field("service_system")
+            service_system = resolved["service_system"].get(
+                InventoryImporter.reference(service_system_field, data, resolved)
+            )
+            return "name", (service_system, str(value))
+        return "name", str(value)
+
+    @staticmethod
+    def resolve(model, references):
+        """
+        Map a batch of references to primary keys with at most two queries.
+        """
+        names = {value for kind, value in references if kind == "name"}
+        ids = {value for kind, value in references if kind == "id"}
+        found = {}
+        if names and natural_key(model) == ("service_system", "name"):
+            queryset = model.objects.filter(
+                service_system__in={service_system for service_system, _ in names},
+                name__in={name for _, name in names},
+            )
+            found.update(
+                (("name", (service_system, name)), pk)
+                for service_system, name, pk in queryset.values_list(
+                    "service_system", "name", "pk"
+                )
+            )
+        elif names:
+            queryset = model.objects.filter(name__in=names)
+            found.update(
+                (("name", name), pk) for name, pk in queryset.values_list("name", "pk")
+            )
+        if ids:
+            queryset = model.objects.filter(pk__in=ids)
+            found.update(
+                (("id", pk), pk) for pk in queryset.values_list("pk", flat=True)
+            )
+        return found
+
+    def build(self, model, data, resolved):
+        opts = model._meta
+        foreign_keys = [field for field in opts.fields if field.many_to_one]
+        columns = [
+            field.name
+            for field in opts.fields
+            if not field.many_to_one
+            and field.editable
+            and field.name not in READ_ONLY_FIELDS
+        ]
+        # Derived and read-only columns (ServiceSystem.cpu_cores, id, ...) are
+        # accepted so exports can be re-imported, but recomputed or set by
+        # the database rather than imported.
+        allowed = {field.name for field in opts.fields if not field.many_to_one}
+        for field in foreign_keys:
+            allowed.update((field.name, field.attname))
+        unknown = set(data) - allowed
+        if unknown:
+            raise ValidationError("Unknown field(s): %s." % ", ".join(sorted(unknown)))
+
+        values = {}
+        errors = {}
+        for field in foreign_keys:
+            reference = self.reference(field, data, resolved)
+            if reference is None:
+                errors[field.name] = ["This field is required."]
+            elif reference not in resolved[field.name]:
+                kind, value = reference
+                if isinstance(value, tuple):
+                    # A name scoped to the row's service system.
+                    value = value[1]
+                errors[field.name] = ["%s %r does not exist." % (kind, value)]
+            else:
+                values[field.attname] = resolved[field.name][reference]
+        if errors:
+            raise ValidationError(errors)
+
+        provided = [name for name in columns if name in data]
+        values.update((name, data[name]) for name in provided)
+        instance = model(**values)
+        # Foreign keys were resolved in bulk above and uniqueness is handled by
+        # the upsert, so neither costs a query per row here.
+        instance.full_clean(
+            exclude=[field.name for field in foreign_keys],
+            validate_unique=False,
+            validate_constraints=False,
+        )
+        if isinstance(instance, DerivedColumnsMixin):
+            provided += instance.refresh_derived(provided)
+        return instance, provided + [field.attname for field in foreign_keys]
+
+    def write(self, model, rows):
+        # The service system is resolved first: application names are looked
+        # up within it.
+        resolved = {}
+        for field in model._meta.fields:
+            if field.many_to_one:
+                resolved[field.name] = self.resolve(
+                    field.related_model,
+                    {self.reference(field, data, resolved) for _, data in rows}
+                    - {None},
+                )
+
+        key = natural_key(model)
+        if key is not None:
+            key = [model._meta.get_field(name).attname for name in key]
+        keyed = {}
+        unkeyed = []
+        for line, data in rows:
+            try:
+                instance, fields = self.build(model, data, resolved)
+            except ValidationError as e:
+                self.error(line, "; ".join(self.format_errors(e)))
+                continue
+            if key is None:
+                unkeyed.append((line, instance))
+            else:
+                # The last occurrence of a key within a batch wins.
+                keyed[tuple(getattr(instance, name) for name in key)] = (
+                    instance,
+                    fields,
+                )
+
+        # Rules the database does not enforce (ports free on their service
+        # system) are checked for the whole batch at once.
+        validate_batch = getattr(model, "validate_batch", None)
+        if validate_batch is not None and unkeyed:
+            messages = validate_batch([instance for _, instance in unkeyed])
+            for (line, _), message in zip(unkeyed, messages):
+                if message is not None:
+                    self.error(line, message)
+            unkeyed = [
+                row for row, message in zip(unkeyed, messages) if message is None
+            ]
+        to_create = [instance for _, instance in unkeyed]
+        to_update = []
+        update_fields = {"updated_at"}
+        if keyed:
+            existing = existing_rows(model, key, keyed)
+            # Secret values are compared decrypted: all at once, here.
+            crypto.reveal_many(
+                [
+                    getattr(current, name)
+                    for current in existing.values()
+                    for name in crypto.sealed_fields(model)
+                ]
+            )
+            now = timezone.now()
+            for value, (instance, fields) in keyed.items():
+                current = existing.get(value)
+                if current is None:
+                    to_create.append(instance)
+                    continue
+                changed = [
+                    name
+                    for name in fields
+                    if not crypto.same(getattr(current, name), getattr(instance, name))
+                ]
+                if not changed:
+                    # Re-importing an unchanged row costs nothing and keeps
+                    # its updated_at (and thus cached ETags) intact.
+                    self.unchanged += 1
+                    continue
+                for name in changed:
+                    setattr(current, name, getattr(instance, name))
+                current.updated_at = now
+                update_fields.update(changed)
+                to_update.append(current)
+
+        if to_create:
+            model.objects.bulk_create(to_create)
+            self.created += len(to_create)
+            bulk_saved.send(sender=model, instances=to_create, created=True)
+        if to_update:
+            model.objects.bulk_update(
+                to_update, sorted(update_fields), batch_size=UPDATE_BATCH_SIZE
+            )
+            self.updated += len(to_update)
+            bulk_saved.send(
+                sender=model,
+                instances=to_update,
+                created=False,
+                fields=update_fields - {"updated_at"},
+            )
+
+    @staticmethod
+    def format_errors(error):
+        if hasattr(error, "error_dict"):
+            return [
+                "%s: %s" % (field, " ".join(messages))
+                for field, messages in error.message_dict.items()
+            ]
+        return error.messages
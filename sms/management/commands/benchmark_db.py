@@ -0,0 +1,148 @@
+import json
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection
+
+from sms.models import ServiceSystem
+from sms.snapshot import build_snapshot, snapshot_queryset
+
+
+def read_list(ids):
+    list(
+        ServiceSystem.objects.order_by("updated_at", "id").values_list(
+            "id", "name", "hostname", "ip_address"
+        )[:100]
+    )
+
+
+def read_snapshot(ids):
+    build_snapshot(snapshot_queryset().get(pk=random.choice(ids)))
+
+
+def write(ids):
+    ServiceSystem.objects.filter(pk=random.choice(ids)).update(
+        description="benchmark %f" % time.time()
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a mixed read/write load against the configured database from "
+        "concurrent threads and report throughput and latency. Run it once per "
+        "database profile (see SMS_DB_* in server/settings.py) to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds.")
+        parser.add_argument(
+            "--write-ratio",
+            type=float,
+            default=0.1,
+            help="Fraction of operations that write (default: 0.1).",
+        )
+        parser.add_argument(
+            "--snapshot-ratio",
+            type=float,
+            default=0.3,
+            help="Fraction of reads that load a full snapshot (default: 0.3).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        ids = list(ServiceSystem.objects.values_list("pk", flat=True)[:10000])
+        if not ids:
+            raise CommandError("No service systems to benchmark; import some first.")
+        connection.close()
+
+        deadline = time.monotonic() + options["duration"]
+        latencies = {"list": [], "snapshot": [], "write": []}
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            local = {name: [] for name in latencies}
+            failures = 0
+            while time.monotonic() < deadline:
+                roll = random.random()
+                if roll < options["write_ratio"]:
+                    name, operation = "write", write
+                elif random.random() < options["snapshot_ratio"]:
+                    name, operation = "snapshot", read_snapshot
+                else:
+                    name, operation = "list", read_list
+                started = time.perf_counter()
+                try:
+                    operation(ids)
+                except DatabaseError:
+                    failures += 1
+                else:
+                    local[name].append(time.perf_counter() - started)
+                # What the end of a request does: close the connection unless
+                # CONN_MAX_AGE allows it to be reused.
+                close_old_connections()
+            connection.close()
+            with lock:
+                for name, values in local.items():
+                    latencies[name].extend(values)
+                errors.append(failures)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        database = settings.DATABASES["default"]
+        result = {
+            "engine": database["ENGINE"],
+            "conn_max_age": database.get("CONN_MAX_AGE", 0),
+            "journal_mode": (
+                settings.SMS_SQLITE_PRAGMAS.get("journal_mode")
+                if connection.vendor == "sqlite"
+                else None
+            ),
+            "threads": options["threads"],
+            "seconds": round(elapsed, 3),
+            "errors": sum(errors),
+            "operations": {},
+        }
+        total = 0
+        for name, values in latencies.items():
+            total += len(values)
+            if not values:
+                continue
+            values.sort()
+            result["operations"][name] = {
+                "count": len(values),
+                "per_second": round(len(values) / elapsed, 1),
+                "p50_ms": round(statistics.median(values) * 1000, 2),
+                "p95_ms": round(values[int(len(values) * 0.95) - 1] * 1000, 2),
+            }
+        result["per_second"] = round(total / elapsed, 1)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            "%(engine)s, CONN_MAX_AGE=%(conn_max_age)s, %(threads)d threads, "
+            "%(seconds)ss: %(per_second)s ops/s, %(errors)d errors" % result
+        )
+        for name, stats in result["operations"].items():
+            self.stdout.write(
+                "  %-8s %7d ops %9.1f/s  p50 %7.2fms  p95 %7.2fms"
+                % (
+                    name,
+                    stats["count"],
+                    stats["per_second"],
+                    stats["p50_ms"],
+                    stats["p95_ms"],
+                )
+            )
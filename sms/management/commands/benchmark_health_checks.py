@@ -0,0 +1,136 @@
+import asyncio
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from sms.healthchecks import ResultRecorder, run_checks
+from sms.models import HealthCheck
+
+# (path, criteria, share of the synthetic checks)
+SCENARIOS = [
+    ("/health", "status 200", 0.6),
+    ("/health", "status 2xx and body contains OK", 0.2),
+    ("/slow", "status 200; latency < 1s", 0.1),
+    ("/fail", "status 2xx", 0.05),
+    ("/health", "body does not contain OK", 0.05),
+]
+SLOW_RESPONSE_SECONDS = 0.05
+
+
+async def respond(reader, writer):
+    """
+    Stub endpoint: /health answers 200 OK, /slow the same after a delay and
+    /fail 500.
+    """
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.split()
+        path = parts[1].decode("latin-1") if len(parts) > 1 else "/"
+        if path.startswith("/slow"):
+            await asyncio.sleep(SLOW_RESPONSE_SECONDS)
+        status, body = ("500 Internal Server Error", b"FAIL")
+        if not path.startswith("/fail"):
+            status, body = ("200 OK", b"OK")
+        writer.write(
+            b"HTTP/1.1 %s\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n"
+            b"Connection: close\r\n\r\n%s" % (status.encode(), len(body), body)
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the health check runner against a local stub HTTP server with "
+        "synthetic checks and report its throughput. With --serve, just run "
+        "the stub server so stored checks can be pointed at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=10000)
+        parser.add_argument("--concurrency", type=int, default=100)
+        parser.add_argument(
+            "--per-host-rate",
+            type=float,
+            default=0,
+            help="Requests per second to the stub (one host); 0 for no limit.",
+        )
+        parser.add_argument("--timeout", type=float, default=5.0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--serve",
+            type=int,
+            metavar="PORT",
+            help="Serve the stub endpoints on 127.0.0.1:PORT until interrupted.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        if options["serve"]:
+            self.stdout.write(
+                "Serving /health, /slow and /fail on http://127.0.0.1:%d/"
+                % options["serve"]
+            )
+            try:
+                asyncio.run(self.serve(options["serve"]))
+            except KeyboardInterrupt:
+                pass
+            return
+
+        recorder = ResultRecorder()
+        started = time.monotonic()
+        cpu_started = time.process_time()
+        asyncio.run(self.benchmark(recorder, options))
+        result = recorder.summary(time.monotonic() - started)
+        result["cpu_seconds"] = round(time.process_time() - cpu_started, 3)
+        result["concurrency"] = options["concurrency"]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            "%(checks)d checks in %(seconds)ss (%(cpu_seconds)ss CPU, runner and "
+            "stub together), concurrency %(concurrency)d: %(per_minute)s/min" % result
+        )
+        self.stdout.write(
+            "  %(passed)d passed, %(failed)d failed, %(error)d errors; "
+            "latency p50 %(p50_ms)sms, p95 %(p95_ms)sms" % result
+        )
+        for bound, count in result["latency_histogram"].items():
+            self.stdout.write("  <= %6s ms  %d" % (bound, count))
+
+    async def serve(self, port):
+        server = await asyncio.start_server(respond, "127.0.0.1", port)
+        async with server:
+            await server.serve_forever()
+
+    async def benchmark(self, recorder, options):
+        server = await asyncio.start_server(respond, "127.0.0.1", 0, backlog=4096)
+        port = server.sockets[0].getsockname()[1]
+        scenarios = random.Random(options["seed"]).choices(
+            SCENARIOS,
+            weights=[share for _, _, share in SCENARIOS],
+            k=options["checks"],
+        )
+        probes = [
+            (
+                HealthCheck(endpoint=path, criteria=criteria),
+                "http://127.0.0.1:%d%s" % (port, path),
+            )
+            for path, criteria, _ in scenarios
+        ]
+        async with server:
+            await run_checks(
+                probes,
+                recorder.add,
+                concurrency=options["concurrency"],
+                per_host_rate=options["per_host_rate"],
+                timeout=options["timeout"],
+            )
@@ -0,0 +1,104 @@
+import base64
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Hit running servers with concurrent clients and report throughput and "
+        "latency, e.g. to compare the WSGI and ASGI serving paths."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="URLs to benchmark in turn.")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds.")
+        parser.add_argument("--user", help="HTTP Basic username.")
+        parser.add_argument("--password", default="")
+        parser.add_argument(
+            "--header",
+            action="append",
+            default=[],
+            help="Extra 'Name: value' request header (repeatable), e.g. a "
+            "session cookie, which avoids hashing a Basic password per request.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        headers = {"Accept": "application/json"}
+        for header in options["header"]:
+            name, _, value = header.partition(":")
+            headers[name.strip()] = value.strip()
+        if options["user"]:
+            credentials = "%s:%s" % (options["user"], options["password"])
+            headers["Authorization"] = "Basic " + base64.b64encode(
+                credentials.encode()
+            ).decode("ascii")
+
+        results = [self.run(url, headers, options) for url in options["urls"]]
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                "%(url)s\n  %(requests)d requests in %(seconds)ss: "
+                "%(per_second)s req/s, p50 %(p50_ms)sms, p95 %(p95_ms)sms, "
+                "%(errors)d errors" % result
+            )
+
+    def run(self, url, headers, options):
+        deadline = time.monotonic() + options["duration"]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def client():
+            local = []
+            failures = 0
+            while time.monotonic() < deadline:
+                request = urllib.request.Request(url, headers=headers)
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        response.read()
+                except (urllib.error.URLError, OSError):
+                    failures += 1
+                else:
+                    local.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(local)
+                errors.append(failures)
+
+        threads = [
+            threading.Thread(target=client) for _ in range(options["concurrency"])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+        return {
+            "url": url,
+            "concurrency": options["concurrency"],
+            "seconds": round(elapsed, 3),
+            "requests": len(latencies),
+            "errors": sum(errors),
+            "per_second": round(len(latencies) / elapsed, 1),
+            "p50_ms": (
+                round(statistics.median(latencies) * 1000, 2) if latencies else None
+            ),
+            "p95_ms": (
+                round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2)
+                if latencies
+                else None
+            ),
+        }
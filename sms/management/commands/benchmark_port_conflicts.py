@@ -0,0 +1,194 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from sms.models import Application, Port, ServiceSystem
+from sms.ports import conflict_keys, find_conflicts
+
+PORTS_PER_SYSTEM = 20
+APPLICATIONS_PER_SYSTEM = 4
+INSERT_BATCH_SIZE = 5000
+
+
+class Rollback(Exception):
+    pass
+
+
+def timed(function, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = function()
+        latencies.append(time.perf_counter() - started)
+    return result, latencies
+
+
+def milliseconds(latencies):
+    latencies = sorted(latencies)
+    return {
+        "runs": len(latencies),
+        "min_ms": round(latencies[0] * 1000, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the fleet-wide port conflict check on a synthetic fleet: insert "
+        "--ports ports with a known number of conflicts, run the detector, "
+        "verify what it found, then roll everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ports", type=int, default=1000000)
+        parser.add_argument(
+            "--conflict-every",
+            type=int,
+            default=100,
+            help="Give every Nth synthetic service system one conflict "
+            "(default: 100).",
+        )
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.sample = []
+        try:
+            with transaction.atomic():
+                result = self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            "%(engine)s, %(ports)d ports on %(service_systems)d service systems "
+            "(inserted in %(insert_seconds)ss)" % result
+        )
+        self.stdout.write(
+            "  conflicts: %(found)d found, %(expected)d expected" % result["conflicts"]
+        )
+        for name in ("scan", "report", "check_on_save"):
+            self.stdout.write(
+                "  %-14s %4d runs  min %8.2fms  p50 %8.2fms  max %8.2fms"
+                % (
+                    name,
+                    result[name]["runs"],
+                    result[name]["min_ms"],
+                    result[name]["p50_ms"],
+                    result[name]["max_ms"],
+                )
+            )
+
+    def run(self, options):
+        existing = conflict_keys(Port.objects.all()).count()
+        started = time.monotonic()
+        systems, seeded = self.populate(options["ports"], options["conflict_every"])
+        inserted = time.monotonic() - started
+        # Fresh statistics, so the planner sees the table it is timed on.
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE %s" % Port._meta.db_table)
+
+        queryset = Port.objects.all()
+        keys, scan = timed(lambda: list(conflict_keys(queryset)), options["runs"])
+        conflicts, report = timed(lambda: find_conflicts(queryset), options["runs"])
+        _, check = timed(
+            lambda: self.random.choice(self.sample).conflicting_ports().exists(), 200
+        )
+        return {
+            "engine": connection.settings_dict["ENGINE"],
+            "ports": queryset.count(),
+            "service_systems": systems,
+            "insert_seconds": round(inserted, 1),
+            "conflicts": {
+                "found": len(keys),
+                "expected": existing + seeded,
+                "ports": sum(len(ports) for ports in conflicts.values()),
+            },
+            "scan": milliseconds(scan),
+            "report": milliseconds(report),
+            "check_on_save": milliseconds(check),
+        }
+
+    def insert(self, ports):
+        Port.objects.bulk_create(ports)
+        # Ports to time the check on save with.
+        self.sample.append(self.random.choice(ports))
+
+    def populate(self, count, conflict_every):
+        """
+        Insert `count` ports on new service systems, one conflict on every
+        `conflict_every`th system; returns `(systems, conflicts)`.
+        """
+        total = -(-count // PORTS_PER_SYSTEM)
+        prefix = "benchmark-%d" % time.time_ns()
+        systems = []
+        for index in range(total):
+            system = ServiceSystem(
+                name="%s-%d" % (prefix, index),
+                description="",
+                location="dc%d" % (index % 4),
+                hostname="bench-%d" % index,
+                ip_address="10.%d.%d.%d"
+                % (index >> 16 & 255, index >> 8 & 255, index & 255),
+                operating_system="linux",
+                cpu_allocation="4",
+                ram_allocation="16GB",
+                disk_allocation="100GB",
+            )
+            system.refresh_derived()
+            systems.append(system)
+        ServiceSystem.objects.bulk_create(systems, batch_size=INSERT_BATCH_SIZE)
+
+        applications = [
+            Application(
+                service_system=system,
+                name="app-%d" % index,
+                version="1.0",
+                description="",
+            )
+            for system in systems
+            for index in range(APPLICATIONS_PER_SYSTEM)
+        ]
+        Application.objects.bulk_create(applications, batch_size=INSERT_BATCH_SIZE)
+
+        conflicts = 0
+        batch = []
+        remaining = count
+        for index, system in enumerate(systems):
+            owned = applications[
+                index * APPLICATIONS_PER_SYSTEM : (index + 1) * APPLICATIONS_PER_SYSTEM
+            ]
+            numbers = self.random.sample(range(1024, 65536), PORTS_PER_SYSTEM)
+            protocols = ["tcp"] * PORTS_PER_SYSTEM
+            if index % conflict_every == 0 and remaining > 1:
+                # Another application on the first port, spelled differently.
+                numbers[1], protocols[1] = numbers[0], "TCP"
+                conflicts += 1
+            for position, (number, protocol) in enumerate(zip(numbers, protocols)):
+                if remaining == 0:
+                    break
+                port = Port(
+                    service_system=system,
+                    application=owned[position % APPLICATIONS_PER_SYSTEM],
+                    port_number=number,
+                    protocol=protocol,
+                )
+                port.refresh_derived()
+                batch.append(port)
+                remaining -= 1
+            if len(batch) >= INSERT_BATCH_SIZE:
+                self.insert(batch)
+                batch = []
+        if batch:
+            self.insert(batch)
+        return len(systems), conflicts
@@ -0,0 +1,126 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from sms import crypto
+from sms.models import EnvironmentVariable, ServiceSystem
+from sms.serializers import EnvironmentVariableSerializer
+
+INSERT_BATCH_SIZE = 5000
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the encryption of environment variable values: encrypt --count "
+        "values under a throwaway key file, then decrypt them in one batch "
+        "(cold, then from the plaintext cache), one by one, and through the "
+        "API serializer. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000)
+        parser.add_argument("--runs", type=int, default=3)
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "keys.json")
+                crypto.add_key(path)
+                with override_settings(SMS_SECRETS_KEY_FILE=path), transaction.atomic():
+                    result = self.run(options["count"], options["runs"])
+                    raise Rollback
+        except Rollback:
+            pass
+        finally:
+            # The data keys were rolled back with the rest.
+            crypto.clear_caches()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            "%(engine)s, %(values)d values, plaintext cache of %(cache_size)d" % result
+        )
+        for name, case in result["cases"].items():
+            self.stdout.write(
+                "  %-14s p50 %9.2fms  %10d values/s"
+                % (name, case["p50_ms"], case["values_per_second"])
+            )
+
+    def run(self, count, runs):
+        service_system = ServiceSystem.objects.create(
+            name="benchmark-%d" % time.time_ns(),
+            description="",
+            location="",
+            hostname="benchmark",
+            ip_address="10.0.0.1",
+            operating_system="linux",
+            cpu_allocation="1",
+            ram_allocation="1GB",
+            disk_allocation="1GB",
+        )
+        # Data keys already stored are wrapped under other keys.
+        crypto.new_data_key()
+        plaintexts = ["secret-%08d" % index for index in range(count)]
+        cases = {}
+
+        def measure(name, function, cold=False):
+            latencies = []
+            for _ in range(runs):
+                if cold:
+                    crypto.clear_caches()
+                started = time.perf_counter()
+                function()
+                latencies.append(time.perf_counter() - started)
+            p50 = statistics.median(latencies)
+            cases[name] = {
+                "p50_ms": round(p50 * 1000, 2),
+                "values_per_second": int(count / p50) if p50 else 0,
+            }
+
+        measure("seal", lambda: [crypto.seal(value) for value in plaintexts])
+        EnvironmentVariable.objects.bulk_create(
+            [
+                EnvironmentVariable(
+                    service_system=service_system, name="VAR_%d" % index, value=value
+                )
+                for index, value in enumerate(plaintexts)
+            ],
+            batch_size=INSERT_BATCH_SIZE,
+        )
+        queryset = EnvironmentVariable.objects.filter(service_system=service_system)
+        rows = list(queryset.order_by("pk"))
+        tokens = [row.value for row in rows]
+        crypto.clear_caches()
+        if crypto.reveal_many(tokens) != plaintexts:
+            raise AssertionError("Decrypted values differ from the originals.")
+
+        measure("reveal_batch", lambda: crypto.reveal_many(tokens), cold=True)
+        measure("reveal_cached", lambda: crypto.reveal_many(tokens))
+        measure(
+            "reveal_each", lambda: [crypto.reveal(token) for token in tokens], cold=True
+        )
+        measure(
+            "serialize",
+            lambda: EnvironmentVariableSerializer(rows, many=True).data,
+            cold=True,
+        )
+        measure("mask", lambda: [crypto.masked(token) for token in tokens])
+        return {
+            "engine": connection.settings_dict["ENGINE"],
+            "values": count,
+            "cache_size": getattr(settings, "SMS_SECRETS_CACHE_SIZE", 10000),
+            "cases": cases,
+        }
@@ -0,0 +1,322 @@
+import fnmatch
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from sms import bulk, documents
+from sms.cache import build_entry
+from sms.importer import InventoryImporter
+from sms.models import ServiceSystem
+from sms.performance import QueryStats, budget_for
+from sms.search import search
+from sms.snapshot import snapshot_queryset
+
+# Service systems a bulk edit is applied to, and clones made per run.
+BULK_SYSTEMS = 100
+CLONES = 10
+# Environment variable rows upserted per import run.
+IMPORT_ROWS = 1000
+
+
+class Rollback(Exception):
+    pass
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Time and count the queries of the hot paths on the current data: "
+        "every admin changelist, the service system change page, snapshots, "
+        "search and bulk saves. Writes are rolled back. Results are JSON with "
+        "the commit they were measured on, so runs can be compared with "
+        "--compare. "
+        "Generate data with generate_fleet first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument(
+            "--case",
+            action="append",
+            default=[],
+            metavar="PATTERN",
+            help="Only run cases matching this shell-style pattern (repeatable).",
+        )
+        parser.add_argument("--output", metavar="FILE", help="Write the JSON here.")
+        parser.add_argument(
+            "--compare",
+            metavar="FILE",
+            help="Compare with the results of an earlier run; fail when a case "
+            "runs more queries or is slower than --tolerance times.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.5,
+            help="Slowdown of p50 allowed by --compare (default: 1.5).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        if not ServiceSystem.objects.exists():
+            raise CommandError(
+                "No service systems to benchmark; run generate_fleet first."
+            )
+        self.options = options
+        self.cases = {}
+        # Requests would otherwise close the connection, and with it the
+        # transaction the writes are rolled back in.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=["testserver"], SMS_PERFORMANCE_PANEL=False
+            ), transaction.atomic():
+                self.run()
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+        result = {
+            "commit": git_commit(),
+            "engine": connection.settings_dict["ENGINE"],
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "service_systems": ServiceSystem.objects.count(),
+            "runs": options["runs"],
+            "cases": self.cases,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2)
+        regressions = []
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline, options["tolerance"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+        else:
+            self.stdout.write(
+                "%(engine)s, %(service_systems)d service systems, commit "
+                "%(commit)s" % result
+            )
+            for name, case in self.cases.items():
+                self.stdout.write(
+                    "  %-52s %4d queries%s  p50 %8.2fms  max %8.2fms%s"
+                    % (
+                        name,
+                        case["queries"],
+                        (
+                            " (budget %d)" % case["budget"]
+                            if case.get("budget") is not None
+                            else ""
+                        ),
+                        case["p50_ms"],
+                        case["max_ms"],
+                        "  OVER BUDGET" if case.get("over_budget") else "",
+                    )
+                )
+        if regressions:
+            raise CommandError(
+                "Regressions against %s:\n  %s"
+                % (options["compare"], "\n  ".join(regressions))
+            )
+
+    def selected(self, name):
+        patterns = self.options["case"]
+        return not patterns or any(
+            fnmatch.fnmatchcase(name, pattern) for pattern in patterns
+        )
+
+    def measure(self, name, function):
+        """
+        Time `function` over --runs runs after a warm-up run, counting the
+        queries of the last one.
+        """
+        if not self.selected(name):
+            return
+        function()
+        latencies = []
+        for _ in range(self.options["runs"]):
+            with QueryStats().record() as stats:
+                started = time.perf_counter()
+                function()
+                latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        self.cases[name] = {
+            "queries": stats.count,
+            "db_ms": round(stats.seconds * 1000, 2),
+            "min_ms": round(latencies[0] * 1000, 2),
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+        return self.cases[name]
+
+    def measure_page(self, name, client, url, view):
+        def get():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError("%s answered %d." % (url, response.status_code))
+
+        case = self.measure(name, get)
+        if case is not None:
+            case["budget"] = budget_for(view)
+            case["over_budget"] = (
+                case["budget"] is not None and case["queries"] > case["budget"]
+            )
+
+    def run(self):
+        user = get_user_model().objects.create_superuser(
+            "benchmark-%d" % time.time_ns(), "", None
+        )
+        client = Client()
+        client.force_login(user)
+
+        for model in sorted(admin.site._registry, key=lambda model: model.__name__):
+            opts = model._meta
+            if opts.app_label != "sms":
+                continue
+            view = "admin:%s_%s_changelist" % (opts.app_label, opts.model_name)
+            self.measure_page(view, client, reverse(view), view)
+
+        # The largest host, by its rows in the busiest related table.
+        system = ServiceSystem.objects.order_by("-environmentvariable__id").first()
+        term = system.environmentvariable_set.values_list("name", flat=True).first()
+        view = "admin:sms_servicesystem_changelist"
+        self.measure_page(
+            "%s?q=%s" % (view, term), client, reverse(view) + "?q=" + term, view
+        )
+        view = "admin:sms_servicesystem_change"
+        url = reverse(view, args=[system.pk])
+        with override_settings(SMS_ADMIN_LAZY_INLINES=True):
+            self.measure_page(view + " (lazy)", client, url, view)
+        with override_settings(SMS_ADMIN_LAZY_INLINES=False):
+            self.measure_page(view + " (inlines)", client, url, view)
+        view = "admin:sms_servicesystem_related"
+        self.measure_page(
+            view + " (ports)",
+            client,
+            reverse(view, args=[system.pk, "port"]),
+            view,
+        )
+
+        self.measure(
+            "snapshot:tables",
+            lambda: build_entry(snapshot_queryset().get(pk=system.pk)),
+        )
+        documents.store([system.pk])
+        self.measure("snapshot:document", lambda: documents.load(system.pk))
+
+        for query in (term, system.hostname, "%s %s" % (term, system.location)):
+            self.measure(
+                "search:%s" % query,
+                lambda: list(search(ServiceSystem.objects.all(), query)[:100]),
+            )
+
+        systems = ServiceSystem.objects.order_by("pk")[:BULK_SYSTEMS]
+        values = iter(range(10**9))
+        self.measure(
+            "bulk:apply_change_set (%d systems)" % BULK_SYSTEMS,
+            lambda: bulk.apply_change_set(
+                ServiceSystem.objects.filter(pk__in=systems.values("pk")),
+                {
+                    "environment_variables": [
+                        {"name": term, "value": "benchmark-%d" % next(values)}
+                    ]
+                },
+            ),
+        )
+        self.measure(
+            "bulk:clone_service_system (%d clones)" % CLONES,
+            lambda: bulk.clone_service_system(
+                system,
+                [{"name": "benchmark-clone-%d" % next(values)} for _ in range(CLONES)],
+            ),
+        )
+        names = list(systems.values_list("name", flat=True))
+
+        def import_rows():
+            run = next(values)
+            importer = InventoryImporter()
+            importer.run(
+                (
+                    line,
+                    "environment_variables",
+                    {
+                        "service_system": names[line % len(names)],
+                        "name": "BENCHMARK_%d" % (line // len(names)),
+                        "value": str(run),
+                    },
+                )
+                for line in range(IMPORT_ROWS)
+            )
+            if importer.error_count:
+                raise CommandError("Import failed: %s" % importer.errors)
+
+        self.measure("bulk:import (%d rows)" % IMPORT_ROWS, import_rows)
+
+    def compare(self, baseline, tolerance):
+        regressions = []
+        if not self.options["json"]:
+            self.stdout.write("Compared with %s:" % baseline.get("commit"))
+        for name, case in self.cases.items():
+            before = baseline["cases"].get(name)
+            if before is None:
+                continue
+            ratio = case["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+            case["baseline"] = {
+                "queries": before["queries"],
+                "p50_ms": before["p50_ms"],
+                "ratio": round(ratio, 2),
+            }
+            problems = []
+            if case["queries"] > before["queries"]:
+                problems.append(
+                    "%d -> %d queries" % (before["queries"], case["queries"])
+                )
+            if ratio > tolerance:
+                problems.append("p50 %sms -> %sms" % (before["p50_ms"], case["p50_ms"]))
+            if problems:
+                regressions.append("%s: %s" % (name, ", ".join(problems)))
+            if not self.options["json"]:
+                self.stdout.write(
+                    "  %-52s %4d -> %4d queries  p50 x%.2f%s"
+                    % (
+                        name,
+                        before["queries"],
+                        case["queries"],
+                        ratio,
+                        "  REGRESSION" if problems else "",
+                    )
+                )
+        return regressions
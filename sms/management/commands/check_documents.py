@@ -0,0 +1,75 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from sms.documents import CHUNK_SIZE, check, orphans, store
+from sms.models import ServiceSystem
+
+# Ids listed per problem in the text output.
+SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare every stored service system document with one built from the "
+        "normalized tables. Fails on missing, stale or orphaned documents "
+        "unless --repair rebuilds them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Rebuild missing and stale documents and drop orphaned ones.",
+        )
+        parser.add_argument("--batch-size", type=int, default=CHUNK_SIZE * 10)
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        ids = ServiceSystem.objects.order_by("pk").values_list("pk", flat=True)
+        result = {
+            "checked": 0,
+            "missing": [],
+            "stale": [],
+            "orphaned": list(orphans().order_by("pk").values_list("pk", flat=True)),
+        }
+        last = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last)[: options["batch_size"]])
+            if not batch:
+                break
+            missing, stale = check(batch)
+            result["checked"] += len(batch)
+            result["missing"] += missing
+            result["stale"] += stale
+            last = batch[-1]
+
+        problems = result["missing"] or result["stale"] or result["orphaned"]
+        if problems and options["repair"]:
+            with transaction.atomic():
+                orphans().delete()
+                store(result["missing"] + result["stale"])
+            result["repaired"] = True
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+        else:
+            self.stdout.write("Checked %(checked)d service systems." % result)
+            for problem in ("missing", "stale", "orphaned"):
+                if result[problem]:
+                    shown = ", ".join(map(str, result[problem][:SHOWN]))
+                    more = len(result[problem]) - SHOWN
+                    self.stdout.write(
+                        "  %s: %d (%s%s)"
+                        % (
+                            problem,
+                            len(result[problem]),
+                            shown,
+                            ", ... %d more" % more if more > 0 else "",
+                        )
+                    )
+            if result.get("repaired"):
+                self.stdout.write("Repaired.")
+        if problems and not options["repair"]:
+            raise CommandError("Documents are out of step with the tables.")
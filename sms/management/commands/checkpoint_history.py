@@ -0,0 +1,58 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from sms.history import checkpoint, due_for_checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Checkpoint the configuration of every service system with at least "
+        "--every changes since its last checkpoint, so point-in-time reads "
+        "replay at most that many. With --interval, keep running and "
+        "checkpoint every so many seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=settings.SMS_HISTORY_CHECKPOINT_EVERY,
+            help="Changes between checkpoints (default: %(default)s).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            metavar="SECONDS",
+            help="Checkpoint again every SECONDS until interrupted.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.checkpoint(options)
+                if not options["interval"]:
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def checkpoint(self, options):
+        started = time.monotonic()
+        ids = list(due_for_checkpoint(options["every"]))
+        for service_system_id in ids:
+            checkpoint(service_system_id)
+        result = {
+            "service_systems": len(ids),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+        elif ids or not options["interval"]:
+            self.stdout.write(
+                "Checkpointed %(service_systems)d service systems in %(seconds)ss"
+                % result
+            )
@@ -0,0 +1,100 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sms import drift
+from sms.models import VersionSummary
+from sms.views import VERSIONED_MODELS, drift_entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the version distribution of dependencies, applications and "
+        "tools across the fleet, and the hosts behind the newest version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            choices=sorted(VERSIONED_MODELS),
+            help="Only report this model.",
+        )
+        parser.add_argument(
+            "--stale", action="store_true", help="Only names with hosts behind."
+        )
+        parser.add_argument(
+            "--behind",
+            metavar="NAME",
+            help="List the hosts behind the newest version of NAME (needs --model).",
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Rebuild the version summaries from scratch first.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        models = VERSIONED_MODELS
+        if options["model"]:
+            models = {options["model"]: VERSIONED_MODELS[options["model"]]}
+        if options["refresh"]:
+            for model in models.values():
+                VersionSummary.refresh(model)
+        if options["behind"]:
+            if not options["model"]:
+                raise CommandError("--behind needs --model.")
+            return self.behind(models[options["model"]], options)
+
+        summaries = VersionSummary.objects.filter(
+            model__in=[model._meta.model_name for model in models.values()]
+        ).order_by("model", "name")
+        entries = drift_entries(summaries)
+        if options["stale"]:
+            entries = [entry for entry in entries if entry["behind"]]
+        if options["json"]:
+            self.stdout.write(json.dumps(entries, indent=2))
+            return
+        for entry in entries:
+            self.stdout.write(
+                "%s %s: latest %s on %d/%d hosts%s"
+                % (
+                    entry["model"],
+                    entry["name"],
+                    entry["latest"],
+                    entry["service_systems"] - entry["behind"],
+                    entry["service_systems"],
+                    "".join(
+                        "; %s on %d" % (version["version"], version["service_systems"])
+                        for version in entry["versions"]
+                        if not version["latest"]
+                    ),
+                )
+            )
+
+    def behind(self, model, options):
+        summaries = list(
+            VersionSummary.objects.filter(
+                model=model._meta.model_name, name=options["behind"]
+            )
+        )
+        if not summaries:
+            raise CommandError(
+                "No %s named %r." % (options["model"], options["behind"])
+            )
+        hosts = drift.hosts_behind(
+            model.objects.filter(name=options["behind"]), summaries
+        )
+        if options["json"]:
+            self.stdout.write(
+                json.dumps(
+                    [
+                        {"id": pk, "name": name, "version": version}
+                        for pk, name, version in hosts
+                    ],
+                    indent=2,
+                )
+            )
+            return
+        for _, name, version in hosts:
+            self.stdout.write("%s\t%s" % (name, version))
@@ -0,0 +1,80 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sms.fleet import ROWS_PER_SYSTEM, generate_fleet
+from sms.models import ServiceSystem
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert a synthetic fleet: --systems service systems named "
+        "<prefix>-<n>, each with a realistic spread of rows in every related "
+        "model, for benchmarks and load tests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--systems", type=int, default=10000)
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1.0,
+            help="Multiply the related rows per system (%s)."
+            % ", ".join("%s %d" % item for item in ROWS_PER_SYSTEM.items()),
+        )
+        parser.add_argument("--prefix", default="fleet")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete the fleet named by --prefix instead.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        existing = ServiceSystem.objects.filter(
+            name__startswith=options["prefix"] + "-"
+        )
+        if options["delete"]:
+            deleted, _ = existing.delete()
+            self.stdout.write(
+                "Deleted %d service systems; purge_deleted removes their rows."
+                % deleted
+            )
+            return
+        if existing.exists():
+            raise CommandError(
+                "Service systems named %s-* exist; pick another --prefix or "
+                "--delete them first." % options["prefix"]
+            )
+
+        def progress(done):
+            if not options["json"]:
+                self.stdout.write(
+                    "  %d/%d service systems" % (done, options["systems"])
+                )
+
+        totals, seconds = generate_fleet(
+            options["systems"],
+            prefix=options["prefix"],
+            scale=options["scale"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            progress=progress,
+        )
+        rows = sum(totals.values())
+        result = {
+            "rows": rows,
+            "seconds": round(seconds, 3),
+            "per_second": round(rows / seconds) if seconds else None,
+            "models": totals,
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            "%(rows)d rows in %(seconds)ss (%(per_second)s rows/s)" % result
+        )
+        for name, count in totals.items():
+            self.stdout.write("  %-24s %9d" % (name, count))
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sms.importer import InventoryImporter, open_input, read_csv, read_jsonl
+from sms.serializers import INVENTORY_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream inventory rows from a JSON Lines or CSV file (optionally "
+        "gzipped) into the database in validated, transactional batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for stdin.")
+        parser.add_argument(
+            "--format",
+            choices=("jsonl", "csv"),
+            help="Input format. Guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--model",
+            choices=sorted(INVENTORY_MODELS),
+            help="Model of every row. Required for CSV; the default for JSON "
+            "Lines rows without a 'model' key.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows validated and written per transaction (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"]
+        if input_format is None:
+            name = path[:-3] if path.endswith(".gz") else path
+            input_format = "csv" if name.endswith(".csv") else "jsonl"
+        if input_format == "csv" and not options["model"]:
+            raise CommandError("--model is required for CSV input.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        importer = InventoryImporter(
+            batch_size=options["batch_size"],
+            progress=self.progress if options["verbosity"] > 1 else None,
+        )
+        try:
+            stream = open_input(path)
+        except OSError as e:
+            raise CommandError(e)
+        with stream:
+            if input_format == "csv":
+                records = read_csv(stream, options["model"])
+            else:
+                records = read_jsonl(stream, options["model"])
+            importer.run(records)
+
+        for line, message in importer.errors:
+            self.stderr.write("line %s: %s" % (line, message))
+        if importer.error_count > len(importer.errors):
+            self.stderr.write(
+                "... and %d more errors" % (importer.error_count - len(importer.errors))
+            )
+        self.stdout.write(
+            "Processed %d rows in %.2fs (%.0f rows/s): %d created, %d updated, "
+            "%d unchanged, %d rejected."
+            % (
+                importer.rows,
+                importer.elapsed,
+                importer.rate,
+                importer.created,
+                importer.updated,
+                importer.unchanged,
+                importer.error_count,
+            )
+        )
+
+    def progress(self, importer):
+        self.stdout.write("%d rows, %.0f rows/s" % (importer.rows, importer.rate))
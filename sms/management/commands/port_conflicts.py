@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sms.models import Port
+from sms.ports import conflict_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Report ports of the same service system claiming the same port number "
+        "and protocol, across the whole fleet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--service-system",
+            action="append",
+            default=[],
+            metavar="NAME",
+            help="Only check this service system (repeatable).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+        parser.add_argument(
+            "--fail",
+            action="store_true",
+            help="Exit with an error status if there are conflicts.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Port.objects.all()
+        if options["service_system"]:
+            queryset = queryset.filter(
+                service_system__name__in=options["service_system"]
+            )
+        conflicts = conflict_report(queryset)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(conflicts, indent=2))
+        else:
+            for conflict in conflicts:
+                self.stdout.write(
+                    "%s %s/%s: %s"
+                    % (
+                        conflict["service_system"]["name"],
+                        conflict["protocol"],
+                        conflict["port_number"],
+                        ", ".join(
+                            "%s (port %d)" % (port["application"]["name"], port["id"])
+                            for port in conflict["ports"]
+                        ),
+                    )
+                )
+            self.stdout.write("%d port conflicts." % len(conflicts))
+        if conflicts and options["fail"]:
+            raise CommandError("%d port conflicts." % len(conflicts))
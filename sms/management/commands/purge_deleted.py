@@ -0,0 +1,76 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sms.purge import purge
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove deleted service systems and their rows in small batches, each "
+        "in its own transaction. With --interval, keep running and purge "
+        "every so many seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=float,
+            default=0,
+            metavar="SECONDS",
+            help="Only purge systems deleted at least this long ago.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per DELETE (default: 1000).",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            metavar="SECONDS",
+            help="Sleep between batches to leave other writers room.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            metavar="SECONDS",
+            help="Purge again every SECONDS until interrupted.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.purge(options)
+                if not options["interval"]:
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def purge(self, options):
+        started = time.monotonic()
+        counts = purge(
+            older_than=timezone.now() - timedelta(seconds=options["older_than"]),
+            batch_size=options["batch_size"],
+            pause=options["pause"],
+        )
+        result = {
+            "rows": sum(counts.values()),
+            "seconds": round(time.monotonic() - started, 3),
+            "models": dict(sorted(counts.items())),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+            return
+        if not result["rows"] and options["interval"]:
+            return
+        self.stdout.write("Purged %(rows)d rows in %(seconds)ss" % result)
+        for label, count in result["models"].items():
+            self.stdout.write("  %-28s %9d" % (label, count))
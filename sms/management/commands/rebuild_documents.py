@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sms.documents import CHUNK_SIZE, orphans, store
+from sms.models import ServiceSystem
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the denormalized document of every service system from the "
+        "normalized tables. Run it after turning SMS_SERVICE_SYSTEM_DOCUMENTS "
+        "on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=CHUNK_SIZE * 10,
+            help="Service systems per transaction (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        ids = ServiceSystem.objects.order_by("pk").values_list("pk", flat=True)
+        batch_size = options["batch_size"]
+        count = 0
+        with transaction.atomic():
+            orphans().delete()
+        last = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                store(batch)
+            count += len(batch)
+            last = batch[-1]
+        self.stdout.write("Stored %d service system documents." % count)
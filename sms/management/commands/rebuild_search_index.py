@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sms.models import SearchDocument, ServiceSystem
+from sms.search import index_service_systems
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search documents of every service system."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = ServiceSystem.objects.order_by("pk").values_list("pk", flat=True)
+        batch_size = options["batch_size"]
+        count = 0
+        with transaction.atomic():
+            SearchDocument.objects.exclude(service_system__in=ids).delete()
+        last = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                index_service_systems(batch)
+            count += len(batch)
+            last = batch[-1]
+        self.stdout.write("Indexed %d service systems." % count)
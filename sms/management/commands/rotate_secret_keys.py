@@ -0,0 +1,79 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from sms import crypto
+from sms.serializers import INVENTORY_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Rotate the keys encrypting environment variable values. Data keys "
+        "are rewrapped under the key file's current key, after which older "
+        "keys can be removed from the file. --new-key adds a key to the file "
+        "(creating it) and makes it current; --new-data-key starts a data key "
+        "for new values; --reencrypt rewrites every value not encrypted "
+        "under the current data key, plaintext ones included, and encrypts "
+        "the values history kept in plaintext."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--new-key",
+            action="store_true",
+            help="Add a key-encryption key to the key file and make it current.",
+        )
+        parser.add_argument(
+            "--new-data-key",
+            action="store_true",
+            help="Encrypt new values under a new data key.",
+        )
+        parser.add_argument(
+            "--reencrypt",
+            action="store_true",
+            help="Re-encrypt values under the current data key.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows per transaction when re-encrypting (default: %(default)s).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        if not crypto.enabled():
+            raise CommandError("Set SMS_SECRETS_KEY_FILE to encrypt values.")
+        result = {}
+        try:
+            if options["new_key"]:
+                result["key"] = crypto.add_key(settings.SMS_SECRETS_KEY_FILE)
+            result["rewrapped"] = crypto.rewrap_data_keys()
+            if options["new_data_key"]:
+                result["data_key"] = crypto.new_data_key().pk
+            if options["reencrypt"]:
+                result["reencrypted"] = {
+                    name: crypto.reencrypt_rows(model, options["batch_size"])
+                    for name, model in INVENTORY_MODELS.items()
+                    if crypto.sealed_fields(model)
+                }
+                result["history"] = crypto.seal_history(options["batch_size"])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        if options["json"]:
+            self.stdout.write(json.dumps(result))
+            return
+        if "key" in result:
+            self.stdout.write("Added key %s to the key file." % result["key"])
+        self.stdout.write("Rewrapped %d data keys." % result["rewrapped"])
+        if "data_key" in result:
+            self.stdout.write("Started data key %d." % result["data_key"])
+        for name, count in result.get("reencrypted", {}).items():
+            self.stdout.write("Re-encrypted %d %s." % (count, name.replace("_", " ")))
+        if "history" in result:
+            self.stdout.write(
+                "Encrypted the plaintext values of %d history records."
+                % result["history"]
+            )
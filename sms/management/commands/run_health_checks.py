@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sms.healthchecks import ResultRecorder, endpoint_url, run_checks
+from sms.models import HealthCheck, HealthCheckRun
+
+
+class Command(BaseCommand):
+    help = (
+        "Probe the stored health check endpoints concurrently, evaluate their "
+        "criteria and record the results as a new health check run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--service-system",
+            action="append",
+            default=[],
+            metavar="NAME",
+            help="Only run this service system's checks (repeatable).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=100,
+            help="Requests in flight at once (default: 100).",
+        )
+        parser.add_argument(
+            "--per-host-rate",
+            type=float,
+            default=2.0,
+            help="Requests per second to any one host, 0 for no limit (default: 2).",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=5.0, help="Seconds per request."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Results per database insert (default: 500).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print JSON only.")
+
+    def handle(self, *args, **options):
+        checks = HealthCheck.objects.select_related("service_system").only(
+            "endpoint", "criteria", "service_system__ip_address"
+        )
+        if options["service_system"]:
+            checks = checks.filter(service_system__name__in=options["service_system"])
+        probes = [
+            (check, endpoint_url(check.endpoint, check.service_system))
+            for check in checks
+        ]
+        if not probes:
+            raise CommandError("No health checks to run.")
+
+        run = HealthCheckRun.objects.create(started_at=timezone.now())
+        recorder = ResultRecorder(run, options["batch_size"])
+        started = time.monotonic()
+        asyncio.run(self.probe(probes, recorder, options))
+        elapsed = time.monotonic() - started
+        recorder.finish()
+
+        result = {"run": run.pk, **recorder.summary(elapsed)}
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            "Run %(run)d: %(checks)d checks in %(seconds)ss (%(per_minute)s/min): "
+            "%(passed)d passed, %(failed)d failed, %(error)d errors" % result
+        )
+        if result["p50_ms"] is not None:
+            self.stdout.write("  latency p50 %(p50_ms)sms, p95 %(p95_ms)sms" % result)
+        for bound, count in result["latency_histogram"].items():
+            self.stdout.write("  <= %6s ms  %d" % (bound, count))
+
+    async def probe(self, probes, recorder, options):
+        await run_checks(
+            probes,
+            recorder.add,
+            concurrency=options["concurrency"],
+            per_host_rate=options["per_host_rate"],
+            timeout=options["timeout"],
+        )
+        await recorder.flush()
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.utils.encoders import JSONEncoder
+
+from sms.cache import build_entry, stored_entry
+from sms.crypto import reveal_snapshot
+from sms.models import ServiceSystem
+from sms.renderers import YAMLRenderer, yaml
+from sms.snapshot import snapshot_queryset
+
+
+class Command(BaseCommand):
+    help = "Export the complete configuration of one service system."
+
+    def add_arguments(self, parser):
+        parser.add_argument("service_system", help="Service system name or id.")
+        parser.add_argument("--format", choices=("json", "yaml"), default="json")
+        parser.add_argument("--output", "-o", help="Write to a file instead of stdout.")
+
+    def handle(self, *args, **options):
+        lookup = options["service_system"]
+        queryset = ServiceSystem.objects.values_list("pk", flat=True)
+        try:
+            if lookup.isdigit():
+                pk = queryset.get(pk=lookup)
+            else:
+                pk = queryset.get(name=lookup)
+        except ServiceSystem.DoesNotExist:
+            raise CommandError("Service system %r does not exist." % lookup)
+
+        entry = stored_entry(pk) or build_entry(snapshot_queryset().get(pk=pk))
+        data, version = reveal_snapshot(entry.data), entry.version
+        if options["format"] == "yaml":
+            if yaml is None:
+                raise CommandError("YAML output requires PyYAML.")
+            document = YAMLRenderer().render(data).decode()
+        else:
+            document = json.dumps(data, cls=JSONEncoder, indent=2) + "\n"
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(document)
+            self.stderr.write("Wrote %s (version %s)" % (options["output"], version))
+        else:
+            self.stdout.write(document, ending="")
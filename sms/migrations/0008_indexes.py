@@ -0,0 +1,165 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0007_alter_dependency_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_applica_updated_ef4dc7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_applica_service_2a130f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='backupconfiguration',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_backupc_updated_2986b6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='backupconfiguration',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_backupc_service_06f101_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='configurationfile',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_configu_updated_eb616f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='configurationfile',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_configu_service_460372_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='containerization',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_contain_updated_94d1ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='containerization',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_contain_service_9e291d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dependency',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_depende_updated_d6a7c3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dependency',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_depende_service_ccfd3f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deploymenttool',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_deploym_updated_928f0c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deploymenttool',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_deploym_service_ccf33e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disasterrecovery',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_disaste_updated_1af57e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disasterrecovery',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_disaste_service_fe89ef_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='environmentvariable',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_environ_updated_48dff1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='environmentvariable',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_environ_service_c72246_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthcheck',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_healthc_updated_811944_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthcheck',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_healthc_service_3e9692_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggingconfiguration',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_logging_updated_bf9ec2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggingconfiguration',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_logging_service_26be5d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monitoringtool',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_monitor_updated_7445c1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monitoringtool',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_monitor_service_da3a95_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='networkconfiguration',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_network_updated_d35bf8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='networkconfiguration',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_network_service_4e00bf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='port',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_port_updated_8cd1f9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='port',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_port_service_43867b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='port',
+            index=models.Index(fields=['application', 'port_number', 'protocol'], name='sms_port_applica_595300_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runbook',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_runbook_updated_d07445_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runbook',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_runbook_service_58be3e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scalingconfiguration',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_scaling_updated_ad25cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scalingconfiguration',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_scaling_service_3fe0ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_service_updated_d8d79e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['created_at'], name='sms_service_created_c2db53_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['hostname'], name='sms_service_hostnam_3668fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['ip_address'], name='sms_service_ip_addr_f9b94f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['location'], name='sms_service_locatio_8932a9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpermission',
+            index=models.Index(fields=['updated_at', 'id'], name='sms_userper_updated_3adbb2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpermission',
+            index=models.Index(fields=['service_system', 'updated_at'], name='sms_userper_service_4305c5_idx'),
+        ),
+    ]
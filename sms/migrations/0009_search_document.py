@@ -0,0 +1,96 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:44
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The index as of this migration, written out so later changes to sms.search
+# do not change what the migration does.
+FTS_TABLE = 'sms_searchdocument_fts'
+SETUP = {
+    'sqlite': (
+        'CREATE VIRTUAL TABLE {fts} USING fts5('
+        "content, content='sms_searchdocument', content_rowid='service_system_id')",
+        'CREATE TRIGGER {fts}_ai AFTER INSERT ON sms_searchdocument BEGIN '
+        'INSERT INTO {fts}(rowid, content) '
+        'VALUES (new.service_system_id, new.content); END',
+        'CREATE TRIGGER {fts}_ad AFTER DELETE ON sms_searchdocument BEGIN '
+        'INSERT INTO {fts}({fts}, rowid, content) '
+        "VALUES ('delete', old.service_system_id, old.content); END",
+        'CREATE TRIGGER {fts}_au AFTER UPDATE ON sms_searchdocument BEGIN '
+        'INSERT INTO {fts}({fts}, rowid, content) '
+        "VALUES ('delete', old.service_system_id, old.content); "
+        'INSERT INTO {fts}(rowid, content) '
+        'VALUES (new.service_system_id, new.content); END',
+    ),
+    'postgresql': (
+        'CREATE INDEX sms_searchdocument_content_gin ON sms_searchdocument '
+        "USING gin (to_tsvector('simple', content))",
+    ),
+}
+TEARDOWN = {
+    'sqlite': (
+        'DROP TRIGGER IF EXISTS {fts}_ai',
+        'DROP TRIGGER IF EXISTS {fts}_ad',
+        'DROP TRIGGER IF EXISTS {fts}_au',
+        'DROP TABLE IF EXISTS {fts}',
+    ),
+    'postgresql': ('DROP INDEX IF EXISTS sms_searchdocument_content_gin',),
+}
+
+
+def execute(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement.format(fts=FTS_TABLE))
+
+
+def tokenize(text):
+    return re.findall(r'[^\W_]+', text)
+
+
+def build_search_index(apps, schema_editor):
+    execute(schema_editor, SETUP)
+    ServiceSystem = apps.get_model('sms', 'ServiceSystem')
+    SearchDocument = apps.get_model('sms', 'SearchDocument')
+    related = [
+        (apps.get_model('sms', 'EnvironmentVariable'), 'name'),
+        (apps.get_model('sms', 'Dependency'), 'name'),
+        (apps.get_model('sms', 'Application'), 'name'),
+        (apps.get_model('sms', 'ConfigurationFile'), 'file_path'),
+    ]
+    documents = {
+        row[0]: list(row[1:])
+        for row in ServiceSystem.objects.values_list(
+            'pk', 'name', 'location', 'hostname', 'ip_address', 'operating_system'
+        )
+    }
+    for model, field in related:
+        for service_system_id, value in model.objects.values_list('service_system', field):
+            documents[service_system_id].append(value)
+    SearchDocument.objects.bulk_create(
+        SearchDocument(service_system_id=pk, content=' '.join(tokenize(' '.join(parts))))
+        for pk, parts in documents.items()
+    )
+
+
+def drop_index(apps, schema_editor):
+    execute(schema_editor, TEARDOWN)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0008_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('service_system', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='sms.servicesystem')),
+                ('content', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(build_search_index, drop_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0009_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('model', models.CharField(max_length=64)),
+                ('object_id', models.BigIntegerField()),
+                ('service_system_id', models.BigIntegerField()),
+                ('operation', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=6)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service_system_id', 'id'], name='sms_changel_service_fb0741_idx')],
+            },
+        ),
+    ]
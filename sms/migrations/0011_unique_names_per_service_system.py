@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0010_change_log'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='application',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='dependency',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='deploymenttool',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='environmentvariable',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='monitoringtool',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='application',
+            constraint=models.UniqueConstraint(fields=('service_system', 'name'), name='sms_application_unique_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='dependency',
+            constraint=models.UniqueConstraint(fields=('service_system', 'name'), name='sms_dependency_unique_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='deploymenttool',
+            constraint=models.UniqueConstraint(fields=('service_system', 'name'), name='sms_deploymenttool_unique_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='environmentvariable',
+            constraint=models.UniqueConstraint(fields=('service_system', 'name'), name='sms_environmentvariable_unique_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='monitoringtool',
+            constraint=models.UniqueConstraint(fields=('service_system', 'name'), name='sms_monitoringtool_unique_name'),
+        ),
+    ]
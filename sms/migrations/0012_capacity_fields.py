@@ -0,0 +1,125 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:58
+
+import re
+from decimal import ROUND_CEILING, Decimal
+
+from django.db import migrations, models
+
+# Copy of sms.capacity as of this migration, which must not change with it.
+NUMBER = r'(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)'
+CORES_RE = re.compile(
+    NUMBER + r'(?:\s*[x×*]\s*' + NUMBER + r')?\s*(?:v?cpus?|v?cores?|threads?)?'
+)
+BYTES_RE = re.compile(
+    NUMBER + r'\s*(?:([kmgtpe])(?:i|ilo|ega|iga|era|eta|xa)?)?(b|bytes?)?'
+)
+PREFIXES = 'kmgtpe'
+DEFAULT_SIZE_UNIT = 1024**3
+MAX_CORES = 2**31 - 1
+MAX_BYTES = 2**63 - 1
+
+
+def number(text):
+    return Decimal(text.replace(',', ''))
+
+
+def in_range(value, maximum):
+    value = int(value.to_integral_value(ROUND_CEILING))
+    return value if value <= maximum else None
+
+
+def parse_cores(value):
+    match = CORES_RE.fullmatch((value or '').strip().lower())
+    if match is None:
+        return None
+    count, multiplier = match.groups()
+    return in_range(number(count) * number(multiplier or '1'), MAX_CORES)
+
+
+def parse_bytes(value):
+    match = BYTES_RE.fullmatch((value or '').strip().lower())
+    if match is None:
+        return None
+    size, prefix, unit = match.groups()
+    if prefix:
+        multiplier = 1024 ** (PREFIXES.index(prefix) + 1)
+    elif unit:
+        multiplier = 1
+    else:
+        multiplier = DEFAULT_SIZE_UNIT
+    return in_range(number(size) * multiplier, MAX_BYTES)
+
+
+CAPACITY_FIELDS = {
+    'cpu_allocation': ('cpu_cores', parse_cores),
+    'ram_allocation': ('ram_bytes', parse_bytes),
+    'disk_allocation': ('disk_bytes', parse_bytes),
+}
+
+
+def capacity_values(values):
+    return {
+        column: parse(values[source])
+        for source, (column, parse) in CAPACITY_FIELDS.items()
+        if source in values
+    }
+
+
+def parse_capacity(apps, schema_editor):
+    ServiceSystem = apps.get_model('sms', 'ServiceSystem')
+    queryset = ServiceSystem.objects.only(
+        'cpu_allocation', 'ram_allocation', 'disk_allocation'
+    ).order_by('pk')
+    batch = []
+    for service_system in queryset.iterator(chunk_size=2000):
+        values = capacity_values({
+            'cpu_allocation': service_system.cpu_allocation,
+            'ram_allocation': service_system.ram_allocation,
+            'disk_allocation': service_system.disk_allocation,
+        })
+        for name, value in values.items():
+            setattr(service_system, name, value)
+        batch.append(service_system)
+        if len(batch) == 500:
+            ServiceSystem.objects.bulk_update(batch, list(values), batch_size=100)
+            batch = []
+    if batch:
+        ServiceSystem.objects.bulk_update(batch, list(values), batch_size=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0011_unique_names_per_service_system'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='servicesystem',
+            name='sms_service_locatio_8932a9_idx',
+        ),
+        migrations.AddField(
+            model_name='servicesystem',
+            name='cpu_cores',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='servicesystem',
+            name='disk_bytes',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='servicesystem',
+            name='ram_bytes',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['location', 'cpu_cores', 'ram_bytes', 'disk_bytes'], name='sms_servicesystem_capacity'),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['cpu_cores'], name='sms_service_cpu_cor_51ad19_idx'),
+        ),
+        migrations.RunPython(parse_capacity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:01
+
+import ipaddress
+
+from django.db import migrations, models
+
+# Copy of the address keys of sms.network as of this migration, which must
+# not change with it.
+IPV4_MAPPED = 0xFFFF << 32
+
+
+def to_key(address):
+    value = int(address)
+    if address.version == 4:
+        value |= IPV4_MAPPED
+    return '%032x' % value
+
+
+def address_key(value):
+    try:
+        return to_key(ipaddress.ip_address(str(value).strip()))
+    except ValueError:
+        return None
+
+
+def is_netmask(value):
+    try:
+        address = ipaddress.IPv4Address(value)
+    except ValueError:
+        return False
+    inverted = ~int(address) & 0xFFFFFFFF
+    return inverted & (inverted + 1) == 0
+
+
+def parse_network(subnet, gateway=''):
+    subnet = (subnet or '').strip()
+    gateway = (gateway or '').strip()
+    if is_netmask(subnet):
+        subnet = '%s/%s' % (gateway, subnet) if gateway else ''
+    try:
+        return ipaddress.ip_network(subnet, strict=False)
+    except ValueError:
+        return None
+
+
+def network_range(network):
+    return to_key(network.network_address), to_key(network.broadcast_address)
+
+
+def backfill(queryset, columns, compute):
+    batch = []
+    for instance in queryset.order_by('pk').iterator(chunk_size=2000):
+        for name, value in compute(instance).items():
+            setattr(instance, name, value)
+        batch.append(instance)
+        if len(batch) == 500:
+            queryset.model.objects.bulk_update(batch, columns, batch_size=100)
+            batch = []
+    if batch:
+        queryset.model.objects.bulk_update(batch, columns, batch_size=100)
+
+
+def subnet_range(configuration):
+    network = parse_network(configuration.subnet, configuration.gateway)
+    start, end = network_range(network) if network else (None, None)
+    return {'subnet_start': start, 'subnet_end': end}
+
+
+def build_network_index(apps, schema_editor):
+    ServiceSystem = apps.get_model('sms', 'ServiceSystem')
+    NetworkConfiguration = apps.get_model('sms', 'NetworkConfiguration')
+    backfill(
+        ServiceSystem.objects.only('ip_address'),
+        ['ip_key'],
+        lambda system: {'ip_key': address_key(system.ip_address)},
+    )
+    backfill(
+        NetworkConfiguration.objects.only('subnet', 'gateway'),
+        ['subnet_start', 'subnet_end'],
+        subnet_range,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0012_capacity_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networkconfiguration',
+            name='subnet_end',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='networkconfiguration',
+            name='subnet_start',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='servicesystem',
+            name='ip_key',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='networkconfiguration',
+            index=models.Index(fields=['subnet_start', 'subnet_end'], name='sms_network_subnet__a41542_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['ip_key'], name='sms_service_ip_key_63880e_idx'),
+        ),
+        migrations.RunPython(build_network_index, migrations.RunPython.noop),
+    ]
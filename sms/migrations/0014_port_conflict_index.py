@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+# Copy of sms.ports.normalize_protocol as of this migration, which must not
+# change with it.
+def normalize_protocol(value):
+    return (value or '').strip().lower()
+
+
+def normalize_protocols(apps, schema_editor):
+    Port = apps.get_model('sms', 'Port')
+    # A handful of protocol spellings cover every port: one UPDATE each.
+    protocols = Port.objects.order_by().values_list('protocol', flat=True).distinct()
+    for protocol in list(protocols):
+        Port.objects.filter(protocol=protocol).update(
+            protocol_key=normalize_protocol(protocol)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0013_network_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='port',
+            name='protocol_key',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(normalize_protocols, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='port',
+            index=models.Index(
+                fields=['service_system', 'port_number', 'protocol_key'],
+                name='sms_port_conflict',
+            ),
+        ),
+    ]
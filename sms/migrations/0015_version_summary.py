@@ -0,0 +1,97 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:15
+
+import re
+
+from django.db import migrations, models
+from django.db.models import Count
+
+VERSIONED_MODELS = ['Application', 'Dependency', 'DeploymentTool', 'MonitoringTool']
+
+# Copy of sms.drift.version_key and summarize as of this migration, which
+# must not change with them.
+VERSION_TOKEN_RE = re.compile(r'\d+|[a-z]+')
+
+
+def version_key(version):
+    tokens = VERSION_TOKEN_RE.findall((version or '').strip().lower().lstrip('v'))
+    return (
+        *((2, int(token)) if token.isdigit() else (0, token) for token in tokens),
+        (1, 0),
+    )
+
+
+def summarize(queryset):
+    counts = (
+        queryset.values_list('name', 'version')
+        .annotate(count=Count('pk'))
+        .order_by('name')
+    )
+    versions = {}
+    for name, version, count in counts:
+        versions.setdefault(name, []).append((version, count))
+    for name, counted in versions.items():
+        latest = max(version_key(version) for version, _ in counted)
+        for version, count in counted:
+            yield name, version, count, version_key(version) == latest
+
+
+def build_version_summaries(apps, schema_editor):
+    VersionSummary = apps.get_model('sms', 'VersionSummary')
+    for name in VERSIONED_MODELS:
+        model = apps.get_model('sms', name)
+        VersionSummary.objects.bulk_create(
+            VersionSummary(
+                model=model._meta.model_name,
+                name=row_name,
+                version=version,
+                service_systems=count,
+                latest=latest,
+            )
+            for row_name, version, count, latest in summarize(model.objects.all())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0014_port_conflict_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=64)),
+                ('name', models.CharField(max_length=255)),
+                ('version', models.CharField(max_length=50)),
+                ('service_systems', models.PositiveIntegerField()),
+                ('latest', models.BooleanField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'version summaries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['name', 'version'], name='sms_application_version'),
+        ),
+        migrations.AddIndex(
+            model_name='dependency',
+            index=models.Index(fields=['name', 'version'], name='sms_dependency_version'),
+        ),
+        migrations.AddIndex(
+            model_name='deploymenttool',
+            index=models.Index(fields=['name', 'version'], name='sms_deploymenttool_version'),
+        ),
+        migrations.AddIndex(
+            model_name='monitoringtool',
+            index=models.Index(fields=['name', 'version'], name='sms_monitoringtool_version'),
+        ),
+        migrations.AddConstraint(
+            model_name='versionsummary',
+            constraint=models.UniqueConstraint(fields=('model', 'name', 'version'), name='sms_versionsummary_unique'),
+        ),
+        migrations.RunPython(build_version_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0015_version_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthCheckRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('checks', models.PositiveIntegerField(default=0)),
+                ('passed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('latency_histogram', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HealthCheckResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=1024)),
+                ('outcome', models.CharField(choices=[('passed', 'Passed'), ('failed', 'Failed'), ('error', 'Error')], max_length=6)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('latency_ms', models.FloatField(null=True)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('health_check', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='sms.healthcheck')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='sms.healthcheckrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['health_check', 'run'], name='sms_healthc_health__8b72ea_idx')],
+            },
+        ),
+    ]
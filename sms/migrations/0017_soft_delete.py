@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0016_health_check_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicesystem',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='servicesystem',
+            index=models.Index(fields=['deleted_at'], name='sms_service_deleted_da50a5_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='servicesystem',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('name',), name='sms_servicesystem_unique_name', violation_error_message='A service system with this name already exists.'),
+        ),
+        # The partial constraint is in place before the plain one goes.
+        migrations.AlterField(
+            model_name='servicesystem',
+            name='name',
+            field=models.CharField(max_length=255),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:37
+
+import json
+import zlib
+
+import django.core.serializers.json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+from django.utils import timezone
+
+# Service systems read per pass.
+CHUNK_SIZE = 500
+
+# The inventory models as of this migration, by the names history records
+# them under.
+MODEL_NAMES = {
+    'service_systems': 'ServiceSystem',
+    'environment_variables': 'EnvironmentVariable',
+    'configuration_files': 'ConfigurationFile',
+    'dependencies': 'Dependency',
+    'network_configurations': 'NetworkConfiguration',
+    'applications': 'Application',
+    'ports': 'Port',
+    'logging_configurations': 'LoggingConfiguration',
+    'monitoring_tools': 'MonitoringTool',
+    'health_checks': 'HealthCheck',
+    'containerizations': 'Containerization',
+    'deployment_tools': 'DeploymentTool',
+    'scaling_configurations': 'ScalingConfiguration',
+    'backup_configurations': 'BackupConfiguration',
+    'user_permissions': 'UserPermission',
+    'disaster_recoveries': 'DisasterRecovery',
+    'runbooks': 'Runbook',
+}
+
+
+# Copies of sms.history.tracked_fields, read_states and compress as of this
+# migration, which must not change with them.
+def tracked_fields(model):
+    return [
+        field
+        for field in model._meta.concrete_fields
+        if field.editable and not field.primary_key
+    ]
+
+
+def read_states(service_system_ids, models):
+    states = {pk: {} for pk in service_system_ids}
+    for name, model in models.items():
+        lookup = 'pk' if name == 'service_systems' else 'service_system_id'
+        fields = tracked_fields(model)
+        rows = (
+            model._base_manager.filter(**{'%s__in' % lookup: service_system_ids})
+            .order_by()
+            .values_list(lookup, 'pk', *[field.attname for field in fields])
+        )
+        for service_system_id, pk, *row in rows:
+            states[service_system_id].setdefault(name, {})[str(pk)] = {
+                field.name: value for field, value in zip(fields, row)
+            }
+    return states
+
+
+def compress(state):
+    return zlib.compress(
+        json.dumps(state, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    )
+
+
+def take_baseline_checkpoints(apps, schema_editor):
+    # Earlier change log entries carry no values: every existing system
+    # starts its history from a checkpoint of its current rows.
+    ServiceSystem = apps.get_model('sms', 'ServiceSystem')
+    ChangeLogEntry = apps.get_model('sms', 'ChangeLogEntry')
+    HistoryCheckpoint = apps.get_model('sms', 'HistoryCheckpoint')
+    models = {
+        name: apps.get_model('sms', model_name)
+        for name, model_name in MODEL_NAMES.items()
+    }
+    entry = ChangeLogEntry.objects.order_by('-pk').values_list('pk', flat=True)
+    seq = entry.first() or 0
+    now = timezone.now()
+    ids = list(ServiceSystem.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        states = read_states(ids[start : start + CHUNK_SIZE], models)
+        HistoryCheckpoint.objects.bulk_create(
+            HistoryCheckpoint(
+                service_system_id=pk, seq=seq, taken_at=now, state=compress(state)
+            )
+            for pk, state in states.items()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0017_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelogentry',
+            name='delta',
+            field=models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+        migrations.AddField(
+            model_name='changelogentry',
+            name='patches',
+            field=models.JSONField(null=True),
+        ),
+        migrations.CreateModel(
+            name='HistoryCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_system_id', models.BigIntegerField()),
+                ('seq', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('state', models.BinaryField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service_system_id', 'taken_at'], name='sms_history_service_4f1929_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='historycheckpoint',
+            constraint=models.UniqueConstraint(fields=('service_system_id', 'seq'), name='sms_historycheckpoint_unique_seq'),
+        ),
+        migrations.RunPython(take_baseline_checkpoints, migrations.RunPython.noop),
+    ]
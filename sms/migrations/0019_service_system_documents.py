@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:41
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0018_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceSystemDocument',
+            fields=[
+                ('service_system', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='sms.servicesystem')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('version', models.CharField(max_length=40)),
+                ('last_modified', models.DateTimeField()),
+            ],
+        ),
+    ]
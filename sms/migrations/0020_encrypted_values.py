@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:48
+
+from django.db import migrations, models
+import sms.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0019_service_system_documents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('key_id', models.CharField(max_length=64)),
+                ('wrapped', models.BinaryField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='environmentvariable',
+            name='value',
+            field=sms.models.EncryptedTextField(),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0020_encrypted_values'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['model', 'object_id', 'id'], name='sms_changel_model_c9a322_idx'),
+        ),
+    ]
@@ -1,5 +1,18 @@
-from django.db import models
+from abc import abstractmethod
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import crypto
+from .capacity import CAPACITY_FIELDS, capacity_values
+from .drift import summarize
+from .network import address_key, network_range, parse_network
+from .ports import normalize_protocol
 
 
 class TimeStampedModel(models.Model):
@@ -8,10 +21,144 @@ class TimeStampedModel(models.Model):
 
     class Meta:
         abstract = True
-
-
-class ServiceSystem(TimeStampedModel):
-    name = models.CharField(max_length=255, unique=True)
+        # Keyset order used by the API cursor pagination and exports.
+        indexes = [models.Index(fields=["updated_at", "id"])]
+
+
+class DerivedColumnsMixin:
+    """
+    Keeps columns computed from other columns of the same row (parsed
+    capacity, address keys) up to date on save. Bulk writers, which bypass
+    save(), call `refresh_derived()` themselves.
+    """
+
+    # Columns the derived ones are computed from.
+    derived_from = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.derived_from and getattr(
+            cls.derived_values, "__isabstractmethod__", False
+        ):
+            raise TypeError(
+                "%s sets derived_from but does not define derived_values()."
+                % cls.__name__
+            )
+
+    @classmethod
+    @abstractmethod
+    def derived_values(cls, values):
+        """
+        `{derived column: value}` for `values`, the `{source column: value}`
+        of some of the `derived_from` columns. Subclasses return only the
+        columns computed from those sources, so saving some fields leaves
+        the other derived columns alone.
+        """
+
+    def refresh_derived(self, fields=None):
+        """
+        Recompute the columns derived from `fields` (every source column by
+        default), returning the names of the columns set.
+        """
+        values = {
+            name: getattr(self, name)
+            for name in self.derived_from
+            if fields is None or name in fields
+        }
+        derived = self.derived_values(values) if values else {}
+        for name, value in derived.items():
+            setattr(self, name, value)
+        return list(derived)
+
+    def save(self, *args, update_fields=None, **kwargs):
+        derived = self.refresh_derived(update_fields)
+        if update_fields is not None:
+            update_fields = {*update_fields, *derived}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class SealedFormField(forms.CharField):
+    """
+    Edits the plaintext of an EncryptedTextField.
+    """
+
+    widget = forms.Textarea
+
+    def prepare_value(self, value):
+        return crypto.reveal(value)
+
+    def has_changed(self, initial, data):
+        return not crypto.same(initial or "", self.to_python(data))
+
+
+class EncryptedTextField(models.TextField):
+    """
+    Text encrypted at rest when SMS_SECRETS_KEY_FILE is set (see sms.crypto).
+    Stored values load as `crypto.Sealed` tokens, decrypted only when their
+    plaintext is asked for; any other string assigned is plaintext, and is
+    encrypted on save. Lookups cannot match encrypted values.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        return crypto.load(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value and crypto.enabled() and not crypto.is_token(value):
+            return crypto.seal(value)
+        return value
+
+    def pre_save(self, model_instance, add):
+        value = self.get_prep_value(super().pre_save(model_instance, add))
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{"form_class": SealedFormField, **kwargs})
+
+
+# Sent with the ids of service systems marked deleted.
+soft_deleted = Signal()
+# Service systems that are not deleted.
+NOT_DELETED = models.Q(deleted_at__isnull=True)
+# Service systems per UPDATE when marking them deleted.
+SOFT_DELETE_CHUNK_SIZE = 1000
+
+
+class ServiceSystemQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Mark the service systems deleted. Their rows drop out of every
+        default manager at once, and are removed later, in small batches, by
+        `manage.py purge_deleted` (see sms.purge).
+        """
+        with transaction.atomic():
+            ids = list(self.filter(NOT_DELETED).order_by().values_list("pk", flat=True))
+            now = timezone.now()
+            for start in range(0, len(ids), SOFT_DELETE_CHUNK_SIZE):
+                ServiceSystem.all_objects.filter(
+                    pk__in=ids[start : start + SOFT_DELETE_CHUNK_SIZE]
+                ).update(deleted_at=now, updated_at=now)
+            soft_deleted.send(sender=self.model, ids=ids)
+        return len(ids), {self.model._meta.label: len(ids)}
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def hard_delete(self):
+        return super().delete()
+
+    hard_delete.alters_data = True
+    hard_delete.queryset_only = True
+
+
+class LiveServiceSystemManager(models.Manager.from_queryset(ServiceSystemQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(NOT_DELETED)
+
+
+class ServiceSystem(DerivedColumnsMixin, TimeStampedModel):
+    name = models.CharField(max_length=255)
     description = models.TextField()
     location = models.CharField(max_length=255)
     hostname = models.CharField(max_length=255)
@@ -20,26 +167,142 @@ class ServiceSystem(TimeStampedModel):
     cpu_allocation = models.CharField(max_length=255)
     ram_allocation = models.CharField(max_length=255)
     disk_allocation = models.CharField(max_length=255)
+    # Derived on save: capacity parsed from the allocation columns (see
+    # sms.capacity), None when the text cannot be parsed, and the address
+    # key of `ip_address` (see sms.network).
+    cpu_cores = models.PositiveIntegerField(null=True, editable=False)
+    ram_bytes = models.PositiveBigIntegerField(null=True, editable=False)
+    disk_bytes = models.PositiveBigIntegerField(null=True, editable=False)
+    ip_key = models.CharField(max_length=32, null=True, editable=False)
+    # Set when the system is deleted; see ServiceSystemQuerySet.delete().
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveServiceSystemManager()
+    all_objects = models.Manager.from_queryset(ServiceSystemQuerySet)()
+
+    derived_from = (*CAPACITY_FIELDS, "ip_address")
+
+    class Meta(TimeStampedModel.Meta):
+        constraints = [
+            # A deleted system's name is free for a new one at once.
+            models.UniqueConstraint(
+                fields=["name"],
+                condition=NOT_DELETED,
+                name="sms_servicesystem_unique_name",
+                violation_error_message="A service system with this name "
+                "already exists.",
+            ),
+        ]
+        indexes = TimeStampedModel.Meta.indexes + [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["hostname"]),
+            models.Index(fields=["ip_address"]),
+            # Covers per-location capacity totals without touching the table.
+            models.Index(
+                fields=["location", "cpu_cores", "ram_bytes", "disk_bytes"],
+                name="sms_servicesystem_capacity",
+            ),
+            models.Index(fields=["cpu_cores"]),
+            models.Index(fields=["ip_key"]),
+            models.Index(fields=["deleted_at"]),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    def validate_constraints(self, exclude=None):
+        # Forms leave out deleted_at, which the name constraint's condition
+        # reads; Django skips such a constraint rather than check it.
+        if exclude:
+            exclude = set(exclude) - {"deleted_at"}
+        super().validate_constraints(exclude)
+
+    def delete(self, using=None, keep_parents=False):
+        return ServiceSystem.all_objects.filter(pk=self.pk).delete()
+
+    @classmethod
+    def derived_values(cls, values):
+        derived = capacity_values(values)
+        if "ip_address" in values:
+            derived["ip_key"] = address_key(values["ip_address"])
+        return derived
+
+
+class LiveManager(models.Manager):
+    """
+    Rows of the service systems that are not deleted.
+    """
+
+    def get_queryset(self):
+        # Deleted systems are few until purged, so excluding them by
+        # subquery keeps index-only scans possible where a join on the
+        # service system would visit it for every row.
+        return (
+            super()
+            .get_queryset()
+            .exclude(
+                service_system__in=ServiceSystem.all_objects.filter(
+                    deleted_at__isnull=False
+                ).values("pk")
+            )
+        )
+
 
 class BaseModel(TimeStampedModel):
     service_system = models.ForeignKey(ServiceSystem, on_delete=models.CASCADE)
 
-    class Meta:
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta(TimeStampedModel.Meta):
         abstract = True
+        indexes = TimeStampedModel.Meta.indexes + [
+            models.Index(fields=["service_system", "updated_at"]),
+        ]
 
 
-class EnvironmentVariable(BaseModel):
-    name = models.CharField(max_length=255, unique=True)
-    value = models.TextField()
+class NamedModel(BaseModel):
+    """
+    A related row identified by its name within its service system, so the
+    same variable, dependency or tool can be defined on every host.
+    """
+
+    name = models.CharField(max_length=255)
+
+    class Meta(BaseModel.Meta):
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=["service_system", "name"],
+                name="%(app_label)s_%(class)s_unique_name",
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
 
+class VersionedModel(NamedModel):
+    """
+    A named row installed at some version on each host; see sms.drift.
+    """
+
+    version = models.CharField(max_length=50)
+
+    class Meta(NamedModel.Meta):
+        abstract = True
+        indexes = NamedModel.Meta.indexes + [
+            # Covers the fleet-wide version distribution.
+            models.Index(
+                fields=["name", "version"], name="%(app_label)s_%(class)s_version"
+            ),
+        ]
+
+
+class EnvironmentVariable(NamedModel):
+    value = EncryptedTextField()
+
+
 class ConfigurationFile(BaseModel):
     file_path = models.CharField(max_length=255)
     description = models.TextField()
@@ -48,45 +311,146 @@ class ConfigurationFile(BaseModel):
         return self.file_path
 
 
-class Dependency(BaseModel):
-    name = models.CharField(max_length=255, unique=True)
-    version = models.CharField(max_length=50)
-
-    class Meta:
+class Dependency(VersionedModel):
+    class Meta(VersionedModel.Meta):
         verbose_name_plural = "Dependencies"
 
-    def __str__(self) -> str:
-        return self.name
-
 
-class NetworkConfiguration(BaseModel):
+class NetworkConfiguration(DerivedColumnsMixin, BaseModel):
     dns = models.CharField(max_length=255)
     gateway = models.CharField(max_length=255)
     subnet = models.CharField(max_length=255)
+    # Address keys of the first and last address of `subnet` (see
+    # sms.network), None when it cannot be parsed.
+    subnet_start = models.CharField(max_length=32, null=True, editable=False)
+    subnet_end = models.CharField(max_length=32, null=True, editable=False)
+
+    derived_from = ("subnet", "gateway")
+
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(fields=["subnet_start", "subnet_end"]),
+        ]
+
+    @classmethod
+    def derived_values(cls, values):
+        network = parse_network(values.get("subnet"), values.get("gateway"))
+        start, end = network_range(network) if network else (None, None)
+        return {"subnet_start": start, "subnet_end": end}
+
+    def refresh_derived(self, fields=None):
+        # A bare netmask is placed by the gateway, so both are always read.
+        if fields is not None and not set(fields) & set(self.derived_from):
+            return []
+        return super().refresh_derived()
 
     def __str__(self) -> str:
         return self.dns
 
 
-class Application(BaseModel):
-    name = models.CharField(max_length=255, unique=True)
-    version = models.CharField(max_length=50)
+class Application(VersionedModel):
     description = models.TextField()
 
-    def __str__(self) -> str:
-        return self.name
 
-
-class Port(BaseModel):
+class Port(DerivedColumnsMixin, BaseModel):
     application = models.ForeignKey(Application, on_delete=models.CASCADE)
     port_number = models.IntegerField(
         validators=[MinValueValidator(1024), MaxValueValidator(65535)]
     )
     protocol = models.CharField(max_length=50)
+    # Derived on save: `protocol` as compared for conflicts ("TCP " == "tcp").
+    protocol_key = models.CharField(max_length=50, default="", editable=False)
+
+    derived_from = ("protocol",)
+
+    class Meta(BaseModel.Meta):
+        indexes = BaseModel.Meta.indexes + [
+            models.Index(fields=["application", "port_number", "protocol"]),
+            # Covers the fleet-wide conflict scan (see sms.ports).
+            models.Index(
+                fields=["service_system", "port_number", "protocol_key"],
+                name="sms_port_conflict",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.application.name}: {self.protocol}/{self.port_number}"
 
+    @classmethod
+    def derived_values(cls, values):
+        return {"protocol_key": normalize_protocol(values["protocol"])}
+
+    def conflicting_ports(self):
+        """
+        Other ports of this service system on the same number and protocol.
+        """
+        return (
+            Port.objects.filter(
+                service_system_id=self.service_system_id,
+                port_number=self.port_number,
+                protocol_key=normalize_protocol(self.protocol),
+            )
+            .exclude(pk=self.pk)
+            .select_related("application")
+        )
+
+    def validate_unique(self, exclude=None):
+        super().validate_unique(exclude)
+        # Fields that failed their own validation are excluded; so is a port
+        # of a service system that is not saved yet.
+        if set(exclude or ()) & {"port_number", "protocol"}:
+            return
+        if self.service_system_id is None:
+            return
+        conflict = self.conflicting_ports().first()
+        if conflict is not None:
+            raise ValidationError(
+                {
+                    "port_number": "%s/%s is already used by %s on this service "
+                    "system." % (self.protocol, self.port_number, conflict.application)
+                }
+            )
+
+    @classmethod
+    def validate_batch(cls, instances):
+        """
+        Conflict messages for a batch of unsaved ports, in order (None for a
+        port that can be saved): against stored ports and against earlier
+        ports of the batch, in one query. The bulk counterpart of
+        `validate_unique()`.
+        """
+        keys = [
+            (
+                instance.service_system_id,
+                instance.port_number,
+                normalize_protocol(instance.protocol),
+            )
+            for instance in instances
+        ]
+        taken = {}
+        if keys:
+            for port in (
+                cls.objects.filter(
+                    service_system__in={key[0] for key in keys},
+                    port_number__in={key[1] for key in keys},
+                )
+                .select_related("application")
+                .order_by("pk")
+            ):
+                key = (port.service_system_id, port.port_number, port.protocol_key)
+                taken.setdefault(key, port.application)
+        messages = []
+        for instance, key in zip(instances, keys):
+            if key in taken:
+                messages.append(
+                    "%s/%s is already used by %s on this service system."
+                    % (instance.protocol, instance.port_number, taken[key])
+                )
+            else:
+                messages.append(None)
+                taken[key] = "an earlier row"
+        return messages
+
 
 class LoggingConfiguration(BaseModel):
     log_file_path = models.CharField(max_length=1024)
@@ -96,12 +460,8 @@ class LoggingConfiguration(BaseModel):
         return self.log_file_path
 
 
-class MonitoringTool(BaseModel):
-    name = models.CharField(max_length=255, unique=True)
-    version = models.CharField(max_length=50)
-
-    def __str__(self) -> str:
-        return self.name
+class MonitoringTool(VersionedModel):
+    pass
 
 
 class HealthCheck(BaseModel):
@@ -121,14 +481,9 @@ class Containerization(BaseModel):
         return self.container_runtime
 
 
-class DeploymentTool(BaseModel):
-    name = models.CharField(max_length=255, unique=True)
-    version = models.CharField(max_length=50)
+class DeploymentTool(VersionedModel):
     info = models.TextField()
 
-    def __str__(self) -> str:
-        return self.name
-
 
 class ScalingConfiguration(BaseModel):
     scaling_policy = models.TextField()
@@ -159,7 +514,7 @@ class DisasterRecovery(BaseModel):
     backup_locations = models.TextField()
     testing_schedule = models.TextField()
 
-    class Meta:
+    class Meta(BaseModel.Meta):
         verbose_name_plural = "DisasterRecoveries"
 
     def __str__(self) -> str:
@@ -174,3 +529,216 @@ class Runbook(BaseModel):
 
     def __str__(self) -> str:
         return self.run_command
+
+
+class HealthCheckRun(models.Model):
+    """
+    One pass of the health check runner (see sms.healthchecks).
+    """
+
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True)
+    checks = models.PositiveIntegerField(default=0)
+    passed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    # Result counts per latency bucket, keyed by its upper bound in ms.
+    latency_histogram = models.JSONField(default=dict)
+
+    def __str__(self) -> str:
+        return "Run %s at %s" % (self.pk, self.started_at)
+
+
+class HealthCheckResult(models.Model):
+    PASSED = "passed"
+    FAILED = "failed"
+    ERROR = "error"
+    OUTCOMES = [(PASSED, "Passed"), (FAILED, "Failed"), (ERROR, "Error")]
+
+    run = models.ForeignKey(
+        HealthCheckRun, on_delete=models.CASCADE, related_name="results"
+    )
+    health_check = models.ForeignKey(
+        HealthCheck, on_delete=models.CASCADE, related_name="results"
+    )
+    url = models.CharField(max_length=1024)
+    outcome = models.CharField(max_length=6, choices=OUTCOMES)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    latency_ms = models.FloatField(null=True)
+    message = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["health_check", "run"])]
+
+    def __str__(self) -> str:
+        return "%s: %s" % (self.url, self.outcome)
+
+
+class SearchDocument(models.Model):
+    """
+    Denormalized search text of a ServiceSystem, indexed by the database's
+    full-text engine (FTS5 on SQLite, a GIN index on PostgreSQL).
+    """
+
+    service_system = models.OneToOneField(
+        ServiceSystem, on_delete=models.CASCADE, primary_key=True
+    )
+    content = models.TextField()
+
+    def __str__(self) -> str:
+        return str(self.service_system_id)
+
+
+class ServiceSystemDocument(models.Model):
+    """
+    Denormalized snapshot of a ServiceSystem with all its related rows, read
+    with one primary key lookup instead of a query per related table. Kept
+    in step with the tables when SMS_SERVICE_SYSTEM_DOCUMENTS is on (see
+    sms.documents).
+    """
+
+    service_system = models.OneToOneField(
+        ServiceSystem, on_delete=models.CASCADE, primary_key=True
+    )
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    # The snapshot's ETag version and Last-Modified (see snapshot_etag).
+    version = models.CharField(max_length=40)
+    last_modified = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return str(self.service_system_id)
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only record of one create, update or delete of an inventory row.
+
+    `id` is the feed's sequence number. The service system is stored as a
+    plain integer so entries outlive the system they describe.
+
+    `delta` holds the field values the write set, by field name: every field
+    on create, the changed ones on update. A long text field edited in place
+    is stored as a line patch in `patches` instead (see sms.history). Entries
+    from before history was kept have neither.
+    """
+
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    OPERATIONS = [(CREATE, "Create"), (UPDATE, "Update"), (DELETE, "Delete")]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    model = models.CharField(max_length=64)
+    object_id = models.BigIntegerField()
+    service_system_id = models.BigIntegerField()
+    operation = models.CharField(max_length=6, choices=OPERATIONS)
+    delta = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    patches = models.JSONField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["service_system_id", "id"]),
+            # The revisions of one row (sms.history.row_history).
+            models.Index(fields=["model", "object_id", "id"]),
+        ]
+
+    def __str__(self) -> str:
+        return "#%s %s %s %s" % (self.pk, self.operation, self.model, self.object_id)
+
+
+class HistoryCheckpoint(models.Model):
+    """
+    The full configuration of one service system after change log entry
+    `seq`, so a point-in-time read replays only the entries after the
+    checkpoint before it. `state` is zlib-compressed JSON of
+    `{model name: {row id: {field: value}}}`.
+    """
+
+    service_system_id = models.BigIntegerField()
+    seq = models.BigIntegerField()
+    # When entry `seq` was written.
+    taken_at = models.DateTimeField()
+    state = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["service_system_id", "seq"],
+                name="sms_historycheckpoint_unique_seq",
+            )
+        ]
+        indexes = [models.Index(fields=["service_system_id", "taken_at"])]
+
+    def __str__(self) -> str:
+        return "Service system %s at #%s" % (self.service_system_id, self.seq)
+
+
+class DataKey(models.Model):
+    """
+    A data key encrypting secret values, stored encrypted ("wrapped") under
+    the key-encryption key `key_id` of the key file (see sms.crypto). The
+    newest one encrypts new values.
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    key_id = models.CharField(max_length=64)
+    # Nonce and AES-GCM ciphertext of the key.
+    wrapped = models.BinaryField()
+
+    def __str__(self) -> str:
+        return "Data key %s (%s)" % (self.pk, self.key_id)
+
+
+class VersionSummary(models.Model):
+    """
+    Materialized version distribution of a VersionedModel: how many service
+    systems run each version of each name, and which version is the newest.
+    Refreshed per name as rows change (see sms.signals), so reading the
+    fleet's drift never groups the inventory tables.
+    """
+
+    model = models.CharField(max_length=64)
+    name = models.CharField(max_length=255)
+    version = models.CharField(max_length=50)
+    service_systems = models.PositiveIntegerField()
+    latest = models.BooleanField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["model", "name", "version"], name="sms_versionsummary_unique"
+            ),
+        ]
+        verbose_name_plural = "version summaries"
+
+    def __str__(self) -> str:
+        return "%s %s %s" % (self.model, self.name, self.version)
+
+    @classmethod
+    def refresh(cls, model, names=None):
+        """
+        Recompute the summary of `model` for `names` (every name by default)
+        from one grouped query.
+        """
+        label = model._meta.model_name
+        queryset = model.objects.all()
+        stale = cls.objects.filter(model=label)
+        if names is not None:
+            queryset = queryset.filter(name__in=names)
+            stale = stale.filter(name__in=names)
+        rows = [
+            cls(
+                model=label,
+                name=name,
+                version=version,
+                service_systems=count,
+                latest=latest,
+            )
+            for name, version, count, latest in summarize(queryset)
+        ]
+        with transaction.atomic():
+            # Nothing cascades from summaries or listens for their deletes,
+            # so this is a single DELETE without fetching the rows.
+            stale.delete()
+            cls.objects.bulk_create(rows)
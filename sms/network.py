@@ -0,0 +1,161 @@
+"""
+Address-range index over service system IPs and network configuration
+subnets.
+
+Addresses are stored as 32-digit hex keys of their 128-bit value, IPv4 as
+IPv4-mapped IPv6 (::ffff:a.b.c.d), so one indexed text column orders every
+address numerically (128-bit values do not fit an integer column). A subnet
+is the pair of keys of its first and last address. Containment and overlap
+then become range comparisons the database answers from an index:
+
+- hosts in 10.2.0.0/16:    start <= ip_key <= end
+- subnets overlapping it:  subnet_start <= end and subnet_end >= start
+"""
+
+import ipaddress
+
+from django.db.models import Count, Exists, OuterRef
+
+IPV4_MAPPED = 0xFFFF << 32
+
+
+def to_key(address):
+    value = int(address)
+    if address.version == 4:
+        value |= IPV4_MAPPED
+    return "%032x" % value
+
+
+def from_key(key):
+    value = int(key, 16)
+    if value >> 32 == 0xFFFF:
+        return ipaddress.IPv4Address(value & 0xFFFFFFFF)
+    return ipaddress.IPv6Address(value)
+
+
+def address_key(value):
+    """
+    Key of an IP address string, or None if it is not one.
+    """
+    try:
+        return to_key(ipaddress.ip_address(str(value).strip()))
+    except ValueError:
+        return None
+
+
+def is_netmask(value):
+    try:
+        address = ipaddress.IPv4Address(value)
+    except ValueError:
+        return False
+    inverted = ~int(address) & 0xFFFFFFFF
+    return inverted & (inverted + 1) == 0
+
+
+def parse_network(subnet, gateway=""):
+    """
+    The network a `subnet` column describes: a CIDR ("10.2.0.0/16"), or a
+    bare netmask ("255.255.255.0") placed by the gateway address. None if
+    neither works.
+    """
+    subnet = (subnet or "").strip()
+    gateway = (gateway or "").strip()
+    if is_netmask(subnet):
+        subnet = "%s/%s" % (gateway, subnet) if gateway else ""
+    try:
+        return ipaddress.ip_network(subnet, strict=False)
+    except ValueError:
+        return None
+
+
+def network_range(network):
+    return to_key(network.network_address), to_key(network.broadcast_address)
+
+
+def parse_query(value):
+    """
+    Range of an address or CIDR given in a query. Raises ValueError.
+    """
+    return network_range(ipaddress.ip_network(value.strip(), strict=False))
+
+
+def hosts_in(queryset, value):
+    start, end = parse_query(value)
+    return queryset.filter(ip_key__gte=start, ip_key__lte=end)
+
+
+def subnets_overlapping(queryset, value):
+    start, end = parse_query(value)
+    return queryset.filter(subnet_start__lte=end, subnet_end__gte=start)
+
+
+def duplicate_keys(queryset):
+    """
+    Subquery of the address keys used by more than one row of `queryset`.
+    """
+    return (
+        queryset.exclude(ip_key=None)
+        .values("ip_key")
+        .annotate(count=Count("pk"))
+        .filter(count__gt=1)
+        .values("ip_key")
+    )
+
+
+def duplicate_addresses(queryset):
+    """
+    `{ip key: [(id, name), ...]}` of addresses used by more than one system.
+    """
+    duplicates = {}
+    for key, pk, name in (
+        queryset.filter(ip_key__in=duplicate_keys(queryset))
+        .order_by("ip_key", "pk")
+        .values_list("ip_key", "pk", "name")
+    ):
+        duplicates.setdefault(key, []).append((pk, name))
+    return duplicates
+
+
+def overlapping_subnets(queryset):
+    """
+    Yield `((start, end, rows), (start, end, rows))` for every pair of
+    distinct subnets that share addresses, from one pass over the subnets in
+    start order.
+    """
+    ranges = (
+        queryset.exclude(subnet_start=None)
+        .values_list("subnet_start", "subnet_end")
+        .annotate(count=Count("pk"))
+        .order_by("subnet_start", "-subnet_end")
+    )
+    active = []
+    for current in ranges.iterator():
+        start = current[0]
+        # Ranges ending before this one starts cannot overlap anything later.
+        active = [other for other in active if other[1] >= start]
+        for other in active:
+            yield other, current
+        active.append(current)
+
+
+def overlapping(queryset):
+    """
+    Rows of `queryset` whose subnet shares addresses with a different subnet:
+    one correlated EXISTS per row over the range index.
+    """
+    others = queryset.model.objects.filter(
+        subnet_start__lte=OuterRef("subnet_end"),
+        subnet_end__gte=OuterRef("subnet_start"),
+    ).exclude(subnet_start=OuterRef("subnet_start"), subnet_end=OuterRef("subnet_end"))
+    return queryset.filter(Exists(others))
+
+
+def cidr(start, end):
+    """
+    Text form of the subnet spanning keys `start` to `end`.
+    """
+    first, last = from_key(start), from_key(end)
+    networks = list(ipaddress.summarize_address_range(first, last))
+    if len(networks) == 1:
+        return str(networks[0])
+    return "%s-%s" % (first, last)
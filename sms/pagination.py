@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class InventoryCursorPagination(CursorPagination):
+    # Stable keyset ordering: `updated_at` positions the cursor and `id`
+    # breaks ties, so bulk pulls never skip or repeat rows.
+    ordering = ("updated_at", "id")
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
@@ -0,0 +1,355 @@
+"""
+Per-request performance instrumentation and query budgets.
+
+`PerformanceMiddleware` counts the SQL queries of every request, their total
+time and the slowest one, and times the view and the template rendering
+separately. The figures are aggregated per view (its URL name) into
+Prometheus-style metrics served at `/api/metrics/`, and shown in a panel at
+the foot of admin pages for staff users when `SMS_PERFORMANCE_PANEL` is on.
+
+`SMS_QUERY_BUDGETS` caps the number of queries a view may run, by URL name or
+a shell-style pattern of URL names. A request over budget is logged to the
+`sms.performance` logger, or raises QueryBudgetExceeded when
+`SMS_QUERY_BUDGET_MODE = "raise"` (as tests should set it), so N+1 regressions
+fail loudly. `query_budget()` applies the same check to any block of code.
+
+Metrics are kept per process. Database figures are recorded, and query
+budgets checked, for requests served through WSGI only: under ASGI, views
+run their queries in worker threads, on other connections than the
+middleware's, and only request counts and durations are recorded. Tests use
+the WSGI path, so budgets still gate regressions there.
+"""
+
+import bisect
+import fnmatch
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.loader import render_to_string
+from django.utils.encoding import force_str
+
+logger = logging.getLogger("sms.performance")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Characters of SQL kept for the slowest query.
+MAX_SQL_LENGTH = 2000
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats:
+    """
+    Database execute wrapper counting queries, their total time and the
+    slowest one, on every connection while `record()` is active.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if elapsed > self.slowest_seconds:
+                self.slowest_seconds = elapsed
+                self.slowest_sql = force_str(sql)[:MAX_SQL_LENGTH]
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+def budget_for(view):
+    """
+    Query budget of a view from SMS_QUERY_BUDGETS: its URL name, else the
+    first matching pattern, else None.
+    """
+    budgets = getattr(settings, "SMS_QUERY_BUDGETS", {})
+    if view in budgets:
+        return budgets[view]
+    for pattern, budget in budgets.items():
+        if fnmatch.fnmatchcase(view, pattern):
+            return budget
+    return None
+
+
+def over_budget(label, stats, budget, mode=None):
+    mode = mode or getattr(settings, "SMS_QUERY_BUDGET_MODE", "log")
+    message = "%s ran %d queries (budget %d); slowest %.1fms: %s" % (
+        label,
+        stats.count,
+        budget,
+        stats.slowest_seconds * 1000,
+        stats.slowest_sql,
+    )
+    METRICS.budget_exceeded(label)
+    if mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextmanager
+def query_budget(budget, label="block", mode=None):
+    """
+    Check that the block runs at most `budget` queries.
+    """
+    with QueryStats().record() as stats:
+        yield stats
+    if stats.count > budget:
+        over_budget(label, stats, budget, mode)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.responses = {}
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.budget_exceeded = 0
+
+
+class Metrics:
+    """
+    Per-view request metrics of this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def view(self, name):
+        if name not in self.views:
+            self.views[name] = ViewMetrics()
+        return self.views[name]
+
+    def observe(self, view, method, status, seconds, stats=None, render_seconds=0):
+        with self.lock:
+            metrics = self.view(view)
+            key = (method, status)
+            metrics.responses[key] = metrics.responses.get(key, 0) + 1
+            metrics.duration.observe(seconds)
+            metrics.render_seconds += render_seconds
+            if stats is not None:
+                metrics.queries.observe(stats.count)
+                metrics.db_seconds += stats.seconds
+
+    def budget_exceeded(self, view):
+        with self.lock:
+            self.view(view).budget_exceeded += 1
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, kind))
+
+        def histogram(name, labels, histogram):
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(
+                    '%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative)
+                )
+            lines.append("%s_sum{%s} %s" % (name, labels, histogram.sum))
+            lines.append("%s_count{%s} %d" % (name, labels, cumulative))
+
+        with self.lock:
+            views = sorted(self.views.items())
+            family("sms_http_requests_total", "counter", "Responses by view.")
+            for view, metrics in views:
+                for (method, status), count in sorted(metrics.responses.items()):
+                    lines.append(
+                        'sms_http_requests_total{view="%s",method="%s",status="%s"} %d'
+                        % (label(view), method, status, count)
+                    )
+            family(
+                "sms_http_request_duration_seconds",
+                "histogram",
+                "Time to produce a response, rendering included.",
+            )
+            for view, metrics in views:
+                histogram(
+                    "sms_http_request_duration_seconds",
+                    'view="%s"' % label(view),
+                    metrics.duration,
+                )
+            family(
+                "sms_db_queries_per_request",
+                "histogram",
+                "SQL queries run per request.",
+            )
+            for view, metrics in views:
+                histogram(
+                    "sms_db_queries_per_request",
+                    'view="%s"' % label(view),
+                    metrics.queries,
+                )
+            for name, attribute, help_text in (
+                ("sms_db_seconds_total", "db_seconds", "Time spent in SQL queries."),
+                (
+                    "sms_render_seconds_total",
+                    "render_seconds",
+                    "Time spent rendering templates.",
+                ),
+                (
+                    "sms_query_budget_exceeded_total",
+                    "budget_exceeded",
+                    "Requests over their query budget.",
+                ),
+            ):
+                family(name, "counter", help_text)
+                for view, metrics in views:
+                    lines.append(
+                        '%s{view="%s"} %s'
+                        % (name, label(view), getattr(metrics, attribute))
+                    )
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        request.sms_render_started = None
+        request.sms_render_seconds = 0.0
+        with QueryStats().record() as stats:
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+        view = view_name(request)
+        METRICS.observe(
+            view,
+            request.method,
+            response.status_code,
+            seconds,
+            stats,
+            request.sms_render_seconds,
+        )
+        if not response.streaming:
+            budget = budget_for(view)
+            if budget is not None and stats.count > budget:
+                over_budget(view, stats, budget)
+            if self.show_panel(request, response):
+                self.add_panel(request, response, view, stats, seconds)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        METRICS.observe(
+            view_name(request),
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        # Called just before the response is rendered.
+        request.sms_render_started = time.perf_counter()
+
+        def rendered(response):
+            request.sms_render_seconds = (
+                time.perf_counter() - request.sms_render_started
+            )
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def show_panel(request, response):
+        match = getattr(request, "resolver_match", None)
+        user = getattr(request, "user", None)
+        return (
+            getattr(settings, "SMS_PERFORMANCE_PANEL", False)
+            and match is not None
+            and "admin" in match.namespaces
+            and user is not None
+            and user.is_staff
+            and response.get("Content-Type", "").startswith("text/html")
+            and not response.has_header("Content-Encoding")
+        )
+
+    @staticmethod
+    def add_panel(request, response, view, stats, seconds):
+        content = response.content.decode(response.charset)
+        position = content.rfind("</body>")
+        if position == -1:
+            return
+        panel = render_to_string(
+            "sms/performance_panel.html",
+            {
+                "view": view,
+                "queries": stats.count,
+                "budget": budget_for(view),
+                "db_ms": stats.seconds * 1000,
+                "render_ms": request.sms_render_seconds * 1000,
+                "total_ms": seconds * 1000,
+                "slowest_ms": stats.slowest_seconds * 1000,
+                "slowest_sql": stats.slowest_sql,
+            },
+        )
+        response.content = content[:position] + panel + content[position:]
+        if response.has_header("Content-Length"):
+            response["Content-Length"] = len(response.content)
@@ -0,0 +1,37 @@
+"""
+API permissions: as in the admin, reading a model takes its view permission
+and writing it the add, change or delete permission.
+"""
+
+from rest_framework.permissions import DjangoModelPermissions
+
+
+def view_permissions(models):
+    return [
+        "%s.view_%s" % (model._meta.app_label, model._meta.model_name)
+        for model in models
+    ]
+
+
+class ModelPermissions(DjangoModelPermissions):
+    """
+    DjangoModelPermissions that also guards reads. Reports set `queryset` to
+    the model they are computed from. Views returning rows of other models as
+    well (expanded relations, snapshots) name them in `get_embedded_models()`,
+    and need their view permissions too.
+    """
+
+    perms_map = {
+        **DjangoModelPermissions.perms_map,
+        "GET": ["%(app_label)s.view_%(model_name)s"],
+        "OPTIONS": ["%(app_label)s.view_%(model_name)s"],
+        "HEAD": ["%(app_label)s.view_%(model_name)s"],
+    }
+
+    def has_permission(self, request, view):
+        if not super().has_permission(request, view):
+            return False
+        get_embedded_models = getattr(view, "get_embedded_models", None)
+        if get_embedded_models is None:
+            return True
+        return request.user.has_perms(view_permissions(get_embedded_models()))
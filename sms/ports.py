@@ -0,0 +1,106 @@
+"""
+Port conflicts: two ports of one service system claiming the same port number
+and protocol, which only one application can bind.
+
+Ports carry their protocol normalized for comparison (`Port.protocol_key`),
+and the `(service_system, port_number, protocol_key)` index holds every
+column the check needs, so finding all conflicts of the fleet is a single
+GROUP BY answered from that index without reading the table. Saves check
+their own key only (see `Port.validate_unique` and `Port.validate_batch`).
+"""
+
+from django.db.models import Count, Exists, OuterRef
+
+# Service systems per query when loading the ports of conflicting keys, so
+# the IN lists stay under every backend's parameter limit.
+FETCH_CHUNK_SIZE = 400
+
+
+def normalize_protocol(value):
+    return (value or "").strip().lower()
+
+
+def conflict_keys(queryset):
+    """
+    `(service system id, port number, protocol key, count)` of every key
+    claimed by more than one port of `queryset`, in one aggregate query.
+    """
+    return (
+        queryset.values_list("service_system", "port_number", "protocol_key")
+        .annotate(count=Count("pk"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+
+
+def conflicting(queryset):
+    """
+    Ports of `queryset` sharing their key with another port: one correlated
+    EXISTS per row, answered from the conflict index, however many keys
+    conflict.
+    """
+    others = queryset.model.objects.filter(
+        service_system=OuterRef("service_system"),
+        port_number=OuterRef("port_number"),
+        protocol_key=OuterRef("protocol_key"),
+    ).exclude(pk=OuterRef("pk"))
+    return queryset.filter(Exists(others))
+
+
+def find_conflicts(queryset):
+    """
+    `{(service system id, port number, protocol key): [port, ...]}` for every
+    conflicting key of `queryset`, ports oldest first. One aggregate query,
+    then one query per `FETCH_CHUNK_SIZE` affected service systems.
+    """
+    keys = {key[:3] for key in conflict_keys(queryset)}
+    port_numbers = {}
+    for service_system, port_number, _ in keys:
+        port_numbers.setdefault(service_system, set()).add(port_number)
+    service_systems = sorted(port_numbers)
+    conflicts = {}
+    for start in range(0, len(service_systems), FETCH_CHUNK_SIZE):
+        chunk = service_systems[start : start + FETCH_CHUNK_SIZE]
+        ports = (
+            queryset.filter(
+                service_system__in=chunk,
+                port_number__in=set().union(*(port_numbers[pk] for pk in chunk)),
+            )
+            .select_related("service_system", "application")
+            .order_by("service_system", "port_number", "pk")
+        )
+        for port in ports:
+            key = (port.service_system_id, port.port_number, port.protocol_key)
+            if key in keys:
+                conflicts.setdefault(key, []).append(port)
+    return conflicts
+
+
+def conflict_report(queryset):
+    """
+    JSON-ready list of the conflicts of `queryset`.
+    """
+    return [
+        {
+            "service_system": {
+                "id": ports[0].service_system_id,
+                "name": str(ports[0].service_system),
+            },
+            "port_number": port_number,
+            "protocol": protocol,
+            "ports": [
+                {
+                    "id": port.pk,
+                    "application": {
+                        "id": port.application_id,
+                        "name": port.application.name,
+                    },
+                    "protocol": port.protocol,
+                }
+                for port in ports
+            ],
+        }
+        for (_, port_number, protocol), ports in sorted(
+            find_conflicts(queryset).items()
+        )
+    ]
@@ -0,0 +1,92 @@
+"""
+Removal of deleted service systems.
+
+Deleting a service system only sets its `deleted_at` (see
+ServiceSystemQuerySet.delete), which hides it and its rows from every default
+manager at once, in a single UPDATE. `purge()` removes the rows afterwards:
+for each deleted system, the rows depending on it are deleted first, then the
+system, in batches of at most `batch_size` rows, each in its own short
+transaction, so no delete holds the database for long whatever the size of
+the system.
+"""
+
+import time
+from collections import Counter
+
+from django.db import connections, models, transaction
+
+from .models import ServiceSystem
+
+# Deleted service systems purged per pass.
+SYSTEMS_PER_PASS = 100
+
+
+def purge_rows(model, lookup, ids, batch_size, pause, counts):
+    """
+    Delete the rows of `model` whose `lookup` is one of `ids`, and the rows
+    cascading from them first.
+    """
+    for relation in model._meta.related_objects:
+        # Every relation to inventory rows cascades; other on_delete
+        # behaviours are left for the database to enforce.
+        if relation.on_delete is models.CASCADE:
+            purge_rows(
+                relation.related_model,
+                "%s__%s" % (relation.field.name, lookup),
+                ids,
+                batch_size,
+                pause,
+                counts,
+            )
+    queryset = model._base_manager.filter(**{"%s__in" % lookup: ids}).order_by()
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return
+        delete(model, pks, queryset.db)
+        counts[model._meta.label] += len(pks)
+        if pause:
+            time.sleep(pause)
+
+
+def purge(older_than=None, batch_size=1000, pause=0, progress=None):
+    """
+    Remove the service systems deleted before `older_than` (a datetime; all
+    of them by default) with their rows. Returns the rows removed per model
+    label. `progress(counts)` is called after each pass.
+    """
+    deleted = ServiceSystem.all_objects.filter(deleted_at__isnull=False)
+    if older_than is not None:
+        deleted = deleted.filter(deleted_at__lt=older_than)
+    counts = Counter()
+    while True:
+        ids = list(
+            deleted.order_by("pk").values_list("pk", flat=True)[:SYSTEMS_PER_PASS]
+        )
+        if not ids:
+            return counts
+        purge_rows(ServiceSystem, "pk", ids, batch_size, pause, counts)
+        if progress:
+            progress(counts)
+
+
+def delete(model, pks, using):
+    """
+    Delete the rows `pks` of `model` with a plain DELETE. The rows were
+    dropped from search, caches, summaries and the change log when their
+    system was soft deleted, and rows cascading from them are purged before
+    them: QuerySet.delete() would only fetch each row to send post_delete,
+    whose receivers would log the deletes a second time.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM %s WHERE %s IN (%s)"
+            % (
+                quote_name(model._meta.db_table),
+                quote_name(model._meta.pk.column),
+                ", ".join(["%s"] * len(pks)),
+            ),
+            pks,
+        )
@@ -0,0 +1,36 @@
+import json
+
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class YAMLRenderer(renderers.BaseRenderer):
+    """
+    Render API data as YAML. Only offered when PyYAML is installed.
+    """
+
+    media_type = "application/yaml"
+    format = "yaml"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # Round-trip through JSON so dates, decimals and DRF's ReturnDict are
+        # reduced to plain types safe_dump understands.
+        plain = json.loads(json.dumps(data, cls=JSONEncoder))
+        return yaml.safe_dump(plain, sort_keys=False, allow_unicode=True).encode(
+            self.charset
+        )
+
+
+def snapshot_renderers():
+    classes = [renderers.JSONRenderer]
+    if yaml is not None:
+        classes.append(YAMLRenderer)
+    return classes
@@ -0,0 +1,125 @@
+"""
+Full-text search over service systems.
+
+Each ServiceSystem has one SearchDocument holding its own searchable columns
+plus the names of its environment variables, dependencies and applications
+and its configuration file paths. The document table is indexed by the
+database's full-text engine:
+
+- SQLite: an external-content FTS5 table kept in sync by triggers.
+- PostgreSQL: a GIN index on `to_tsvector('simple', content)`.
+- Anything else falls back to `icontains` on the single document column.
+
+The index is created by migration 0009.
+
+Document text is stored pre-tokenized (letters and digits separated by spaces)
+so every backend splits "10.2.0.1" or "web-01.example.com" the same way, and
+a query word such as "10.2" is matched as the prefix phrase "10 2*".
+
+Documents are rebuilt from signals (see `sms.signals`) and by the
+`rebuild_search_index` command.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import *
+
+SERVICE_SYSTEM_FIELDS = (
+    "name",
+    "location",
+    "hostname",
+    "ip_address",
+    "operating_system",
+)
+# Related rows whose values are folded into their service system's document.
+RELATED_FIELDS = (
+    (EnvironmentVariable, "name"),
+    (Dependency, "name"),
+    (Application, "name"),
+    (ConfigurationFile, "file_path"),
+)
+FTS_TABLE = "sms_searchdocument_fts"
+
+
+def build_documents(service_system_ids):
+    """
+    Search text for each of the given (existing) service systems, keyed by id.
+    """
+    documents = {
+        row[0]: [str(value) for value in row[1:]]
+        for row in ServiceSystem.objects.filter(pk__in=service_system_ids).values_list(
+            "pk", *SERVICE_SYSTEM_FIELDS
+        )
+    }
+    for model, field in RELATED_FIELDS:
+        rows = model.objects.filter(service_system__in=list(documents)).values_list(
+            "service_system", field
+        )
+        for service_system_id, value in rows:
+            documents[service_system_id].append(value)
+    return {pk: " ".join(tokenize(" ".join(parts))) for pk, parts in documents.items()}
+
+
+def index_service_systems(service_system_ids):
+    service_system_ids = set(service_system_ids)
+    documents = build_documents(service_system_ids)
+    SearchDocument.objects.filter(pk__in=service_system_ids - set(documents)).delete()
+    SearchDocument.objects.bulk_create(
+        [
+            SearchDocument(service_system_id=pk, content=content)
+            for pk, content in documents.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["service_system"],
+        update_fields=["content"],
+    )
+
+
+def tokenize(text):
+    return re.findall(r"[^\W_]+", text)
+
+
+def terms(query):
+    """
+    Split a query into words, each a tuple of tokens, e.g.
+    "web 10.2" -> [("web",), ("10", "2")].
+    """
+    words = [tuple(tokenize(word)) for word in query.split()]
+    return [word for word in words if word]
+
+
+def search_ids(query):
+    """
+    Subquery of the ids of service systems matching every word of `query`
+    as a prefix.
+    """
+    words = terms(query)
+    if not words:
+        return SearchDocument.objects.none().values("pk")
+    if connection.vendor == "sqlite":
+        # A word such as "10.2" becomes the prefix phrase "10 2"*.
+        match = " ".join('"%s"*' % " ".join(word) for word in words)
+        return RawSQL(
+            "SELECT rowid FROM %s WHERE %s MATCH %%s" % (FTS_TABLE, FTS_TABLE),
+            (match,),
+        )
+    if connection.vendor == "postgresql":
+        tsquery = " & ".join(
+            "(%s)" % " <-> ".join("%s:*" % token for token in word) for word in words
+        )
+        return RawSQL(
+            "SELECT service_system_id FROM sms_searchdocument "
+            "WHERE to_tsvector('simple', content) @@ to_tsquery('simple', %s)",
+            (tsquery,),
+        )
+    queryset = SearchDocument.objects.all()
+    for word in words:
+        queryset = queryset.filter(content__icontains=" ".join(word))
+    return queryset.values("pk")
+
+
+def search(queryset, query):
+    return queryset.filter(pk__in=search_ids(query))
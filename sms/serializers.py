@@ -1,6 +1,10 @@
 from django.contrib.auth.models import Group, User
+from django.db import models
 from rest_framework import serializers
 
+from . import crypto
+from .models import *
+
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -11,4 +15,208 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
 class GroupSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Group
-        fields = ['url', 'name']
\ No newline at end of file
+        fields = ['url', 'name']
+
+
+def split_param(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+class SealedField(serializers.CharField):
+    """
+    An EncryptedTextField, rendered decrypted unless the serializer context
+    has `sealed` set (stored documents keep the tokens).
+    """
+
+    def to_representation(self, value):
+        if self.context.get("sealed"):
+            return str(value)
+        return crypto.reveal(value)
+
+
+class RevealingListSerializer(serializers.ListSerializer):
+    """
+    Decrypts the secret values of a whole page in one batch before its rows
+    are rendered one by one.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        data = list(data)
+        names = crypto.sealed_fields(self.child.Meta.model)
+        if names and not self.context.get("sealed"):
+            crypto.reveal_many([getattr(row, name) for row in data for name in names])
+        return super().to_representation(data)
+
+
+class InventorySerializer(serializers.ModelSerializer):
+    """
+    Model serializer supporting sparse fieldsets (`?fields=name,version`).
+
+    The selection is only read from the request for the top-level serializer;
+    nested serializers always render every field.
+    """
+
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        EncryptedTextField: SealedField,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or self.parent is not None:
+            return
+        requested = split_param(request.query_params.get("fields"))
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+
+class BaseModelSerializer(InventorySerializer):
+    class Meta:
+        fields = "__all__"
+        list_serializer_class = RevealingListSerializer
+
+
+class EnvironmentVariableSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = EnvironmentVariable
+
+
+class ConfigurationFileSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = ConfigurationFile
+
+
+class DependencySerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = Dependency
+
+
+class NetworkConfigurationSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = NetworkConfiguration
+
+
+class ApplicationSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = Application
+
+
+class PortSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = Port
+
+
+class LoggingConfigurationSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = LoggingConfiguration
+
+
+class MonitoringToolSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = MonitoringTool
+
+
+class HealthCheckSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = HealthCheck
+
+
+class ContainerizationSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = Containerization
+
+
+class DeploymentToolSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = DeploymentTool
+
+
+class ScalingConfigurationSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = ScalingConfiguration
+
+
+class BackupConfigurationSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = BackupConfiguration
+
+
+class UserPermissionSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = UserPermission
+
+
+class DisasterRecoverySerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = DisasterRecovery
+
+
+class RunbookSerializer(BaseModelSerializer):
+    class Meta(BaseModelSerializer.Meta):
+        model = Runbook
+
+
+# Expansion name -> serializer for every model hanging off a ServiceSystem.
+# The names double as the API route prefixes (with dashes).
+CHILD_SERIALIZERS = {
+    "environment_variables": EnvironmentVariableSerializer,
+    "configuration_files": ConfigurationFileSerializer,
+    "dependencies": DependencySerializer,
+    "network_configurations": NetworkConfigurationSerializer,
+    "applications": ApplicationSerializer,
+    "ports": PortSerializer,
+    "logging_configurations": LoggingConfigurationSerializer,
+    "monitoring_tools": MonitoringToolSerializer,
+    "health_checks": HealthCheckSerializer,
+    "containerizations": ContainerizationSerializer,
+    "deployment_tools": DeploymentToolSerializer,
+    "scaling_configurations": ScalingConfigurationSerializer,
+    "backup_configurations": BackupConfigurationSerializer,
+    "user_permissions": UserPermissionSerializer,
+    "disaster_recoveries": DisasterRecoverySerializer,
+    "runbooks": RunbookSerializer,
+}
+
+
+def related_accessor(serializer_class):
+    return serializer_class.Meta.model._meta.model_name + "_set"
+
+
+class ServiceSystemSerializer(InventorySerializer):
+    """
+    ServiceSystem with optional nested children (`?expand=ports,applications`).
+
+    Expanded relations are read from `<model>_set`, which the view prefetches,
+    so expanding costs one query per relation rather than one per row.
+    """
+
+    class Meta:
+        model = ServiceSystem
+        fields = "__all__"
+
+    def __init__(self, *args, **kwargs):
+        expand = kwargs.pop("expand", ())
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            serializer_class = CHILD_SERIALIZERS[name]
+            self.fields[name] = serializer_class(
+                many=True, read_only=True, source=related_accessor(serializer_class)
+            )
+
+
+class SnapshotApplicationSerializer(ApplicationSerializer):
+    ports = PortSerializer(many=True, read_only=True, source="port_set")
+
+
+# Every inventory model by its API name, parents first.
+INVENTORY_MODELS = {
+    "service_systems": ServiceSystem,
+    **{
+        name: serializer_class.Meta.model
+        for name, serializer_class in CHILD_SERIALIZERS.items()
+    },
+}
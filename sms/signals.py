@@ -0,0 +1,242 @@
+"""
+Keep derived data (search documents, snapshot cache versions, service system
+documents, the change log and its history deltas, version summaries) in step
+with inventory writes.
+
+Row-level writes arrive through post_save/post_delete. Bulk writers such as
+the importer bypass those signals and send `bulk_saved` instead, with the
+instances they wrote, whether they were created or updated and, for updates,
+the `fields` written, whose new values the instances must hold. Deleting
+service systems only marks them, and sends `soft_deleted` with their ids.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import cache, changes, documents, history, search
+from .models import *
+from .serializers import INVENTORY_MODELS
+
+bulk_saved = Signal()
+# Names per version summary refresh, well under every backend's parameter
+# limit.
+SUMMARY_CHUNK_SIZE = 500
+
+
+def service_system_id(instance):
+    if isinstance(instance, ServiceSystem):
+        return instance.pk
+    return instance.service_system_id
+
+
+class Pending(threading.local):
+    """
+    Keys (service system ids, ...) to hand to `callback` when the current
+    transaction commits, so an admin save touching dozens of inline rows
+    handles each key once.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.keys = set()
+        self.deferred = 0
+
+    def add(self, keys):
+        self.keys.update(keys)
+        if not self.deferred:
+            # Registered on every call: a rolled back transaction or
+            # savepoint drops its callbacks but not the keys, which must
+            # still be flushed by the next commit. The first callback to run
+            # flushes everything; later ones find the set empty.
+            transaction.on_commit(self.flush)
+
+    def flush(self):
+        keys, self.keys = self.keys, set()
+        if keys:
+            self.callback(keys)
+
+    @contextmanager
+    def defer(self):
+        """
+        Hold keys until the block exits rather than handling them on every
+        commit inside it, e.g. across the batches of an import.
+        """
+        self.deferred += 1
+        try:
+            yield
+        finally:
+            self.deferred -= 1
+            if not self.deferred:
+                transaction.on_commit(self.flush)
+
+
+def refresh_version_summaries(keys):
+    """
+    Refresh the VersionSummary rows of `(model, name)` keys.
+    """
+    names = {}
+    for model, name in keys:
+        names.setdefault(model, set()).add(name)
+    for model, model_names in names.items():
+        model_names = sorted(model_names)
+        for start in range(0, len(model_names), SUMMARY_CHUNK_SIZE):
+            VersionSummary.refresh(
+                model, model_names[start : start + SUMMARY_CHUNK_SIZE]
+            )
+
+
+pending_reindex = Pending(search.index_service_systems)
+pending_documents = Pending(documents.refresh)
+pending_invalidation = Pending(cache.bump_versions)
+pending_summaries = Pending(refresh_version_summaries)
+SEARCHED_MODELS = (ServiceSystem,) + tuple(model for model, _ in search.RELATED_FIELDS)
+INVENTORY = tuple(INVENTORY_MODELS.values())
+VERSIONED = tuple(model for model in INVENTORY if issubclass(model, VersionedModel))
+
+
+def changed(sender, ids):
+    if documents.enabled():
+        # Registered first so documents are rebuilt before the cache moves
+        # to a new version: a reader missing the cache then loads the new
+        # document, not the old one.
+        pending_documents.add(ids)
+    pending_invalidation.add(ids)
+    if sender in SEARCHED_MODELS:
+        pending_reindex.add(ids)
+
+
+def remember_previous(sender, instance, update_fields=None, **kwargs):
+    # History stores what an update changed, and the summary of a versioned
+    # row's old name must be refreshed too once the row no longer carries
+    # it: both need the stored values.
+    if instance._state.adding:
+        return
+    names = None if update_fields is None else set(update_fields)
+    instance._previous = history.read_values(sender, [instance.pk], names).get(
+        instance.pk
+    )
+
+
+def on_change(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    previous = instance.__dict__.pop("_previous", None)
+    changed(sender, {service_system_id(instance)})
+    if signal is post_delete:
+        entries = [
+            (
+                instance.pk,
+                service_system_id(instance),
+                ChangeLogEntry.DELETE,
+                None,
+                None,
+            )
+        ]
+    elif created or previous is None:
+        entries = [
+            (
+                instance.pk,
+                service_system_id(instance),
+                ChangeLogEntry.CREATE if created else ChangeLogEntry.UPDATE,
+                history.row_values(instance),
+                None,
+            )
+        ]
+    elif previous.get("service_system", service_system_id(instance)) != (
+        service_system_id(instance)
+    ):
+        # Moved to another service system: gone from one, new on the other.
+        entries = [
+            (
+                instance.pk,
+                previous["service_system"],
+                ChangeLogEntry.DELETE,
+                None,
+                None,
+            ),
+            (
+                instance.pk,
+                service_system_id(instance),
+                ChangeLogEntry.CREATE,
+                history.row_values(instance),
+                None,
+            ),
+        ]
+        changed(sender, {previous["service_system"]})
+    else:
+        current = history.row_values(instance, update_fields)
+        entries = [
+            (
+                instance.pk,
+                service_system_id(instance),
+                ChangeLogEntry.UPDATE,
+                *history.diff(previous, current),
+            )
+        ]
+    changes.record(sender, entries)
+    if sender in VERSIONED:
+        names = {instance.name, (previous or {}).get("name")}
+        pending_summaries.add({(sender, name) for name in names - {None}})
+
+
+# Connected for the inventory models only: other models (version summaries,
+# change log entries, checkpoints) then have no delete listeners, so
+# QuerySet.delete() removes them in one DELETE without fetching the rows.
+for model in INVENTORY:
+    pre_save.connect(remember_previous, sender=model)
+    post_save.connect(on_change, sender=model)
+    post_delete.connect(on_change, sender=model)
+
+
+@receiver(bulk_saved)
+def on_bulk_save(sender, instances, created=False, fields=None, **kwargs):
+    if sender not in INVENTORY:
+        return
+    changed(sender, {service_system_id(instance) for instance in instances})
+    operation = ChangeLogEntry.CREATE if created else ChangeLogEntry.UPDATE
+    if created or fields is not None:
+        values = {
+            instance.pk: history.row_values(instance, fields) for instance in instances
+        }
+    else:
+        # Without `fields`, the instances may not hold what was written.
+        values = history.read_values(sender, [instance.pk for instance in instances])
+    changes.record(
+        sender,
+        [
+            (
+                instance.pk,
+                service_system_id(instance),
+                operation,
+                values.get(instance.pk, {}),
+                None,
+            )
+            for instance in instances
+        ],
+    )
+    if sender in VERSIONED:
+        pending_summaries.add({(sender, instance.name) for instance in instances})
+
+
+@receiver(soft_deleted)
+def on_soft_delete(sender, ids, **kwargs):
+    # The rows stay until purged, but are gone from every default manager:
+    # drop the systems from search, caches and version counts now.
+    ids = set(ids)
+    changed(ServiceSystem, ids)
+    changes.record(
+        ServiceSystem, [(pk, pk, ChangeLogEntry.DELETE, None, None) for pk in ids]
+    )
+    ids = sorted(ids)
+    for model in VERSIONED:
+        for start in range(0, len(ids), SUMMARY_CHUNK_SIZE):
+            names = (
+                model.all_objects.filter(
+                    service_system__in=ids[start : start + SUMMARY_CHUNK_SIZE]
+                )
+                .values_list("name", flat=True)
+                .distinct()
+            )
+            pending_summaries.add({(model, name) for name in names})
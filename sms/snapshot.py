@@ -0,0 +1,103 @@
+"""
+Full configuration snapshot of one ServiceSystem.
+
+The whole object graph is loaded with one query for the system plus one
+prefetch per related model (ports are nested under their applications), so
+the query count is fixed regardless of how many rows a host has.
+"""
+
+import hashlib
+import itertools
+
+from django.db.models import Prefetch
+
+from .models import *
+from .serializers import *
+
+
+def snapshot_queryset():
+    prefetches = []
+    for name, serializer_class in CHILD_SERIALIZERS.items():
+        model = serializer_class.Meta.model
+        if model is Port:
+            continue
+        queryset = model.objects.order_by("pk")
+        if model is Application:
+            queryset = queryset.prefetch_related(
+                Prefetch("port_set", queryset=Port.objects.order_by("pk"))
+            )
+        prefetches.append(Prefetch(related_accessor(serializer_class), queryset))
+    return ServiceSystem.objects.prefetch_related(*prefetches)
+
+
+def iter_graph(service_system):
+    """
+    Yield every instance of a prefetched snapshot graph, system included.
+    """
+    yield service_system
+    for name, serializer_class in CHILD_SERIALIZERS.items():
+        if serializer_class.Meta.model is Port:
+            continue
+        for instance in getattr(
+            service_system, related_accessor(serializer_class)
+        ).all():
+            yield instance
+            if isinstance(instance, Application):
+                yield from instance.port_set.all()
+
+
+def snapshot_etag(service_system):
+    """
+    Version tag and last modification time of a prefetched snapshot graph.
+
+    Built from the newest `updated_at` in the graph plus the number of rows,
+    so deleting a row changes the tag even though no timestamp moves.
+    """
+    count = 0
+    latest = service_system.updated_at
+    for instance in iter_graph(service_system):
+        count += 1
+        latest = max(latest, instance.updated_at)
+    digest = hashlib.sha1(
+        ("%s:%s:%s" % (service_system.pk, latest.isoformat(), count)).encode()
+    ).hexdigest()
+    return digest, latest
+
+
+def build_snapshots(service_systems):
+    """
+    Snapshot documents of prefetched `service_systems`. Each related model is
+    serialized for all of them at once, so serializer fields are built once
+    per model rather than once per system. Secret values are left encrypted
+    (see crypto.reveal_snapshot), so documents can be cached and stored.
+    """
+    context = {"sealed": True}
+    documents = [
+        dict(data)
+        for data in ServiceSystemSerializer(
+            service_systems, many=True, context=context
+        ).data
+    ]
+    for name, serializer_class in CHILD_SERIALIZERS.items():
+        model = serializer_class.Meta.model
+        if model is Port:
+            continue
+        if model is Application:
+            serializer_class = SnapshotApplicationSerializer
+        accessor = related_accessor(serializer_class)
+        rows = [
+            list(getattr(service_system, accessor).all())
+            for service_system in service_systems
+        ]
+        serialized = iter(
+            serializer_class(
+                itertools.chain.from_iterable(rows), many=True, context=context
+            ).data
+        )
+        for data, instances in zip(documents, rows):
+            data[name] = list(itertools.islice(serialized, len(instances)))
+    return documents
+
+
+def build_snapshot(service_system):
+    return build_snapshots([service_system])[0]
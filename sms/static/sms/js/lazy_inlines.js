@@ -0,0 +1,90 @@
+'use strict';
+{
+    function renderPage(section, data) {
+        const body = section.querySelector('.lazy-inline-body');
+        body.replaceChildren();
+        if (!data.count) {
+            const empty = document.createElement('p');
+            empty.textContent = 'None.';
+            body.appendChild(empty);
+            return;
+        }
+        const table = document.createElement('table');
+        const head = table.createTHead().insertRow();
+        for (const column of data.columns) {
+            const th = document.createElement('th');
+            th.textContent = column;
+            head.appendChild(th);
+        }
+        const rows = table.createTBody();
+        for (const result of data.results) {
+            const row = rows.insertRow();
+            result.values.forEach((value, index) => {
+                const cell = row.insertCell();
+                if (index === 0) {
+                    const link = document.createElement('a');
+                    link.href = result.url;
+                    link.textContent = value;
+                    cell.appendChild(link);
+                } else {
+                    cell.textContent = value;
+                }
+            });
+        }
+        body.appendChild(table);
+
+        if (data.num_pages > 1) {
+            const pager = document.createElement('p');
+            pager.className = 'paginator';
+            const previous = document.createElement('a');
+            previous.href = '#';
+            previous.textContent = '‹ previous';
+            previous.hidden = data.page <= 1;
+            previous.addEventListener('click', (event) => {
+                event.preventDefault();
+                load(section, data.page - 1);
+            });
+            const next = document.createElement('a');
+            next.href = '#';
+            next.textContent = 'next ›';
+            next.hidden = data.page >= data.num_pages;
+            next.addEventListener('click', (event) => {
+                event.preventDefault();
+                load(section, data.page + 1);
+            });
+            const status = document.createElement('span');
+            status.textContent = ` Page ${data.page} of ${data.num_pages} (${data.count} total) `;
+            pager.append(previous, status, next);
+            body.appendChild(pager);
+        }
+    }
+
+    function load(section, page) {
+        const url = new URL(section.dataset.url, window.location.href);
+        url.searchParams.set('page', page);
+        fetch(url, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .then((data) => renderPage(section, data))
+            .catch((error) => {
+                const body = section.querySelector('.lazy-inline-body');
+                body.textContent = `Could not load rows: ${error.message}`;
+                delete section.dataset.loaded;
+            });
+    }
+
+    window.addEventListener('load', function() {
+        for (const section of document.querySelectorAll('details.lazy-inline')) {
+            section.addEventListener('toggle', () => {
+                if (section.open && !section.dataset.loaded) {
+                    section.dataset.loaded = 'true';
+                    load(section, 1);
+                }
+            });
+        }
+    });
+}
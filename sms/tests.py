@@ -0,0 +1,1128 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    async_views,
+    cache,
+    capacity,
+    crypto,
+    healthchecks,
+    history,
+    network,
+    performance,
+    ports,
+    purge,
+)
+from .exporter import Watermark, export_stream
+from .fleet import generate_fleet
+from .admin import ServiceSystemAdmin
+from .importer import InventoryImporter, read_jsonl
+from .models import (
+    Application,
+    ChangeLogEntry,
+    DerivedColumnsMixin,
+    EnvironmentVariable,
+    HealthCheck,
+    HealthCheckResult,
+    HealthCheckRun,
+    HistoryCheckpoint,
+    NamedModel,
+    NetworkConfiguration,
+    Port,
+    ServiceSystem,
+    VersionSummary,
+)
+from .pagination import InventoryCursorPagination
+from .search import search
+from .serializers import INVENTORY_MODELS
+from .snapshot import snapshot_queryset
+
+
+def make_service_system(name, **values):
+    return ServiceSystem.objects.create(
+        **{
+            "name": name,
+            "description": "",
+            "location": "dc1",
+            "hostname": name,
+            "ip_address": "10.0.0.1",
+            "operating_system": "linux",
+            "cpu_allocation": "2",
+            "ram_allocation": "4GB",
+            "disk_allocation": "100GB",
+            **values,
+        }
+    )
+
+
+class CapacityTests(TestCase):
+    def test_parse_cores(self):
+        for value, cores in [
+            ("4", 4),
+            ("8 vCPU", 8),
+            ("16 cores", 16),
+            ("2x8", 16),
+            ("2 × 4 threads", 8),
+            ("0.5", 1),
+            ("1,024", 1024),
+            ("", None),
+            (None, None),
+            ("many", None),
+            ("4 GPUs", None),
+            ("99999999999x9", None),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(capacity.parse_cores(value), cores)
+
+    def test_parse_bytes(self):
+        for value, size in [
+            ("16GB", 16 * 1024**3),
+            ("512 MiB", 512 * 1024**2),
+            ("1.5T", 3 * 1024**4 // 2),
+            ("16 gigabytes", 16 * 1024**3),
+            ("100 bytes", 100),
+            ("8", 8 * 1024**3),
+            ("1,024 GB", 1024**4),
+            ("7 EiB", 7 * 1024**6),
+            ("10 EB", None),
+            ("4GB ram", None),
+            ("1,02 GB", None),
+            ("lots", None),
+            (None, None),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(capacity.parse_bytes(value), size)
+
+    def test_out_of_range_values_are_saved_unparsed(self):
+        system = make_service_system(
+            "web-1", cpu_allocation="99999999999x9", ram_allocation="10 EB"
+        )
+        system.refresh_from_db()
+        self.assertEqual(
+            (system.cpu_cores, system.ram_bytes, system.disk_bytes),
+            (None, None, 100 * 1024**3),
+        )
+
+
+class DerivedColumnsTests(TestCase):
+    def test_save_refreshes_the_columns_derived_from_saved_fields(self):
+        system = make_service_system("web-1")
+        system.ip_address = "10.0.0.2"
+        system.cpu_allocation = "8"
+        system.save(update_fields=["ip_address"])
+        system.refresh_from_db()
+        self.assertEqual(system.ip_key, network.address_key("10.0.0.2"))
+        # cpu_allocation was not saved, nor is the core count parsed from it.
+        self.assertEqual((system.cpu_allocation, system.cpu_cores), ("2", 2))
+
+    def test_sources_require_derived_values(self):
+        with self.assertRaisesMessage(TypeError, "does not define derived_values()"):
+
+            class Derived(DerivedColumnsMixin):
+                derived_from = ("name",)
+
+
+class PendingTests(TransactionTestCase):
+    def snapshot(self, pk):
+        return cache.cached_snapshot(pk, lambda: snapshot_queryset().get(pk=pk))
+
+    def test_commit_after_rollback_refreshes_cache_and_search(self):
+        system = make_service_system("web-1")
+        self.assertEqual(self.snapshot(system.pk).data["location"], "dc1")
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            system.location = "dc3"
+            system.save()
+            raise RuntimeError
+
+        system.location = "committed-new"
+        system.save()
+        self.assertEqual(self.snapshot(system.pk).data["location"], "committed-new")
+        self.assertEqual(
+            search(ServiceSystem.objects.all(), "committed-new").count(), 1
+        )
+
+
+class ApiPermissionTests(TestCase):
+    def setUp(self):
+        self.system = make_service_system("web-1")
+        self.user = get_user_model().objects.create_user("reader")
+        self.client.force_login(self.user)
+
+    def grant(self, *models):
+        self.user.user_permissions.add(
+            *Permission.objects.filter(
+                content_type__app_label="sms",
+                codename__in=["view_%s" % model._meta.model_name for model in models],
+            )
+        )
+
+    def assertStatus(self, status_code, *urls):
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, status_code)
+
+    def test_reads_need_view_permissions(self):
+        snapshot = "/api/service-systems/%d/snapshot/" % self.system.pk
+        self.assertStatus(
+            403,
+            "/api/service-systems/",
+            "/api/environment-variables/",
+            "/api/capacity/",
+            "/api/async/service-systems/",
+            snapshot,
+        )
+
+        self.grant(ServiceSystem)
+        self.assertStatus(
+            200,
+            "/api/service-systems/",
+            "/api/capacity/",
+            "/api/async/service-systems/",
+        )
+        self.assertStatus(
+            403,
+            "/api/environment-variables/",
+            "/api/service-systems/?expand=environment_variables",
+            snapshot,
+            "/api/async/service-systems/%d/snapshot/" % self.system.pk,
+        )
+
+        self.grant(*INVENTORY_MODELS.values())
+        self.assertStatus(
+            200,
+            "/api/environment-variables/",
+            "/api/service-systems/?expand=environment_variables",
+            snapshot,
+            "/api/async/service-systems/%d/snapshot/" % self.system.pk,
+        )
+
+    def test_export_needs_view_permission(self):
+        self.grant(EnvironmentVariable)
+        self.assertStatus(403, "/api/export/service_systems.ndjson")
+        self.assertStatus(200, "/api/export/environment_variables.ndjson")
+        self.assertStatus(404, "/api/export/unknown.ndjson")
+
+
+class SnapshotViewTests(TestCase):
+    def setUp(self):
+        self.system = make_service_system("web-1")
+        user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.client.force_login(user)
+
+    def test_cache_key_is_the_integer_pk(self):
+        cache.get_cache().clear()
+        for pk in (str(self.system.pk), "0%d" % self.system.pk):
+            response = self.client.get("/api/service-systems/%s/snapshot/" % pk)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["name"], "web-1")
+        self.assertEqual(cache.stats()["misses"], 1)
+        response = self.client.get("/api/service-systems/1x/snapshot/")
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        make_service_system("web-1")
+        user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.client.force_login(user)
+
+    @override_settings(
+        SMS_QUERY_BUDGETS={"admin:sms_servicesystem_changelist": 1},
+        SMS_QUERY_BUDGET_MODE="raise",
+    )
+    def test_request_over_budget_raises(self):
+        with self.assertRaisesMessage(
+            performance.QueryBudgetExceeded, "admin:sms_servicesystem_changelist"
+        ):
+            self.client.get("/admin/sms/servicesystem/")
+
+    @override_settings(
+        SMS_QUERY_BUDGETS={"admin:sms_servicesystem_changelist": 1},
+        SMS_QUERY_BUDGET_MODE="log",
+    )
+    def test_request_over_budget_is_logged(self):
+        with self.assertLogs("sms.performance", "WARNING"):
+            response = self.client.get("/admin/sms/servicesystem/")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(
+        SMS_QUERY_BUDGETS={"admin:*": 100}, SMS_QUERY_BUDGET_MODE="raise"
+    )
+    def test_request_within_budget(self):
+        response = self.client.get("/admin/sms/servicesystem/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_block_over_budget_raises(self):
+        with self.assertRaises(performance.QueryBudgetExceeded):
+            with performance.query_budget(1, mode="raise"):
+                list(ServiceSystem.objects.all())
+                list(EnvironmentVariable.objects.all())
+
+
+class RowHistoryTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.client.force_login(user)
+
+    def test_history_follows_the_row_across_service_systems(self):
+        variable = EnvironmentVariable.objects.create(
+            service_system=make_service_system("web-1"), name="A", value="1"
+        )
+        variable.service_system = make_service_system("web-2")
+        variable.save()
+        variable.value = "2"
+        variable.save()
+
+        response = self.client.get(
+            "/api/environment-variables/%d/history/" % variable.pk
+        )
+        self.assertEqual(response.status_code, 200)
+        revisions = response.json()
+        self.assertEqual(
+            [revision["operation"] for revision in revisions],
+            ["create", "delete", "create", "update"],
+        )
+        self.assertEqual(revisions[0]["values"]["value"], "1")
+        self.assertEqual(revisions[-1]["values"]["value"], "2")
+
+
+class CheckpointTests(TestCase):
+    def test_checkpoint_holds_the_current_state(self):
+        system = make_service_system("web-1")
+        EnvironmentVariable.objects.create(service_system=system, name="A", value="1")
+
+        saved = history.checkpoint(system.pk)
+        self.assertEqual(
+            saved.seq,
+            ChangeLogEntry.objects.filter(service_system_id=system.pk).latest("pk").pk,
+        )
+        self.assertIsNotNone(saved.taken_at)
+        state = history.decompress(saved.state)
+        self.assertEqual(
+            [row["value"] for row in state["environment_variables"].values()], ["1"]
+        )
+
+    def test_system_without_changes_is_not_checkpointed(self):
+        system = make_service_system("web-1")
+        ChangeLogEntry.objects.filter(service_system_id=system.pk).delete()
+
+        self.assertIsNone(history.checkpoint(system.pk))
+        self.assertFalse(HistoryCheckpoint.objects.exists())
+
+
+class VersionSummaryTests(TestCase):
+    def test_refresh_replaces_the_summary_of_a_name(self):
+        for name, version in [("web-1", "1.9"), ("web-2", "1.10"), ("web-3", "1.10")]:
+            Application.objects.create(
+                service_system=make_service_system(name),
+                name="nginx",
+                version=version,
+                description="",
+            )
+        VersionSummary.objects.create(
+            model="application",
+            name="nginx",
+            version="1.8",
+            service_systems=1,
+            latest=True,
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            VersionSummary.refresh(Application, ["nginx"])
+        self.assertEqual(
+            list(
+                VersionSummary.objects.order_by("version").values_list(
+                    "version", "service_systems", "latest"
+                )
+            ),
+            [("1.10", 2, True), ("1.9", 1, False)],
+        )
+        # The stale rows go in one DELETE, without being read first.
+        self.assertFalse(
+            any(
+                query["sql"].startswith("SELECT")
+                and "sms_versionsummary" in query["sql"]
+                for query in queries
+            )
+        )
+
+
+@override_settings(SMS_CHANGES_POLL_INTERVAL=0.01)
+class ChangeStreamTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.async_client.force_login(self.user)
+        self.system = make_service_system("web-1")
+        self.seq = ChangeLogEntry.objects.latest("pk").pk
+
+    async def read(self, response):
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return b"".join([part async for part in response.streaming_content]).decode()
+
+    def test_stream_under_wsgi_closes_at_once(self):
+        request = RequestFactory().get("/api/changes/stream/", {"since": 0})
+        request.user = self.user
+        started = time.monotonic()
+        response = async_to_sync(async_views.change_stream)(request)
+        body = async_to_sync(self.read)(response)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(body.startswith("retry: 10\nid: 0\n\n"))
+        self.assertIn("id: %d\nevent: change\n" % self.seq, body)
+
+    async def test_stream_under_asgi_waits_for_changes(self):
+        response = await self.async_client.get(
+            "/api/changes/stream/", {"since": 0, "timeout": 0.3}
+        )
+        started = time.monotonic()
+        body = await self.read(response)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertIn("id: %d\nevent: change\n" % self.seq, body)
+
+
+class UniqueNameTests(TestCase):
+    NAMED_MODELS = [
+        model for model in INVENTORY_MODELS.values() if issubclass(model, NamedModel)
+    ]
+
+    def test_names_are_unique_per_service_system(self):
+        web_1, web_2 = make_service_system("web-1"), make_service_system("web-2")
+        for model in self.NAMED_MODELS:
+            with self.subTest(model=model.__name__):
+                model.objects.create(service_system=web_1, name="shared")
+                # The same name on another host is a different row.
+                model.objects.create(service_system=web_2, name="shared")
+                duplicate = model(service_system=web_1, name="shared")
+                with self.assertRaises(ValidationError) as raised:
+                    duplicate.full_clean(
+                        exclude=[
+                            field.name
+                            for field in model._meta.fields
+                            if field.name not in ("service_system", "name")
+                        ]
+                    )
+                self.assertIn("__all__", raised.exception.message_dict)
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    duplicate.save()
+
+    def test_named_models(self):
+        self.assertEqual(
+            {model.__name__ for model in self.NAMED_MODELS},
+            {
+                "EnvironmentVariable",
+                "Dependency",
+                "Application",
+                "MonitoringTool",
+                "DeploymentTool",
+            },
+        )
+
+
+class PurgeTests(TestCase):
+    def add_rows(self, service_system):
+        application = Application.objects.create(
+            service_system=service_system, name="app", version="1"
+        )
+        for port_number in range(8000, 8005):
+            Port.objects.create(
+                service_system=service_system,
+                application=application,
+                port_number=port_number,
+                protocol="tcp",
+            )
+        for index in range(3):
+            EnvironmentVariable.objects.create(
+                service_system=service_system, name="VAR_%d" % index
+            )
+
+    def test_purge_removes_deleted_systems_in_batches(self):
+        deleted = make_service_system("web-1")
+        self.add_rows(deleted)
+        kept = make_service_system("web-2")
+        self.add_rows(kept)
+        deleted.delete()
+        entries = ChangeLogEntry.objects.count()
+
+        with mock.patch.object(purge, "delete", wraps=purge.delete) as delete:
+            counts = purge.purge(batch_size=2)
+
+        self.assertEqual(
+            counts,
+            {
+                "sms.Port": 5,
+                "sms.Application": 1,
+                "sms.EnvironmentVariable": 3,
+                "sms.ServiceSystem": 1,
+            },
+        )
+        batches = [(call.args[0], len(call.args[1])) for call in delete.call_args_list]
+        self.assertTrue(all(size <= 2 for _, size in batches))
+        # Ports go before the application they cascade from.
+        models = [model for model, _ in batches]
+        self.assertLess(models.index(Port), models.index(Application))
+        self.assertEqual(models[-1], ServiceSystem)
+        self.assertFalse(ServiceSystem.all_objects.filter(pk=deleted.pk).exists())
+        for model in (Port, Application, EnvironmentVariable):
+            self.assertFalse(model.all_objects.filter(service_system=deleted).exists())
+            self.assertTrue(model.objects.filter(service_system=kept).exists())
+        # The deletes were logged when the system was deleted.
+        self.assertEqual(ChangeLogEntry.objects.count(), entries)
+
+
+class SecretsTestMixin:
+    # Plaintexts that look like tokens.
+    LOOKALIKES = ["sms:v1:1:not a token", "sms:v1:x:y", "sms:v1:1:" + "A" * 40]
+
+    def setUp(self):
+        self.system = make_service_system("web-1")
+        user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.client.force_login(user)
+
+    def tearDown(self):
+        crypto.clear_caches()
+
+    def stored(self, variable):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT value FROM sms_environmentvariable WHERE id = %s",
+                [variable.pk],
+            )
+            return cursor.fetchone()[0]
+
+    def api_value(self, variable):
+        response = self.client.get("/api/environment-variables/%d/" % variable.pk)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["value"]
+
+    def round_trip(self):
+        """
+        Export the environment variables, overwrite their values, then
+        import the export back.
+        """
+        variables = [
+            EnvironmentVariable.objects.create(
+                service_system=self.system, name="PASSWORD", value="hunter2"
+            ),
+            *self.create_lookalikes(),
+        ]
+        values = [self.api_value(variable) for variable in variables]
+        export = b"".join(export_stream("environment_variables")).decode()
+        for value in values:
+            self.assertIn(json.dumps(value), export)
+        EnvironmentVariable.objects.update(value="overwritten")
+        importer = InventoryImporter().run(
+            read_jsonl(StringIO(export), "environment_variables")
+        )
+        self.assertEqual(importer.errors, [])
+        self.assertEqual(importer.updated, len(variables))
+        self.assertEqual([self.api_value(variable) for variable in variables], values)
+        return variables
+
+    def create_lookalikes(self):
+        return [
+            EnvironmentVariable.objects.create(
+                service_system=self.system, name="V%d" % index, value=value
+            )
+            for index, value in enumerate(self.LOOKALIKES)
+        ]
+
+
+class PlaintextValueTests(SecretsTestMixin, TestCase):
+    def test_export_round_trip(self):
+        for variable in self.round_trip():
+            self.assertEqual(self.stored(variable), self.api_value(variable))
+
+    def test_token_lookalikes_are_plaintext(self):
+        for variable, value in zip(self.create_lookalikes(), self.LOOKALIKES):
+            variable = EnvironmentVariable.objects.get(pk=variable.pk)
+            self.assertNotIsInstance(variable.value, crypto.Sealed)
+            self.assertEqual(self.api_value(variable), value)
+            response = self.client.get(
+                "/admin/sms/environmentvariable/%d/change/" % variable.pk
+            )
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/service-systems/%d/snapshot/" % self.system.pk)
+        self.assertEqual(response.status_code, 200)
+
+
+class MissingCryptographyTests(SecretsTestMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "keys.json")
+        crypto.add_key(path)
+        settings = override_settings(SMS_SECRETS_KEY_FILE=path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patch = mock.patch.object(crypto, "AESGCM", None)
+        patch.start()
+        self.addCleanup(patch.stop)
+        super().setUp()
+
+    def test_encrypting_needs_cryptography(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "cryptography"):
+            EnvironmentVariable.objects.create(
+                service_system=self.system, name="PASSWORD", value="hunter2"
+            )
+
+    def test_lookalikes_without_data_keys_are_plaintext(self):
+        with override_settings(SMS_SECRETS_KEY_FILE=None):
+            variables = self.create_lookalikes()
+        for variable, value in zip(variables, self.LOOKALIKES):
+            self.assertEqual(self.api_value(variable), value)
+
+
+@unittest.skipIf(crypto.AESGCM is None, "requires the cryptography package")
+class EncryptedValueTests(SecretsTestMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "keys.json")
+        crypto.add_key(path)
+        settings = override_settings(SMS_SECRETS_KEY_FILE=path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+
+    def test_values_are_encrypted(self):
+        variable = EnvironmentVariable.objects.create(
+            service_system=self.system, name="PASSWORD", value="hunter2"
+        )
+        self.assertTrue(self.stored(variable).startswith(crypto.PREFIX))
+        self.assertEqual(self.api_value(variable), "hunter2")
+
+    def test_copied_tokens_are_encrypted_as_plaintext(self):
+        secret = EnvironmentVariable.objects.create(
+            service_system=self.system, name="PASSWORD", value="hunter2"
+        )
+        token = self.stored(secret)
+        copy = EnvironmentVariable.objects.create(
+            service_system=self.system, name="COPY", value=token
+        )
+        self.assertNotEqual(self.stored(copy), token)
+        self.assertEqual(self.api_value(copy), token)
+
+    def test_export_round_trip(self):
+        for variable in self.round_trip():
+            self.assertTrue(self.stored(variable).startswith(crypto.PREFIX))
+            self.assertNotEqual(self.stored(variable), self.api_value(variable))
+
+    def test_lookalikes_stored_in_plaintext(self):
+        with override_settings(SMS_SECRETS_KEY_FILE=None):
+            variables = self.create_lookalikes()
+        for variable, value in zip(variables, self.LOOKALIKES):
+            repr(EnvironmentVariable.objects.get(pk=variable.pk).value)
+            self.assertEqual(self.api_value(variable), value)
+        call_command("rotate_secret_keys", "--reencrypt", stdout=StringIO())
+        for variable, value in zip(variables, self.LOOKALIKES):
+            self.assertNotEqual(self.stored(variable), value)
+            self.assertEqual(self.api_value(variable), value)
+
+
+class ConflictingPortTests(TestCase):
+    def setUp(self):
+        self.system = make_service_system("web-1")
+        self.application = Application.objects.create(
+            service_system=self.system, name="app", version="1"
+        )
+        user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.client.force_login(user)
+
+    def add_port(self, port_number, protocol, service_system=None):
+        return Port.objects.create(
+            service_system=service_system or self.system,
+            application=self.application,
+            port_number=port_number,
+            protocol=protocol,
+        )
+
+    def filtered(self):
+        response = self.client.get("/admin/sms/port/", {"port": "conflicting"})
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_conflicts(self):
+        conflicting = [self.add_port(8080, "tcp"), self.add_port(8080, "TCP ")]
+        self.add_port(8080, "udp")
+        self.add_port(8443, "tcp")
+        self.add_port(8080, "tcp", make_service_system("web-2"))
+        self.assertEqual(
+            {port.pk for port in self.filtered().result_list},
+            {port.pk for port in conflicting},
+        )
+
+    def test_many_conflicting_keys(self):
+        count = 1500
+        Port.objects.bulk_create(
+            Port(
+                service_system=self.system,
+                application=self.application,
+                port_number=2000 + index // 2,
+                protocol="tcp",
+                protocol_key="tcp",
+            )
+            for index in range(count * 2)
+        )
+        self.assertEqual(self.filtered().result_count, count * 2)
+        self.assertEqual(ports.conflict_keys(Port.objects.all()).count(), count)
+
+    def unsaved_port(self, port_number, protocol, service_system=None):
+        return Port(
+            service_system=service_system or self.system,
+            application=self.application,
+            port_number=port_number,
+            protocol=protocol,
+        )
+
+    def test_validate_unique(self):
+        self.add_port(8080, "tcp")
+        with self.assertRaisesMessage(ValidationError, "already used by app"):
+            self.unsaved_port(8080, " TCP").full_clean()
+        self.unsaved_port(8080, "udp").full_clean()
+        self.unsaved_port(8080, "tcp", make_service_system("web-2")).full_clean()
+
+    def test_validate_batch(self):
+        self.add_port(8080, "tcp")
+        other = make_service_system("web-2")
+        batch = [
+            self.unsaved_port(8080, "TCP"),
+            self.unsaved_port(9090, "tcp"),
+            self.unsaved_port(9090, "tcp "),
+            self.unsaved_port(9090, "udp"),
+            self.unsaved_port(8080, "tcp", other),
+        ]
+        with self.assertNumQueries(1):
+            messages = Port.validate_batch(batch)
+        self.assertEqual(
+            messages,
+            [
+                "TCP/8080 is already used by app on this service system.",
+                None,
+                "tcp /9090 is already used by an earlier row on this service system.",
+                None,
+                None,
+            ],
+        )
+
+
+class OverlappingSubnetTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.client.force_login(user)
+
+    def add_subnet(self, subnet, name="web-1"):
+        service_system = ServiceSystem.objects.filter(name=name).first()
+        return NetworkConfiguration.objects.create(
+            service_system=service_system or make_service_system(name),
+            dns="dns",
+            gateway="",
+            subnet=subnet,
+        )
+
+    def test_overlaps(self):
+        overlapping = [
+            self.add_subnet("10.0.0.0/16"),
+            self.add_subnet("10.0.1.0/24"),
+            self.add_subnet("10.0.0.0/16", "web-2"),
+        ]
+        # The same subnet on two hosts is not an overlap.
+        self.add_subnet("192.168.0.0/24")
+        self.add_subnet("192.168.0.0/24", "web-2")
+        self.add_subnet("10.1.0.0/16")
+        self.add_subnet("not a subnet")
+
+        response = self.client.get(
+            "/admin/sms/networkconfiguration/", {"subnet": "overlapping"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {row.pk for row in response.context["cl"].result_list},
+            {row.pk for row in overlapping},
+        )
+        ranges = {
+            (start, end)
+            for pair in network.overlapping_subnets(NetworkConfiguration.objects.all())
+            for start, end, _ in pair
+        }
+        self.assertEqual(
+            {(row.subnet_start, row.subnet_end) for row in overlapping}, ranges
+        )
+
+
+class LazyInlineTests(TestCase):
+    def setUp(self):
+        self.system = make_service_system("web-1")
+        EnvironmentVariable.objects.bulk_create(
+            EnvironmentVariable(service_system=self.system, name="VAR_%d" % index)
+            for index in range(5)
+        )
+        EnvironmentVariable.objects.create(
+            service_system=make_service_system("web-2"), name="VAR_0"
+        )
+        self.user = get_user_model().objects.create_user("staff", is_staff=True)
+        self.client.force_login(self.user)
+
+    def grant(self, *codenames):
+        self.user.user_permissions.add(
+            *Permission.objects.filter(
+                content_type__app_label="sms", codename__in=codenames
+            )
+        )
+
+    def related(self, model_name, **params):
+        return self.client.get(
+            reverse(
+                "admin:sms_servicesystem_related", args=(self.system.pk, model_name)
+            ),
+            params,
+        )
+
+    def test_change_page_lists_viewable_sections(self):
+        self.grant("view_servicesystem", "view_environmentvariable")
+        response = self.client.get(
+            reverse("admin:sms_servicesystem_change", args=(self.system.pk,))
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["inline_admin_formsets"], [])
+        self.assertEqual(
+            [section["url"] for section in response.context["lazy_sections"]],
+            [
+                reverse(
+                    "admin:sms_servicesystem_related",
+                    args=(self.system.pk, "environmentvariable"),
+                )
+            ],
+        )
+
+    @mock.patch.object(ServiceSystemAdmin, "lazy_inline_per_page", 2)
+    def test_rows_are_paginated(self):
+        self.grant("view_servicesystem", "view_environmentvariable")
+        pages = [self.related("environmentvariable", page=page) for page in (1, 3)]
+        self.assertEqual(
+            [(page.json()["page"], page.json()["count"]) for page in pages],
+            [(1, 5), (3, 5)],
+        )
+        self.assertEqual(pages[0].json()["num_pages"], 3)
+        self.assertEqual(
+            [[row["values"][0] for row in page.json()["results"]] for page in pages],
+            [["VAR_0", "VAR_1"], ["VAR_4"]],
+        )
+
+    def test_permissions(self):
+        self.assertEqual(self.related("environmentvariable").status_code, 404)
+        self.grant("view_servicesystem")
+        self.assertEqual(self.related("environmentvariable").status_code, 403)
+        self.assertEqual(self.related("healthcheckrun").status_code, 404)
+        self.grant("view_environmentvariable")
+        self.assertEqual(self.related("environmentvariable").status_code, 200)
+
+
+class AdminQueryCountTests(TestCase):
+    """
+    Every registered admin's changelist and change page run as many queries
+    for many rows as for one.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "", "admin")
+        self.client.force_login(self.user)
+
+    def add_rows(self, systems, start, scale):
+        generate_fleet(systems, prefix="host", start=start, scale=scale)
+        run = HealthCheckRun.objects.create(started_at=timezone.now())
+        HealthCheckResult.objects.bulk_create(
+            HealthCheckResult(
+                run=run,
+                health_check=health_check,
+                url="http://host/health",
+                outcome=HealthCheckResult.PASSED,
+            )
+            for health_check in HealthCheck.objects.all()
+        )
+        get_user_model().objects.create_user("user-%d" % start)
+        Group.objects.create(name="group-%d" % start)
+
+    def urls(self):
+        for model in admin.site._registry:
+            opts = model._meta
+            instance = model._default_manager.order_by("pk").first()
+            yield reverse("admin:%s_%s_changelist" % (opts.app_label, opts.model_name))
+            yield reverse(
+                "admin:%s_%s_change" % (opts.app_label, opts.model_name),
+                args=(instance.pk,),
+            )
+
+    def count_queries(self, url):
+        # The first request fills per-process caches (content types, ...).
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        # One row of every model, then dozens.
+        self.add_rows(1, start=0, scale=0.01)
+        counts = {url: self.count_queries(url) for url in self.urls()}
+        self.add_rows(20, start=1, scale=1)
+        for url, count in counts.items():
+            with self.subTest(url=url), self.assertNumQueries(count):
+                self.client.get(url)
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "plans are SQLite's")
+class IndexUsageTests(TestCase):
+    """
+    The changelist, API and export access paths are planned over their
+    indexes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_fleet(20, prefix="host")
+        cls.user = get_user_model().objects.create_superuser("admin", "", "admin")
+        # Plans as a maintained database gets them, with statistics.
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, model, fields):
+        (index,) = [
+            index for index in model._meta.indexes if index.fields == list(fields)
+        ]
+        self.assertIn(" %s" % index.name, queryset.explain())
+
+    def test_changelist_sorted_by_column(self):
+        model_admin = admin.site._registry[ServiceSystem]
+        for name in ("created_at", "hostname", "ip_address"):
+            column = model_admin.list_display.index(name) + 1
+            request = RequestFactory().get("/", {"o": "-%d" % column})
+            request.user = self.user
+            changelist = model_admin.get_changelist_instance(request)
+            with self.subTest(name=name):
+                self.assertUsesIndex(changelist.queryset[:100], ServiceSystem, [name])
+
+    def test_api_pages(self):
+        ordering = InventoryCursorPagination.ordering
+        queryset = EnvironmentVariable.objects.order_by(*ordering)[:100]
+        self.assertUsesIndex(queryset, EnvironmentVariable, ["updated_at", "id"])
+        service_system = ServiceSystem.objects.first()
+        queryset = EnvironmentVariable.objects.filter(
+            service_system__in=[service_system.pk]
+        ).order_by(*ordering)[:100]
+        self.assertUsesIndex(
+            queryset, EnvironmentVariable, ["service_system", "updated_at"]
+        )
+
+    def test_lookups(self):
+        service_system = ServiceSystem.objects.first()
+        for name in ("hostname", "ip_address"):
+            with self.subTest(name=name):
+                self.assertUsesIndex(
+                    ServiceSystem.objects.filter(
+                        **{name: getattr(service_system, name)}
+                    ),
+                    ServiceSystem,
+                    [name],
+                )
+        port = Port.objects.first()
+        self.assertUsesIndex(
+            Port.objects.filter(
+                application=port.application_id,
+                port_number=port.port_number,
+                protocol=port.protocol,
+            ),
+            Port,
+            ["application", "port_number", "protocol"],
+        )
+
+    def test_export_resumes_from_watermark(self):
+        row = EnvironmentVariable.objects.order_by("updated_at", "pk")[10]
+        queryset = EnvironmentVariable.objects.order_by("updated_at", "pk").filter(
+            Watermark(row.updated_at, row.pk).filter()
+        )
+        self.assertUsesIndex(queryset, EnvironmentVariable, ["updated_at", "id"])
+
+
+class HealthCheckTests(SimpleTestCase):
+    def outcomes(self, criteria, status=200, latency_ms=10, body=b"ok"):
+        return [
+            test(status, latency_ms, body)
+            for _, test in healthchecks.parse_criteria(criteria)
+        ]
+
+    def test_parse_criteria(self):
+        self.assertEqual(self.outcomes(""), [True])
+        self.assertEqual(self.outcomes("", status=503), [False])
+        self.assertEqual(
+            self.outcomes("status 200; latency < 500ms and body contains 'ok'"),
+            [True, True, True],
+        )
+        self.assertEqual(
+            self.outcomes(
+                "Status in 200, 204\nresponse time <= 2s\nbody does not contain ok.",
+                status=204,
+                latency_ms=2000,
+            ),
+            [True, True, False],
+        )
+        self.assertEqual(self.outcomes("latency < 1s", latency_ms=1000), [False])
+        self.assertEqual(
+            self.outcomes(
+                'body contains "up and running; ok" and status 200',
+                body=b"up and running; ok",
+            ),
+            [True, True],
+        )
+        self.assertEqual(
+            [
+                description
+                for description, _ in healthchecks.parse_criteria(
+                    "body does not contain 'down and out'; latency < 1s"
+                )
+            ],
+            ["body does not contain 'down and out'", "latency < 1s"],
+        )
+        for criteria in ("status 600", "latency > 5ms", "returns quickly"):
+            with self.subTest(criteria=criteria), self.assertRaises(ValueError):
+                healthchecks.parse_criteria(criteria)
+
+    def test_status_matches(self):
+        self.assertTrue(healthchecks.status_matches(["200"], 200, 0, b""))
+        self.assertTrue(healthchecks.status_matches(["301", "2xx"], 204, 0, b""))
+        self.assertFalse(healthchecks.status_matches(["2xx"], 302, 0, b""))
+        self.assertFalse(healthchecks.status_matches(["200"], 201, 0, b""))
+
+    def test_interleave(self):
+        probes = [
+            ("a1", "http://a/1"),
+            ("a2", "http://a/2"),
+            ("a3", "http://a/3"),
+            ("b1", "http://b/1"),
+            ("c1", "https://c:8443/1"),
+            ("c2", "https://c/2"),
+        ]
+        self.assertEqual(
+            [check for check, _ in healthchecks.interleave(probes)],
+            ["a1", "b1", "c1", "a2", "c2", "a3"],
+        )
+
+    def test_host_rate_limiter(self):
+        async def waits(limiter, hosts):
+            with mock.patch.object(
+                healthchecks.time, "monotonic", return_value=100.0
+            ), mock.patch.object(healthchecks.asyncio, "sleep") as sleep:
+                for host in hosts:
+                    await limiter.wait(host)
+            return [call.args[0] for call in sleep.call_args_list]
+
+        limiter = healthchecks.HostRateLimiter(2)
+        self.assertEqual(asyncio.run(waits(limiter, ["a", "b", "a", "a"])), [0.5, 1.0])
+        limiter = healthchecks.HostRateLimiter(0)
+        self.assertEqual(asyncio.run(waits(limiter, ["a", "a"])), [])
+
+    def run_checks(self, probes):
+        results = []
+
+        async def on_result(result):
+            results.append(result)
+
+        asyncio.run(healthchecks.run_checks(probes, on_result, concurrency=2))
+        return results
+
+    def test_unreadable_criteria_are_errors(self):
+        check = HealthCheck(endpoint="/health", criteria="status teapot")
+        (result,) = self.run_checks([(check, "http://127.0.0.1:9/health")])
+        self.assertEqual(result.outcome, HealthCheckResult.ERROR)
+        self.assertIn("status teapot", result.message)
+
+    def serve(self, response, checks, keep_open=False):
+        """
+        Results of `checks` probed against a server answering `response`,
+        which keeps the connection open until the client closes it if
+        `keep_open`.
+        """
+
+        async def serve():
+            async def respond(reader, writer):
+                await reader.readuntil(b"\r\n\r\n")
+                writer.write(response)
+                await writer.drain()
+                if keep_open:
+                    await reader.read()
+                writer.close()
+
+            server = await asyncio.start_server(respond, "127.0.0.1", 0)
+            url = "http://127.0.0.1:%d/health" % server.sockets[0].getsockname()[1]
+            results = []
+
+            async def on_result(result):
+                results.append(result)
+
+            async with server:
+                await healthchecks.run_checks(
+                    [(check, url) for check in checks], on_result, timeout=2
+                )
+            return results
+
+        return asyncio.run(serve())
+
+    def test_probe(self):
+        failed, passed = sorted(
+            self.serve(
+                b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok",
+                [
+                    HealthCheck(criteria="status 200; body contains ok"),
+                    HealthCheck(criteria="status 5xx"),
+                ],
+            ),
+            key=lambda result: result.outcome,
+        )
+        self.assertEqual(
+            (failed.outcome, failed.status_code, failed.message),
+            (HealthCheckResult.FAILED, 200, "Failed: status 5xx"),
+        )
+        self.assertEqual(passed.outcome, HealthCheckResult.PASSED)
+
+    def test_body_ends_at_content_length(self):
+        (result,) = self.serve(
+            b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok",
+            [HealthCheck(criteria="body contains ok")],
+            keep_open=True,
+        )
+        self.assertEqual(result.outcome, HealthCheckResult.PASSED)
+        self.assertLess(result.latency_ms, 1000)
+
+    def test_chunked_body(self):
+        (result,) = self.serve(
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"3;ext=1\r\nup \r\nc\r\nand running\n\r\n0\r\n\r\n",
+            [HealthCheck(criteria='body contains "up and running"')],
+            keep_open=True,
+        )
+        self.assertEqual(result.outcome, HealthCheckResult.PASSED)
+        self.assertLess(result.latency_ms, 1000)
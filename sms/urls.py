@@ -0,0 +1,61 @@
+from django.urls import path
+from rest_framework import routers
+
+from . import async_views
+from .views import (
+    CHILD_VIEWSETS,
+    CapacityReportView,
+    DriftDetailView,
+    DriftReportView,
+    DuplicateAddressView,
+    ExportView,
+    OverlappingSubnetView,
+    ServiceSystemViewSet,
+    SnapshotCacheStatsView,
+    metrics,
+)
+
+router = routers.DefaultRouter()
+router.register("service-systems", ServiceSystemViewSet)
+for name, viewset in CHILD_VIEWSETS.items():
+    router.register(name.replace("_", "-"), viewset)
+
+urlpatterns = [
+    path("export/<str:model>.<str:output>", ExportView.as_view(), name="export"),
+    path("capacity/", CapacityReportView.as_view(), name="capacity-report"),
+    path(
+        "network/duplicate-ips/",
+        DuplicateAddressView.as_view(),
+        name="network-duplicate-ips",
+    ),
+    path(
+        "network/overlapping-subnets/",
+        OverlappingSubnetView.as_view(),
+        name="network-overlapping-subnets",
+    ),
+    path("drift/", DriftReportView.as_view(), name="drift-report"),
+    path(
+        "drift/<str:model>/<path:name>/",
+        DriftDetailView.as_view(),
+        name="drift-detail",
+    ),
+    path("metrics/", metrics, name="metrics"),
+    path("cache-stats/", SnapshotCacheStatsView.as_view(), name="snapshot-cache-stats"),
+    path(
+        "async/service-systems/",
+        async_views.service_system_list,
+        name="async-service-system-list",
+    ),
+    path(
+        "async/service-systems/<int:pk>/snapshot/",
+        async_views.service_system_snapshot,
+        name="async-service-system-snapshot",
+    ),
+    path(
+        "async/search/",
+        async_views.service_system_search,
+        name="async-service-system-search",
+    ),
+    path("changes/", async_views.change_feed, name="change-feed"),
+    path("changes/stream/", async_views.change_stream, name="change-stream"),
+] + router.urls
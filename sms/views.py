@@ -0,0 +1,717 @@
+import hmac
+import itertools
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Prefetch, Q, Sum
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import bulk, cache, crypto, drift, history, network, ports
+from .conditional import not_modified, set_validators, table_state, validators
+from .exporter import CONTENT_TYPES, Watermark, export_stream
+from .models import (
+    Application,
+    BackupConfiguration,
+    ConfigurationFile,
+    Containerization,
+    Dependency,
+    DeploymentTool,
+    DisasterRecovery,
+    EnvironmentVariable,
+    HealthCheck,
+    LoggingConfiguration,
+    MonitoringTool,
+    NetworkConfiguration,
+    Port,
+    Runbook,
+    ScalingConfiguration,
+    ServiceSystem,
+    UserPermission,
+    VersionSummary,
+    VersionedModel,
+)
+from .performance import METRICS
+from .renderers import snapshot_renderers
+from .search import search
+from .serializers import (
+    CHILD_SERIALIZERS,
+    INVENTORY_MODELS,
+    ApplicationSerializer,
+    BackupConfigurationSerializer,
+    ConfigurationFileSerializer,
+    ContainerizationSerializer,
+    DependencySerializer,
+    DeploymentToolSerializer,
+    DisasterRecoverySerializer,
+    EnvironmentVariableSerializer,
+    HealthCheckSerializer,
+    LoggingConfigurationSerializer,
+    MonitoringToolSerializer,
+    NetworkConfigurationSerializer,
+    PortSerializer,
+    RunbookSerializer,
+    ScalingConfigurationSerializer,
+    ServiceSystemSerializer,
+    UserPermissionSerializer,
+    related_accessor,
+    split_param,
+)
+from .snapshot import snapshot_queryset
+
+CAPACITY_COLUMNS = ("cpu_cores", "ram_bytes", "disk_bytes")
+# API name -> model of the rows whose version drift is tracked.
+VERSIONED_MODELS = {
+    name: model
+    for name, model in INVENTORY_MODELS.items()
+    if issubclass(model, VersionedModel)
+}
+
+
+def filter_capacity(queryset, params):
+    """
+    Apply `?min_cpu_cores=`, `?max_ram_bytes=`, ... to a ServiceSystem
+    queryset.
+    """
+    for column in CAPACITY_COLUMNS:
+        for bound, lookup in (("min", "gte"), ("max", "lte")):
+            param = "%s_%s" % (bound, column)
+            value = params.get(param)
+            if value in (None, ""):
+                continue
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValidationError({param: "Expected an integer."})
+            queryset = queryset.filter(**{"%s__%s" % (column, lookup): value})
+    return queryset
+
+
+class InventoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only inventory endpoint. List and detail responses carry an ETag and
+    Last-Modified derived from aggregates (see `sms.conditional`) and answer
+    `If-None-Match`/`If-Modified-Since` with 304 before loading any rows.
+    """
+
+    def get_sparse_fields(self):
+        """
+        Concrete columns needed for `?fields=`, or None to load every column.
+        """
+        requested = split_param(self.request.query_params.get("fields"))
+        if not requested:
+            return None
+        opts = self.get_serializer_class().Meta.model._meta
+        columns = {"id", "updated_at"}
+        for name in requested:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete:
+                columns.add(name)
+        return columns
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        columns = self.get_sparse_fields()
+        if columns is not None:
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def get_table_states(self, queryset):
+        """
+        State of every table a response over `queryset` is built from.
+        """
+        return [table_state(queryset)]
+
+    def conditional(self, request, states, respond, *args, **kwargs):
+        etag, last_modified = validators(
+            "%s|%s" % (request.get_full_path(), request.accepted_renderer.format),
+            states,
+        )
+        response = not_modified(request._request, etag, last_modified)
+        if response is None:
+            response = respond(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return set_validators(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        states = self.get_table_states(self.filter_queryset(self.get_queryset()))
+        return self.conditional(request, states, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            states = self.get_table_states(
+                queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            )
+        except (TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        # The first state is the object's own table: no row, no object.
+        if not states[0][1]:
+            raise Http404
+        return self.conditional(request, states, super().retrieve, *args, **kwargs)
+
+    @action(detail=True)
+    def history(self, request, pk=None):
+        """
+        Every recorded revision of the row, oldest first: what each write
+        changed and the complete values after it.
+        """
+        instance = self.get_object()
+        revisions = history.row_history(instance)
+        values = crypto.reveal_rows(
+            type(instance), [revision["values"] for revision in revisions]
+        )
+        for revision, revealed in zip(revisions, values):
+            revision["values"] = revealed
+        return Response(revisions)
+
+
+class ServiceSystemViewSet(InventoryViewSet):
+    queryset = ServiceSystem.objects.all()
+    serializer_class = ServiceSystemSerializer
+
+    def get_expand(self):
+        expand = split_param(self.request.query_params.get("expand"))
+        unknown = set(expand) - set(CHILD_SERIALIZERS)
+        if unknown:
+            raise ValidationError(
+                {"expand": "Unknown relation(s): %s." % ", ".join(sorted(unknown))}
+            )
+        return expand
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        query = self.request.query_params.get("search")
+        if query:
+            queryset = search(queryset, query)
+        queryset = filter_capacity(queryset, self.request.query_params)
+        ip_in = self.request.query_params.get("ip_in")
+        if ip_in:
+            try:
+                queryset = network.hosts_in(queryset, ip_in)
+            except ValueError:
+                raise ValidationError({"ip_in": "Expected an IP address or CIDR."})
+        for name in self.get_expand():
+            serializer_class = CHILD_SERIALIZERS[name]
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    related_accessor(serializer_class),
+                    queryset=serializer_class.Meta.model.objects.order_by("pk"),
+                )
+            )
+        return queryset
+
+    def get_table_states(self, queryset):
+        states = super().get_table_states(queryset)
+        service_systems = queryset.values("pk")
+        for name in self.get_expand():
+            model = CHILD_SERIALIZERS[name].Meta.model
+            states.append(
+                table_state(model.objects.filter(service_system__in=service_systems))
+            )
+        return states
+
+    def get_embedded_models(self):
+        if self.action in ("snapshot", "as_of"):
+            return INVENTORY_MODELS.values()
+        return [CHILD_SERIALIZERS[name].Meta.model for name in self.get_expand()]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("expand", self.get_expand())
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=True, renderer_classes=snapshot_renderers())
+    def snapshot(self, request, pk=None):
+        """
+        The complete configuration of one service system as a single document.
+        """
+        # Keyed on the integer, so "05" and "5" share one entry.
+        if not pk.isdigit():
+            raise Http404
+        self.queryset = snapshot_queryset()
+        entry = cache.cached_snapshot(int(pk), self.get_object)
+        etag = '"%s.%s"' % (entry.version, request.accepted_renderer.format)
+        last_modified = int(entry.last_modified.timestamp())
+        response = not_modified(request._request, etag, last_modified)
+        if response is None:
+            response = Response(crypto.reveal_snapshot(entry.data))
+        return set_validators(response, etag, last_modified)
+
+    @action(detail=True, url_path="as-of")
+    def as_of(self, request, pk=None):
+        """
+        The configuration of the system at `?at=<ISO 8601 time>`, rebuilt
+        from its history, even if it has been deleted since.
+        """
+        try:
+            when = parse_datetime(request.query_params.get("at") or "")
+        except ValueError:
+            when = None
+        if when is None:
+            raise ValidationError({"at": "Expected an ISO 8601 date and time."})
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        if not pk.isdigit():
+            raise Http404
+        try:
+            data = history.snapshot_as_of(int(pk), when)
+        except history.HistoryUnavailable as e:
+            raise NotFound(str(e))
+        if data is None:
+            raise NotFound("The service system did not exist at %s." % when)
+        return Response(crypto.reveal_snapshot(data))
+
+    def get_selection(self, data):
+        """
+        The service systems a bulk request targets: `service_systems` (a list
+        of ids) or those matching `search`.
+        """
+        ids = data.get("service_systems")
+        query = data.get("search")
+        if isinstance(ids, list) and all(isinstance(pk, int) for pk in ids):
+            return ServiceSystem.objects.filter(pk__in=ids)
+        if isinstance(query, str) and query.strip():
+            return search(ServiceSystem.objects.all(), query)
+        raise ValidationError(
+            {"service_systems": "Give a list of service system ids or a search."}
+        )
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk-apply",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_apply(self, request):
+        """
+        Apply the change set in `changes` (see `sms.bulk`) to many service
+        systems in one transaction.
+        """
+        changes = request.data.get("changes")
+        if isinstance(changes, dict):
+            require_permissions(request, bulk.change_set_permissions(changes))
+        service_systems = self.get_selection(request.data)
+        try:
+            result = bulk.apply_change_set(service_systems, changes)
+        except DjangoValidationError as e:
+            raise validation_error(e)
+        return Response({"service_systems": service_systems.count(), "results": result})
+
+    @action(detail=True, methods=["post"], permission_classes=[IsAdminUser])
+    def clone(self, request, pk=None):
+        """
+        Copy this service system and all its related rows onto new systems,
+        one per object in `systems` (a new `name` plus any other overrides).
+        """
+        require_permissions(request, bulk.clone_permissions())
+        systems = request.data.get("systems")
+        if not isinstance(systems, list) or not systems:
+            raise ValidationError({"systems": "Expected a list of objects."})
+        try:
+            clones = bulk.clone_service_system(self.get_object(), systems)
+        except DjangoValidationError as e:
+            raise validation_error(e)
+        return Response(
+            {"ids": [clone.pk for clone in clones]}, status=status.HTTP_201_CREATED
+        )
+
+
+def require_permissions(request, permissions):
+    if not request.user.has_perms(permissions):
+        raise PermissionDenied
+
+
+def validation_error(error):
+    if hasattr(error, "error_dict"):
+        return ValidationError(error.message_dict)
+    return ValidationError(error.messages)
+
+
+class ChildViewSet(InventoryViewSet):
+    """
+    Read-only endpoint for a BaseModel subclass, filterable by
+    `?service_system=<id>[,<id>...]`.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        service_systems = split_param(self.request.query_params.get("service_system"))
+        if service_systems:
+            try:
+                ids = [int(pk) for pk in service_systems]
+            except ValueError:
+                raise ValidationError({"service_system": "Expected integer ids."})
+            queryset = queryset.filter(service_system__in=ids)
+        return queryset
+
+
+class EnvironmentVariableViewSet(ChildViewSet):
+    queryset = EnvironmentVariable.objects.all()
+    serializer_class = EnvironmentVariableSerializer
+
+
+class ConfigurationFileViewSet(ChildViewSet):
+    queryset = ConfigurationFile.objects.all()
+    serializer_class = ConfigurationFileSerializer
+
+
+class DependencyViewSet(ChildViewSet):
+    queryset = Dependency.objects.all()
+    serializer_class = DependencySerializer
+
+
+class NetworkConfigurationViewSet(ChildViewSet):
+    """
+    Network configurations; `?overlaps=<cidr or address>` keeps the subnets
+    sharing addresses with it.
+    """
+
+    queryset = NetworkConfiguration.objects.all()
+    serializer_class = NetworkConfigurationSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        overlaps = self.request.query_params.get("overlaps")
+        if overlaps:
+            try:
+                queryset = network.subnets_overlapping(queryset, overlaps)
+            except ValueError:
+                raise ValidationError({"overlaps": "Expected an IP address or CIDR."})
+        return queryset
+
+
+class ApplicationViewSet(ChildViewSet):
+    queryset = Application.objects.all()
+    serializer_class = ApplicationSerializer
+
+
+class PortViewSet(ChildViewSet):
+    queryset = Port.objects.all()
+    serializer_class = PortSerializer
+
+    @action(detail=False)
+    def conflicts(self, request):
+        """
+        Ports of one service system claiming the same number and protocol,
+        grouped by key.
+        """
+        conflicts = ports.conflict_report(self.get_queryset())
+        return Response({"count": len(conflicts), "results": conflicts})
+
+
+class LoggingConfigurationViewSet(ChildViewSet):
+    queryset = LoggingConfiguration.objects.all()
+    serializer_class = LoggingConfigurationSerializer
+
+
+class MonitoringToolViewSet(ChildViewSet):
+    queryset = MonitoringTool.objects.all()
+    serializer_class = MonitoringToolSerializer
+
+
+class HealthCheckViewSet(ChildViewSet):
+    queryset = HealthCheck.objects.all()
+    serializer_class = HealthCheckSerializer
+
+
+class ContainerizationViewSet(ChildViewSet):
+    queryset = Containerization.objects.all()
+    serializer_class = ContainerizationSerializer
+
+
+class DeploymentToolViewSet(ChildViewSet):
+    queryset = DeploymentTool.objects.all()
+    serializer_class = DeploymentToolSerializer
+
+
+class ScalingConfigurationViewSet(ChildViewSet):
+    queryset = ScalingConfiguration.objects.all()
+    serializer_class = ScalingConfigurationSerializer
+
+
+class BackupConfigurationViewSet(ChildViewSet):
+    queryset = BackupConfiguration.objects.all()
+    serializer_class = BackupConfigurationSerializer
+
+
+class UserPermissionViewSet(ChildViewSet):
+    queryset = UserPermission.objects.all()
+    serializer_class = UserPermissionSerializer
+
+
+class DisasterRecoveryViewSet(ChildViewSet):
+    queryset = DisasterRecovery.objects.all()
+    serializer_class = DisasterRecoverySerializer
+
+
+class RunbookViewSet(ChildViewSet):
+    queryset = Runbook.objects.all()
+    serializer_class = RunbookSerializer
+
+
+CHILD_VIEWSETS = {
+    "environment_variables": EnvironmentVariableViewSet,
+    "configuration_files": ConfigurationFileViewSet,
+    "dependencies": DependencyViewSet,
+    "network_configurations": NetworkConfigurationViewSet,
+    "applications": ApplicationViewSet,
+    "ports": PortViewSet,
+    "logging_configurations": LoggingConfigurationViewSet,
+    "monitoring_tools": MonitoringToolViewSet,
+    "health_checks": HealthCheckViewSet,
+    "containerizations": ContainerizationViewSet,
+    "deployment_tools": DeploymentToolViewSet,
+    "scaling_configurations": ScalingConfigurationViewSet,
+    "backup_configurations": BackupConfigurationViewSet,
+    "user_permissions": UserPermissionViewSet,
+    "disaster_recoveries": DisasterRecoveryViewSet,
+    "runbooks": RunbookViewSet,
+}
+
+
+class SnapshotCacheStatsView(APIView):
+    """
+    Hit and miss counters of the snapshot cache.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache.stats())
+
+    def delete(self, request):
+        cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CapacityReportView(APIView):
+    """
+    Fleet capacity totals per `?group_by=location` (or `operating_system`),
+    aggregated by the database. Takes the `?min_cpu_cores=`, ... filters of
+    the service system list.
+
+    `unparsed` counts hosts whose allocation text could not be read as a
+    number; they are left out of the sums.
+    """
+
+    queryset = ServiceSystem.objects.all()
+    GROUPS = ("location", "operating_system")
+    TOTALS = {
+        "hosts": Count("pk"),
+        "total_cpu_cores": Sum("cpu_cores"),
+        "total_ram_bytes": Sum("ram_bytes"),
+        "total_disk_bytes": Sum("disk_bytes"),
+        "unparsed": Count(
+            "pk",
+            filter=Q(cpu_cores__isnull=True)
+            | Q(ram_bytes__isnull=True)
+            | Q(disk_bytes__isnull=True),
+        ),
+    }
+
+    def get(self, request):
+        group_by = request.query_params.get("group_by", "location")
+        if group_by not in self.GROUPS:
+            raise ValidationError(
+                {"group_by": "Expected one of %s." % ", ".join(self.GROUPS)}
+            )
+        queryset = filter_capacity(ServiceSystem.objects.all(), request.query_params)
+        etag, last_modified = validators(
+            "%s|%s" % (request.get_full_path(), request.accepted_renderer.format),
+            [table_state(queryset)],
+        )
+        response = not_modified(request._request, etag, last_modified)
+        if response is None:
+            groups = (
+                queryset.values(group_by).annotate(**self.TOTALS).order_by(group_by)
+            )
+            response = Response(
+                {
+                    "group_by": group_by,
+                    "totals": queryset.aggregate(**self.TOTALS),
+                    "results": list(groups),
+                }
+            )
+        return set_validators(response, etag, last_modified)
+
+
+class DuplicateAddressView(APIView):
+    """
+    IP addresses assigned to more than one service system.
+    """
+
+    queryset = ServiceSystem.objects.all()
+
+    def get(self, request):
+        duplicates = network.duplicate_addresses(ServiceSystem.objects.all())
+        return Response(
+            {
+                "count": len(duplicates),
+                "results": [
+                    {
+                        "ip_address": str(network.from_key(key)),
+                        "service_systems": [
+                            {"id": pk, "name": name} for pk, name in systems
+                        ],
+                    }
+                    for key, systems in duplicates.items()
+                ],
+            }
+        )
+
+
+class OverlappingSubnetView(APIView):
+    """
+    Pairs of distinct subnets that share addresses, with the number of
+    network configurations using each, up to `?limit=` pairs.
+    """
+
+    queryset = NetworkConfiguration.objects.all()
+    default_limit = 1000
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            raise ValidationError({"limit": "Expected an integer."})
+        pairs = network.overlapping_subnets(NetworkConfiguration.objects.all())
+        results = [
+            [
+                {"subnet": network.cidr(start, end), "configurations": count}
+                for start, end, count in pair
+            ]
+            for pair in itertools.islice(pairs, limit + 1)
+        ]
+        return Response({"truncated": len(results) > limit, "results": results[:limit]})
+
+
+def drift_entries(summaries):
+    names = {model._meta.model_name: name for name, model in VERSIONED_MODELS.items()}
+    entries = drift.report(summaries)
+    for entry in entries:
+        entry["model"] = names[entry["model"]]
+    return entries
+
+
+class DriftReportView(APIView):
+    """
+    Version distribution of every dependency, application and tool name
+    across the fleet, with the newest version and how many hosts are behind
+    it. Read from the VersionSummary table; filter with `?model=`
+    (`dependencies`, ...), `?name=` and `?stale=1` (names with hosts behind).
+    """
+
+    queryset = VersionSummary.objects.all()
+
+    def get(self, request):
+        summaries = VersionSummary.objects.order_by("model", "name")
+        model = request.query_params.get("model")
+        if model:
+            if model not in VERSIONED_MODELS:
+                raise ValidationError(
+                    {"model": "Expected one of %s." % ", ".join(VERSIONED_MODELS)}
+                )
+            summaries = summaries.filter(model=VERSIONED_MODELS[model]._meta.model_name)
+        name = request.query_params.get("name")
+        if name:
+            summaries = summaries.filter(name=name)
+        entries = drift_entries(summaries)
+        if request.query_params.get("stale") in ("1", "true"):
+            entries = [entry for entry in entries if entry["behind"]]
+        return Response({"count": len(entries), "results": entries})
+
+
+class DriftDetailView(APIView):
+    """
+    Version distribution of one name, and the service systems running
+    anything older than its newest version.
+    """
+
+    queryset = VersionSummary.objects.all()
+
+    def get(self, request, model, name):
+        if model not in VERSIONED_MODELS:
+            raise Http404
+        model = VERSIONED_MODELS[model]
+        summaries = list(
+            VersionSummary.objects.filter(model=model._meta.model_name, name=name)
+        )
+        if not summaries:
+            raise Http404
+        entry = drift_entries(summaries)[0]
+        entry["hosts_behind"] = [
+            {"id": pk, "name": service_system, "version": version}
+            for pk, service_system, version in drift.hosts_behind(
+                model.objects.filter(name=name), summaries
+            )
+        ]
+        return Response(entry)
+
+
+class ExportView(APIView):
+    """
+    Stream one inventory table as NDJSON or CSV in `(updated_at, id)` order.
+
+    `?since=<iso time>,<id>` resumes after a watermark (the `updated_at` and
+    `id` of the last row previously received); `?gzip=1` compresses the body.
+    """
+
+    def get_queryset(self):
+        # The exported model, whose view permission the export needs.
+        if self.kwargs["model"] not in INVENTORY_MODELS:
+            raise Http404
+        return INVENTORY_MODELS[self.kwargs["model"]].objects.all()
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is streamed rather than rendered, so accept any Accept.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, model, output):
+        if output not in CONTENT_TYPES:
+            raise Http404
+        since = request.query_params.get("since")
+        if since:
+            try:
+                since = Watermark.parse(since)
+            except ValueError as e:
+                raise ValidationError({"since": str(e)})
+        compress = request.query_params.get("gzip") in ("1", "true")
+        response = StreamingHttpResponse(
+            export_stream(model, output, since=since, compress=compress),
+            content_type=CONTENT_TYPES[output],
+        )
+        filename = "%s.%s%s" % (model, output, ".gz" if compress else "")
+        if compress:
+            response["Content-Type"] = "application/gzip"
+        response["Content-Disposition"] = 'attachment; filename="%s"' % filename
+        return response
+
+
+def metrics(request):
+    """
+    Request metrics of this process in the Prometheus text format, for staff
+    users or a scraper sending `Authorization: Bearer <SMS_METRICS_TOKEN>`.
+    """
+    token = getattr(settings, "SMS_METRICS_TOKEN", None)
+    authorization = request.headers.get("Authorization", "")
+    if not (
+        request.user.is_staff
+        or (token and hmac.compare_digest(authorization, "Bearer %s" % token))
+    ):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )